@@ -9,6 +9,7 @@ import os
 import platform
 import random
 import sys
+import time
 import logging as log
 
 import disnake
@@ -17,7 +18,12 @@ from disnake.ext import tasks, commands
 from disnake.ext.commands import Bot
 from disnake.ext.commands import Context
 
-from helpers.db_manager import init_db, MemberModel, ARCdleModel
+from helpers.codes import codes
+from helpers.db_manager import init_db, MemberModel, ARCdleModel, RoleMenuModel, \
+    VerifCodeModel, BountyModel
+from helpers.leaderboard import leaderboard
+from helpers.scheduler import Scheduler
+from helpers.sessions import sessions
 
 import exceptions
 
@@ -31,8 +37,13 @@ else:
     with open("config.json") as file:
         config = json.load(file)
 
-# Setup database
+# Setup database and in-memory indexes
 init_db()
+leaderboard.load(MemberModel.get_all_balances())
+RoleMenuModel.load_index()
+BountyModel.load_index()
+sessions.load(ARCdleModel.get_active_sessions(), MemberModel.get_unverified())
+codes.load(VerifCodeModel.get_live(time.time()))
 
 # Setup logging
 logger = log.getLogger()
@@ -60,6 +71,9 @@ intents.members = True
 intents.reactions = True
 bot = Bot(command_prefix=config["bot_prefix"], intents=intents)
 
+# Cogs register their periodic and one-shot jobs here
+bot.scheduler = Scheduler()
+
 # Removes the default help command
 bot.remove_command("help")
 
@@ -88,6 +102,8 @@ async def on_ready():
     log.info(f"Discord.py API version: {disnake.__version__}")
     log.info(f"Python version: {platform.python_version()}")
     log.info(f"Running on: {platform.system()} {platform.release()} ({os.name})")
+    if not bot.scheduler.is_running():
+        bot.scheduler.start()
     await status_task()
 
 # Setup the game status task of the bot
@@ -101,20 +117,22 @@ async def on_message(msg: disnake.Message):
     if msg.author == bot.user or msg.author.bot:
         return
 
-    if msg.guild == None:
+    # Commands sent by DM, e.g. asking for an ARCdle hint mid-game, aren't guesses
+    if msg.guild == None and not msg.content.startswith(config["bot_prefix"]):
         # Check if user is in arcdle game
-
-        arcdle = ARCdleModel.get_member_active_game(msg.author.id)
-        if arcdle is not None:
+        arcdle_rowid = sessions.get_game(msg.author.id)
+        if arcdle_rowid is not None:
             game = bot.get_cog("game")
-            if game is not None:
+            arcdle = await ARCdleModel.aio.get(arcdle_rowid)
+            if game is not None and arcdle is not None:
                 await game.handle_message(msg, arcdle)
                 return
 
-        # If not, assume user is verifying
+        # If not, check if user is verifying
         verification = bot.get_cog("verification")
         if verification is not None:
-            await verification.handle_message(msg)
+            if sessions.is_verifying(msg.author.id):
+                await verification.handle_message(msg)
             return
 
     await bot.process_commands(msg)
@@ -125,9 +143,10 @@ async def on_command_completion(ctx: commands.Context):
     fullCommandName = ctx.command.qualified_name
     split = fullCommandName.split(" ")
     executedCommand = str(split[0])
+    where = "DMs" if ctx.guild is None else f"{ctx.guild.name} (ID: {ctx.guild.id})"
     log.info(
-        (f"Executed {executedCommand} command in {ctx.guild.name} ",
-         f"(ID: {ctx.message.guild.id}) by {ctx.message.author} ",
+        (f"Executed {executedCommand} command in {where} ",
+         f"by {ctx.message.author} ",
          f"(ID: {ctx.message.author.id})"))
 
 
@@ -8,13 +8,27 @@ Enables server bounties.
 import disnake
 from disnake.ext import commands
 
+from helpers.cache import LRUCache, MISSING
 from helpers.db_manager import CurrencyModel, BountyModel
-from exceptions import InternalSQLError
+from helpers.paginator import send_pages
+
+BOUNTY_TEMPLATE = "**[{}]({})**: {} coins from <@{}>".format
 
 class Bounty(commands.Cog, name="bounty"):
     def __init__(self, bot):
         self.bot = bot
-        self.claims = {}
+        # bounty id -> its message, so it can be edited without a REST fetch
+        self.messages = LRUCache("bounty_messages", maxsize=256)
+
+    def bounty_message(self, bounty: BountyModel):
+        message = self.messages.get(bounty.id)
+        if message is MISSING:
+            channel = self.bot.get_channel(bounty.channel_id)
+            if channel is None or bounty.message_id is None:
+                return None
+            message = channel.get_partial_message(bounty.message_id)
+            self.messages.set(bounty.id, message)
+        return message
 
     @commands.command(name="bounty", usage="bounty <title> <PR url> <amount>")
     async def bounty(self, ctx: commands.Context, title: str, url: str, amt: float):
@@ -22,28 +36,78 @@ class Bounty(commands.Cog, name="bounty"):
         Open bounty for someone to review a PR or resolve an issue.
         """
 
-        sender = ctx.author.id
-        sender_balance = CurrencyModel.get_balance_or_create(sender)
-        if sender_balance is None:
-            raise InternalSQLError()
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage(message="Command must be used in a server")
 
-        if sender_balance < amt:
-            await ctx.reply(f"Insufficient balance, you have {sender_balance} ARC coins.")
+        if amt <= 0.0:
+            await ctx.reply("Bounty must be worth something")
             return
 
-        bounty = BountyModel.get(title)
-        if bounty:
-            await ctx.reply("A bounty with that title already exists.")
+        sender = ctx.author.id
+        bounty = await BountyModel.aio.create(title, sender, ctx.guild.id, ctx.channel.id, amt)
+        if bounty is BountyModel.TAKEN:
+            await ctx.reply("A bounty with that title already exists in this server.")
+            return
+        if bounty is None:
+            sender_balance = await CurrencyModel.aio.get_balance_or_create(sender)
+            await ctx.reply(f"Insufficient balance, you have {sender_balance} ARC coins.")
             return
 
         embed = disnake.Embed(title=f"Bounty: {title}",
             description=f"Reward amount: {amt} \n " \
                 f"Click URL above and use `.claim {title}`",
             url=url, color=0x00ff00)
-        bounty_msg = await ctx.channel.send(embed=embed)
+        try:
+            bounty_msg = await ctx.channel.send(embed=embed)
+        except disnake.HTTPException:
+            await bounty.aio.cancel()
+            raise
+
+        await bounty.aio.set_message(bounty_msg.id)
+        self.messages.set(bounty.id, bounty_msg)
+
+    @commands.command(name="bounties", usage="bounties")
+    async def bounties(self, ctx: commands.Context):
+        """
+        Lists the server's open bounties.
+        """
+
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage(message="Command must be used in a server")
+
+        bounties = await BountyModel.aio.get_by_guild(ctx.guild.id)
+        await send_pages(ctx, "Open bounties",
+            (BOUNTY_TEMPLATE(x.title, x.jump_url, x.amt, x.owner_id) for x in bounties),
+            "No open bounties", author_id=ctx.author.id, max_lines=10)
+
+    @commands.command(name="contribute", usage="contribute <title> <amount>")
+    async def contribute(self, ctx: commands.Context, title: str, amt: float):
+        """
+        Add coins to an open bounty's reward.
+        """
+
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage(message="Command must be used in a server")
+
+        if amt <= 0.0:
+            await ctx.reply("Contribution must be worth something")
+            return
 
-        BountyModel.create(title, sender, ctx.guild.id, ctx.channel.id, bounty_msg.id, amt)
-        CurrencyModel.update_balance(sender, sender_balance - amt)
+        bounty = await BountyModel.aio.resolve(ctx.guild.id, title)
+        if bounty is None:
+            await ctx.reply("No bounty with that title exists, " \
+                "try `.search bounty <title>`.")
+            return
+
+        added = await bounty.aio.contribute(ctx.author.id, amt)
+        if added is None:
+            await ctx.reply("That bounty has already been claimed.")
+        elif not added:
+            balance = await CurrencyModel.aio.get_balance_or_create(ctx.author.id)
+            await ctx.reply(f"Insufficient balance, you have {balance} ARC coins.")
+        else:
+            await ctx.reply(f"Added {amt} coins to '{bounty.title}', " \
+                f"the reward is now {bounty.amt} coins.")
 
     @commands.command(name="claim", usage="claim <title>")
     async def claim(self, ctx: commands.Context, title: str):
@@ -51,37 +115,50 @@ class Bounty(commands.Cog, name="bounty"):
         Claim a bounty.
         """
 
-        bounty = BountyModel.get(title)
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage(message="Command must be used in a server")
+
+        bounty = await BountyModel.aio.resolve(ctx.guild.id, title)
         if bounty is None:
-            await ctx.reply("No bounty with that title exists.")
+            await ctx.reply("No bounty with that title exists, " \
+                "try `.search bounty <title>`.")
             return
 
         claim_msg = await ctx.channel.send(
             f"{ctx.author.mention} claimed {bounty.title}, <@{bounty.owner_id}> react to accept."
         )
-        self.claims[claim_msg.id] = (ctx.author.id, bounty.title)
+        await bounty.aio.add_claim(ctx.author.id, claim_msg.id)
 
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: disnake.RawReactionActionEvent):
         if payload.member is None or payload.member.bot:
             return
 
-        if payload.message_id in self.claims:
-            receiver_id, title = self.claims[payload.message_id]
-            bounty = BountyModel.get(title)
-            if payload.user_id == bounty.owner_id:
-                balance = CurrencyModel.get_balance_or_create(receiver_id)
-                CurrencyModel.update_balance(receiver_id, balance + bounty.amt)
-
-                channel = self.bot.get_channel(bounty.channel_id)
-                bounty_msg = await channel.fetch_message(bounty.message_id)
-                embed = disnake.Embed(title=f"Bounty: {bounty.title}",
-                    description=f"Bounty claimed by <@{receiver_id}>")
+        if not BountyModel.is_claim(payload.message_id):
+            return
+
+        claim = await BountyModel.aio.get_claim(payload.message_id)
+        if claim is None:
+            return
+        bounty, receiver_id = claim
+        if payload.user_id != bounty.owner_id:
+            return
+
+        if not await bounty.aio.pay_out(receiver_id):
+            return
+
+        bounty_msg = self.bounty_message(bounty)
+        self.messages.invalidate(bounty.id)
+        if bounty_msg is not None:
+            embed = disnake.Embed(title=f"Bounty: {bounty.title}",
+                description=f"Bounty claimed by <@{receiver_id}>")
+            try:
                 await bounty_msg.edit(embed=embed)
+            except disnake.NotFound:
+                pass
 
-                bounty.complete()
-                del self.claims[payload.message_id]
-                await channel.send(f"Bounty '{bounty.title}' claimed by <@{receiver_id}>.")
+        channel = self.bot.get_channel(bounty.channel_id)
+        await channel.send(f"Bounty '{bounty.title}' claimed by <@{receiver_id}>.")
 
 def setup(bot):
     bot.add_cog(Bounty(bot))
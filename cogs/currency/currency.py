@@ -5,19 +5,43 @@ Description:
 Enables on-server currency.
 """
 
+import json
+import os
+import sys
 import typing
 import disnake
 from disnake.ext import commands
 
-from helpers.db_manager import MemberModel, CurrencyModel
-from exceptions import InternalSQLError
+from helpers.db_manager import CurrencyModel, LedgerModel
+from helpers.leaderboard import leaderboard
+from helpers.paginator import send_pages
+from helpers.scheduler import Interval
+
+if not os.path.isfile("config.json"):
+    sys.exit("'config.json' not found! Please add it and try again.")
+else:
+    with open("config.json") as file:
+        config = json.load(file)
 
 THANKS_AMT = 5.0
 TXN_FEE = 0.5
+# Ranked members shown by .leaderboard, and how many per page
+LEADERBOARD_SIZE = 150
+LEADERBOARD_PAGE = 15
+# Seconds between ledger snapshots
+SNAPSHOT_INTERVAL = 6 * 3600
+
+LEADERBOARD_ONE = "{}: {} with 1 coin".format
+LEADERBOARD_MANY = "{}: {} with {} coins".format
 
 class Currency(commands.Cog, name="currency"):
     def __init__(self, bot):
         self.bot = bot
+        bot.scheduler.add_cron("ledger_snapshot", Interval(SNAPSHOT_INTERVAL),
+            self.snapshot_ledger)
+
+    async def snapshot_ledger(self):
+        await LedgerModel.aio.snapshot()
 
     @commands.command(name="thanks", aliases=["thank", "thx"], usage="thanks <member>")
     async def thanks(self, ctx: commands.Context, member: disnake.Member):
@@ -30,20 +54,14 @@ class Currency(commands.Cog, name="currency"):
             return
 
         sender = ctx.author.id
-        sender_balance = CurrencyModel.get_balance_or_create(sender)
-
         receiver = member.id
-        receiver_balance = CurrencyModel.get_balance_or_create(receiver)
-        if sender_balance is None or receiver_balance is None:
-            raise InternalSQLError()
-
-        if sender_balance < TXN_FEE:
+        if not await CurrencyModel.aio.transfer(sender, receiver, TXN_FEE, "thanks",
+            received_amt=THANKS_AMT):
+            sender_balance = await CurrencyModel.aio.get_balance_or_create(sender)
             await ctx.reply(f"Insufficient balance, you have {sender_balance} ARC coins. " \
                 f"To send coins, you need at least {TXN_FEE} ARC coins per coin sent.")
             return
 
-        CurrencyModel.update_balance(receiver, receiver_balance + THANKS_AMT)
-        CurrencyModel.update_balance(sender, sender_balance - TXN_FEE)
         refid = "<@" + str(receiver) + ">"
         await ctx.reply(f"Gifted {THANKS_AMT} ARC Coins to {refid}")
 
@@ -62,20 +80,13 @@ class Currency(commands.Cog, name="currency"):
             return
 
         sender = ctx.author.id
-        sender_balance = CurrencyModel.get_balance_or_create(sender)
-
         receiver = member.id
-        receiver_balance = CurrencyModel.get_balance_or_create(receiver)
-        if sender_balance is None or receiver_balance is None:
-            raise InternalSQLError()
-
-        if sender_balance < amt:
+        if not await CurrencyModel.aio.transfer(sender, receiver, amt, "pay"):
+            sender_balance = await CurrencyModel.aio.get_balance_or_create(sender)
             await ctx.reply(f"Insufficient balance, you have {sender_balance} ARC coins. " \
                 f"To send coins, you need at least {TXN_FEE} ARC coins per coin sent.")
             return
 
-        CurrencyModel.update_balance(receiver, receiver_balance + amt)
-        CurrencyModel.update_balance(sender, sender_balance - amt)
         refid = "<@" + str(receiver) + ">"
         await ctx.reply(f"Paid +{amt} ARC Coins to {refid}")
 
@@ -88,46 +99,74 @@ class Currency(commands.Cog, name="currency"):
 
         if member is None:
             member_id = ctx.author.id
-            balance = CurrencyModel.get_balance_or_create(ctx.author.id)
+            balance = await CurrencyModel.aio.get_balance_or_create(ctx.author.id)
         else:
             member_id = member.id
-            balance = CurrencyModel.get_balance_or_create(member.id)
+            balance = await CurrencyModel.aio.get_balance_or_create(member.id)
 
         if member is None:
             await ctx.reply(f"You have {balance} ARC coins")
         else:
             await ctx.reply(f"<@{member_id}> has {balance} ARC coins")
 
+    @commands.command(name="set", usage="set <member> <amount>")
+    async def set_balance(self, ctx: commands.Context, member: disnake.Member, amt: float):
+        """
+        Sets amount of member's account (owner only).
+        """
+
+        if ctx.message.author.id not in config["owners"]:
+            raise commands.MissingPermissions([])
+        if amt < 0.0:
+            await ctx.reply("Balance can't be negative")
+            return
+
+        await CurrencyModel.aio.update_balance(member.id, amt)
+        await ctx.reply(f"Set <@{member.id}>'s balance to {amt} ARC coins")
+
     @commands.command(name="leaderboard", usage="leaderboard")
     async def leaderboard(self, ctx: commands.Context):
         """
-        Prints top 15 members with most amount of ARC coins in a server.
+        Prints members with most amount of ARC coins in a server, 15 per page.
         """
 
         if ctx.guild is None:
             raise commands.NoPrivateMessage(message="Command must be used in a server")
 
-        accounts = MemberModel.get_richest(ctx.guild.id, n=15)
-        if len(accounts) == 0:
-            leaderboard = "Everybody is broke"
-        else:
-            leaderboard = f"**{ctx.guild.name}'s ARC Coin Leaderboard**\n"
-            pos = 1
-            for account in accounts:
-                member = ctx.guild.get_member(account.member_id)
+        def lines():
+            for pos, (member_id, balance) in enumerate(
+                leaderboard.top(ctx.guild.id, n=LEADERBOARD_SIZE), start=1):
+                member = ctx.guild.get_member(member_id)
                 if member is not None:
-                    if member.nick is not None:
-                        name = member.nick
-                    else:
-                        name = member.name
-
-                    balance = CurrencyModel.get_balance_or_create(account.member_id)
+                    name = member.nick if member.nick is not None else member.name
                     if balance == 1:
-                        leaderboard += f"{pos}: {name} with 1 coin\n"
+                        yield LEADERBOARD_ONE(pos, name)
                     else:
-                        leaderboard += f"{pos}: {name} with {balance} coins\n"
-                pos += 1
-        await ctx.send(leaderboard)
+                        yield LEADERBOARD_MANY(pos, name, balance)
+
+        await send_pages(ctx, f"{ctx.guild.name}'s ARC Coin Leaderboard", lines(),
+            "Everybody is broke", author_id=ctx.author.id, max_lines=LEADERBOARD_PAGE)
+
+    @commands.command(name="rank", usage="rank <member (Optional)>")
+    async def rank(self, ctx: commands.Context,
+        member: typing.Optional[disnake.Member] = None):
+        """
+        Prints a member's position on the server's leaderboard.
+        """
+
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage(message="Command must be used in a server")
+
+        if member is None:
+            member = ctx.author
+
+        result = leaderboard.rank(ctx.guild.id, member.id)
+        if result is None:
+            await ctx.reply(f"<@{member.id}> isn't on the leaderboard yet")
+        else:
+            pos, balance, total = result
+            await ctx.reply(f"<@{member.id}> is ranked {pos} of {total} " \
+                f"with {balance} ARC coins")
 
 def setup(bot):
     bot.add_cog(Currency(bot))
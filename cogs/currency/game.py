@@ -5,14 +5,16 @@ Description:
 Server games connected to currency.
 """
 
+import asyncio
 import random
-from datetime import date
 
 import disnake
-from disnake.ext import commands, tasks
+from disnake.ext import commands
 
 from helpers import arcdle
+from helpers.arcdle_solver import Solver
 from helpers.db_manager import CurrencyModel, ARCdleModel, DailyModel
+from helpers.scheduler import Cron
 
 ARCDLE_WIN_AMT = 2.5
 ARCDLE_LOSE_AMT = 1.0
@@ -21,8 +23,15 @@ DAILY_LAMBDA = 2.5
 class Game(commands.Cog, name="game"):
     def __init__(self, bot):
         self.bot = bot
-        self.arcdle_sol = arcdle.pick_solution()
         self.emojis = {}
+        # Built on first use, then shared by every game
+        self.solver = None
+        # (day, rating, steps) of the latest difficulty worked out
+        self.difficulty = None
+
+        # 12am EST in UTC
+        bot.scheduler.add_cron("arcdle_wipe", Cron(hours=[5]), self.wipe_arcdle)
+        bot.scheduler.add_cron("daily_reset", Cron(hours=[5]), self.reset_daily)
 
     def get_emoji(self, letter: str):
         if letter not in self.emojis:
@@ -32,51 +41,64 @@ class Game(commands.Cog, name="game"):
                     break
         return self.emojis[letter]
 
-    @tasks.loop(hours=1)
-    async def check_wipe(self):
-        now = datetime.utcnow()
+    async def get_solver(self):
+        if self.solver is None:
+            loop = asyncio.get_running_loop()
+            self.solver = loop.run_in_executor(None, Solver, arcdle.words)
+        return await self.solver
+
+    async def get_difficulty(self):
+        """
+        Returns (rating, steps) for today's word.
+        """
+        day = arcdle.game_date()
+        if self.difficulty is None or self.difficulty[0] != day:
+            solver = await self.get_solver()
+            loop = asyncio.get_running_loop()
+            rating, steps = await loop.run_in_executor(None, solver.difficulty,
+                arcdle.words.solution(day))
+            self.difficulty = (day, rating, steps)
+        return self.difficulty[1:]
+
+    async def wipe_arcdle(self):
+        await ARCdleModel.aio.clear_games()
+
+    async def reset_daily(self):
+        await DailyModel.aio.clear_daily()
 
-        # 12am EST in UTC
-        if now.hour == 5:
-            ARCdleModel.clear_games()
-        
     async def handle_message(self, msg: disnake.Message, arcdle_game: ARCdleModel):
         """
         Called when a direct message is received for arcdle.
         """
 
         msg_content = msg.content.strip().lower()
-        if len(msg_content) == 5 and msg_content.isalpha():
+        if not arcdle.is_word(msg_content):
+            await msg.channel.send("Guess must be a 5 letter word.")
+        elif not arcdle.words.is_allowed(msg_content):
+            await msg.channel.send("That word isn't in the word list.")
+        else:
             visible = arcdle_game.visible
             hidden = arcdle_game.hidden
             status = arcdle_game.status
 
-            sol = self.arcdle_sol
+            solution = arcdle.words.solution()
+            solver = await self.get_solver()
+            pattern = solver.pattern(msg_content, solution)
 
             prev_visible_guesses = visible.split(",")
             prev_hidden_guesses = hidden.split(",")
 
             hidden_guess = ""
             visible_guess = ""
-            correct_cnt = 0
-
-            # Remove perfect matches
-            for i in range(5):
-                if msg_content[i] == self.arcdle_sol[i]:
-                    sol = sol.replace(msg_content[i], "", 1)
-
-            # Display partial and perfect matches
-            for i in range(5):
-                if msg_content[i] == self.arcdle_sol[i]:
-                    correct_cnt += 1
-                    visible_guess += f"{self.get_emoji(msg_content[i])} "
+            for letter, feedback in zip(msg_content, arcdle.digits(pattern)):
+                if feedback == arcdle.GREEN:
+                    visible_guess += f"{self.get_emoji(letter)} "
                     hidden_guess += ":green_square: "
-                elif msg_content[i] in sol:
-                    sol = sol.replace(msg_content[i], "", 1)
-                    visible_guess += f":regional_indicator_{msg_content[i]}: "
+                elif feedback == arcdle.YELLOW:
+                    visible_guess += f":regional_indicator_{letter}: "
                     hidden_guess += ":yellow_square: "
                 else:
-                    visible_guess += f"{msg_content[i]} "
+                    visible_guess += f"{letter} "
                     hidden_guess += ":black_large_square: "
 
             if prev_visible_guesses[0] != "":
@@ -90,7 +112,7 @@ class Game(commands.Cog, name="game"):
                 hidden_guesses = [hidden_guess]
 
             status = 0
-            if correct_cnt == 5:
+            if pattern == arcdle.SOLVED:
                 status = 1
             elif len(visible_guesses) == 6:
                 status = 2
@@ -109,9 +131,8 @@ class Game(commands.Cog, name="game"):
                 board_desc = f"{6-len(visible_guesses)}/6 guesses remain\n\n"
 
             if status != 0:
-                guild_id, channel_id = arcdle_game.get_origin()
-                balance = CurrencyModel.get_balance_or_create(msg.author.id)
-                CurrencyModel.update_balance(msg.author.id, balance + winning_amt)
+                guild_id, channel_id = await arcdle_game.aio.get_origin()
+                await CurrencyModel.aio.credit(msg.author.id, winning_amt, "arcdle")
 
                 public_desc = board_desc
                 for i in range(len(hidden_guesses)):
@@ -134,7 +155,7 @@ class Game(commands.Cog, name="game"):
                     if i < 5:
                         board_desc += "\n\n"
             else:
-                board_desc += f"\n\n The word was {self.arcdle_sol}"
+                board_desc += f"\n\n The word was {solution}"
             board = disnake.Embed(title="ARCdle", description=board_desc)
 
             old_board = await msg.channel.fetch_message(arcdle_game.message_id)
@@ -142,10 +163,9 @@ class Game(commands.Cog, name="game"):
 
             visible_guesses = ",".join(visible_guesses)
             hidden_guesses = ",".join(hidden_guesses)
+            guesses = ",".join(arcdle_game.get_guesses() + [msg_content])
 
-            arcdle_game.update(visible_guesses, hidden_guesses, status)
-        else:
-            await msg.channel.send("Guess must be a 5 letter word.")
+            await arcdle_game.aio.update(visible_guesses, hidden_guesses, status, guesses)
 
     @commands.command(name="daily", usage="daily")
     async def daily(self, ctx: commands.Context):
@@ -153,23 +173,25 @@ class Game(commands.Cog, name="game"):
         Earn ARC coins daily.
         """
 
-        if DailyModel.was_redeemed(ctx.author.id):
+        if await DailyModel.aio.was_redeemed(ctx.author.id):
             await ctx.reply("You've already redeemed today, come back tomorrow")
         else:
             amt = round(random.expovariate(DAILY_LAMBDA), 2)
-            balance = CurrencyModel.get_balance_or_create(ctx.author.id)
-            CurrencyModel.update_balance(ctx.author.id, balance + amt)
-            DailyModel.redeem(ctx.author.id)
+            await CurrencyModel.aio.credit(ctx.author.id, amt, "daily")
+            await DailyModel.aio.redeem(ctx.author.id)
             await ctx.reply(f"Congrats! You won {amt} ARC coins")
             
 
-    @commands.command(name="arcdle", usage="arcdle")
+    @commands.group(name="arcdle", usage="arcdle", invoke_without_command=True)
     async def arcdle(self, ctx: commands.Context):
         """
         Starts a game of arcdle for some coins
         """
 
-        arcdle_game = ARCdleModel.get_member_recent_game(ctx.author.id)
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage(message="Command must be used in a server")
+
+        arcdle_game = await ARCdleModel.aio.get_member_recent_game(ctx.author.id)
 
         # Handle already started games
         if arcdle_game is not None:
@@ -178,19 +200,49 @@ class Game(commands.Cog, name="game"):
             else:
                 await ctx.reply("You've already played today, come back tomorrow")
             return
-        else:
-            if ARCdleModel.get_num_games() == 0:
-                self.arcdle_sol = arcdle.pick_solution()
-        
+
         # Start a new game
-        board_desc = "6/6 guesses remain \n\n"
+        rating, steps = await self.get_difficulty()
+        board_desc = f"Today's word is rated {rating} ({steps} guesses for the solver)\n\n" \
+            "6/6 guesses remain \n\n"
         for i in range(6):
             board_desc += "\_ \_ \_ \_ \_"
             if i < 5:
                 board_desc += "\n\n"
         board = disnake.Embed(title="ARCdle", description=board_desc)
         message = await ctx.message.author.send(embed=board)
-        ARCdleModel.create_game(ctx.author.id, ctx.guild.id, ctx.channel.id, message.id)
+        await ARCdleModel.aio.create_game(ctx.author.id, ctx.guild.id, ctx.channel.id, message.id)
+
+    @arcdle.command(name="hint", usage="arcdle hint")
+    async def hint(self, ctx: commands.Context):
+        """
+        DMs the most informative next guess for your game
+        """
+
+        arcdle_game = await ARCdleModel.aio.get_member_active_game(ctx.author.id)
+        if arcdle_game is None:
+            await ctx.reply("You don't have a game in progress, start one with `.arcdle`")
+            return
+
+        solver = await self.get_solver()
+        loop = asyncio.get_running_loop()
+        guess, bits, remaining = await loop.run_in_executor(None, solver.hint,
+            arcdle_game.get_guesses(), arcdle.words.solution())
+        if remaining == 1:
+            await ctx.author.send(f"Only one word fits, try **{guess}**")
+        else:
+            await ctx.author.send(f"{remaining} words still fit, **{guess}** " \
+                f"narrows them down the most ({bits:.2f} bits on average)")
+
+    @arcdle.command(name="difficulty", usage="arcdle difficulty")
+    async def difficulty_rating(self, ctx: commands.Context):
+        """
+        Rates today's word by how many guesses the solver needs
+        """
+
+        rating, steps = await self.get_difficulty()
+        await ctx.reply(f"Today's word is rated {rating}, " \
+            f"the solver needs {steps} guesses")
 
 def setup(bot):
     bot.add_cog(Game(bot))
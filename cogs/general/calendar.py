@@ -5,16 +5,20 @@ Description:
 Sends updates from linked calendar.
 """
 
+import asyncio
+import heapq
 import json
+import logging as log
 import os
 import sys
-from datetime import datetime
-
+import time
 import disnake
-from disnake.ext import commands, tasks
+from disnake.ext import commands
 
 from helpers import calendar_util as util
-from helpers.db_manager import CalendarModel
+from helpers.db_manager import CalendarModel, CalendarEventModel
+from helpers.paginator import embed_pages, send_pages
+from helpers.scheduler import Cron, Interval
 
 if not os.path.isfile("config.json"):
     sys.exit("'config.json' not found! Please add it and try again.")
@@ -22,78 +26,116 @@ else:
     with open("config.json") as file:
         config = json.load(file)
 
+# Seconds between background calendar syncs
+SYNC_INTERVAL = 300
+# Seconds before a stored calendar name is refreshed
+META_TTL = 86400
+# Channels a digest posts to at once
+DIGEST_CONCURRENCY = 5
+
 class Calendar(commands.Cog, name="calendar"):
     def __init__(self, bot):
         self.bot = bot
-        self.check_reminder.start()
+        # Calendar ids with a name refresh in flight
+        self.refreshing = set()
+
+        # Daily digest at 17:00 UTC, replaced by the weekly one on Saturdays
+        bot.scheduler.add_cron("calendar_daily",
+            Cron(hours=[17], weekdays=[0, 1, 2, 3, 4, 6]),
+            self.send_daily_reminder, grace=3600)
+        bot.scheduler.add_cron("calendar_weekly",
+            Cron(hours=[17], weekdays=[5]),
+            self.send_weekly_reminder, grace=3600)
+
+        # Keeps the local event cache current with incremental syncs
+        bot.scheduler.add_cron("calendar_sync", Interval(SYNC_INTERVAL),
+            self.sync_calendars, grace=SYNC_INTERVAL)
+
+    async def sync_calendars(self):
+        calendars = await CalendarModel.aio.get_all()
+        calendar_ids = list({calendar.calendar_id for calendar in calendars})
+        await util.sync_calendars(calendar_ids)
+        await CalendarEventModel.aio.prune(time.time() - util.KEEP_PAST)
+
+    def render_update(self, title: str, events):
+        """
+        Renders events into embed pages for a digest.
+        """
+        return embed_pages(f"{title}'s events:",
+            map(util.construct_calendar_msg, events), sep="\n\n")
 
-    async def send_update(self, title: str, channel: disnake.TextChannel, events):
-        if not events:
-            await channel.send(content="No calendar events {}.".format(title))
-        else:
-            embed = disnake.Embed(title=f"{title}'s events:")
-
-            print(events)
-            description = util.construct_calendar_msg(events[0])
-            for i in range(1, len(events)):
-                description += "\n\n"
-                description += util.construct_calendar_msg(events[i])
-
-            embed.description = description
-            await channel.send(embed=embed)
-
-    @tasks.loop(seconds=10)
-    async def check_reminder(self):
-        now = datetime.utcnow()
-        # 12am EST in UTC
-        if now.hour == 17:
-            if now.weekday() == 5:
-                await self.send_weekly_reminder()
-            else:
-                await self.send_daily_reminder()
+    async def send_update(self, title: str, channel: disnake.TextChannel, events,
+        author_id: int = None):
+        await send_pages(channel, f"{title}'s events:",
+            map(util.construct_calendar_msg, events),
+            "No calendar events {}.".format(title), author_id=author_id, sep="\n\n")
+
+    async def send_digest(self, title: str, collect):
+        """
+        Posts a digest to every channel with linked calendars. Each calendar
+        is read once however many channels it's linked to, each distinct set
+        of calendars is rendered once, and channels are posted to
+        concurrently.
+        """
+        started = time.perf_counter()
+        await self.sync_calendars()
+
+        channels = {}
+        for calendar in await CalendarModel.aio.get_all():
+            channels.setdefault(calendar.channel_id, set()).add(calendar.calendar_id)
+        calendar_ids = list(set().union(*channels.values()))
+
+        results = await asyncio.gather(*(collect([x]) for x in calendar_ids))
+        events = dict(zip(calendar_ids, results))
+
+        messages = {}
+        for ids in channels.values():
+            key = frozenset(ids)
+            if key not in messages:
+                merged = heapq.merge(*(events[x] for x in key),
+                    key=lambda event: util.parse_time(event['start']))
+                messages[key] = self.render_update(title, list(merged))
+
+        limit = asyncio.Semaphore(DIGEST_CONCURRENCY)
+        async def post(channel_id, ids):
+            async with limit:
+                try:
+                    channel = self.bot.get_channel(channel_id)
+                    if channel is None:
+                        channel = await self.bot.fetch_channel(channel_id)
+                    pages = messages[frozenset(ids)]
+                    if not pages:
+                        await channel.send(f"No calendar events {title}.")
+                    else:
+                        for embed in pages:
+                            await channel.send(embed=embed)
+                    return True
+                except disnake.HTTPException as e:
+                    log.warning(f"Couldn't post calendar digest to {channel_id}: {e}")
+                    return False
+
+        posted = await asyncio.gather(*(post(channel_id, ids)
+            for channel_id, ids in channels.items()))
+        log.info(f"Calendar digest for {title}: {len(calendar_ids)} calendars fetched, " \
+            f"{sum(posted)}/{len(channels)} channels posted in " \
+            f"{time.perf_counter() - started:.2f}s")
 
     async def send_daily_reminder(self):
-        calendars = CalendarModel.get_all()
-        events = {}
-        for calendar in calendars:
-            cal_events = util.collect_today([calendar.calendar_id])
-            if calendar.channel_id not in events:
-                events[calendar.channel_id] = list(cal_events)
-            else:
-                events[calendar.channel_id].extend(cal_events)
-        
-        for channel_id, cal_events in events.items():
-            channel = self.bot.get_channel(channel_id)
-            await self.send_update("today", channel, cal_events)
+        await self.send_digest("today", util.collect_today)
 
     async def send_weekly_reminder(self):
-        calendars = CalendarModel.get_all()
-        events = {}
-        for calendar in calendars:
-            cal_events = util.collect_week(list(calendar.calendar_id))
-            if calendar.channel_id not in events:
-                events[calendar.channel_id] = list(cal_events)
-            else:
-                events[calendar.channel_id].extend(cal_events)
-
-        for channel_id, cal_events in events.items():
-            channel = self.bot.get_channel(channel_id)
-            if channel is None:
-                channel = await self.bot.fetch_channel(channel_id)
-            if channel is None:
-                continue
-            await self.send_update("this week", channel, cal_events)
+        await self.send_digest("this week", util.collect_week)
 
     @commands.command(name="today", usage="today")
     async def get_todays_events(self, ctx: commands.Context):
         """
         Prints a list of scheduled events for the current day.
         """
-        calendars = CalendarModel.get_by_guild(ctx.guild.id)
+        calendars = await CalendarModel.aio.get_by_guild(ctx.guild.id)
         calendar_ids = [calendar.calendar_id for calendar in calendars]
-        events = util.collect_today(calendar_ids)
+        events = await util.collect_today(calendar_ids)
         await self.send_update(
-            "today", ctx.channel, events
+            "today", ctx.channel, events, ctx.author.id
         )
 
     @commands.command(name="week", usage="week")
@@ -101,24 +143,56 @@ class Calendar(commands.Cog, name="calendar"):
         """
         Prints a list of scheduled events for the current week.
         """
-        calendars = CalendarModel.get_by_guild(ctx.guild.id)
+        calendars = await CalendarModel.aio.get_by_guild(ctx.guild.id)
         calendar_ids = [calendar.calendar_id for calendar in calendars]
-        events = util.collect_week(calendar_ids)
+        events = await util.collect_week(calendar_ids)
         await self.send_update(
-            "this week", ctx.channel, events
+            "this week", ctx.channel, events, ctx.author.id
         )
 
+    async def refresh_meta(self, calendar_id: str):
+        """
+        Fetches and stores a calendar's name, returning it or None if the
+        calendar can't be accessed.
+        """
+        meta = await util.get_calendar_meta(calendar_id)
+        if meta is not None:
+            await CalendarModel.aio.set_meta(calendar_id, *meta)
+        return meta[0] if meta else None
+
+    def refresh_stale(self, calendars):
+        """
+        Refreshes names older than META_TTL in the background.
+        """
+        now = time.time()
+        for calendar in calendars:
+            if calendar.calendar_id in self.refreshing:
+                continue
+            if calendar.fetched_at is None or now - calendar.fetched_at > META_TTL:
+                self.refreshing.add(calendar.calendar_id)
+                task = asyncio.create_task(self.refresh_meta(calendar.calendar_id))
+                task.add_done_callback(
+                    lambda _, x=calendar.calendar_id: self.refreshing.discard(x))
+
     @commands.command(name="addcalendar", usage="addcalendar <gcalendar_id>")
     async def add_calendar(self, ctx: commands.Context, calendar_id: str):
         """
         Set a channel to print calendar reminders. 
         """
-        calendar = CalendarModel.get(ctx.guild.id, ctx.channel.id, calendar_id)
-        calendar_name = util.get_calendar_name(calendar_id)
+        calendar = await CalendarModel.aio.get(ctx.guild.id, ctx.channel.id, calendar_id)
         if calendar:
-            await ctx.reply(f"{calendar_name} calendar already added to this channel")
-        elif calendar_name:
-            CalendarModel.add(ctx.guild.id, ctx.channel.id, calendar_id)
+            await ctx.reply(f"{calendar.display_name} calendar already added to this channel")
+            return
+
+        # Only trust a stored name if it's fresh, since access may have been revoked
+        meta = await CalendarModel.aio.get_meta(calendar_id)
+        if meta is not None and time.time() - meta[1] <= META_TTL:
+            calendar_name = meta[0]
+        else:
+            calendar_name = await self.refresh_meta(calendar_id)
+
+        if calendar_name:
+            await CalendarModel.aio.add(ctx.guild.id, ctx.channel.id, calendar_id)
             await ctx.reply(f"{calendar_name} calendar added")
         else:
             await ctx.reply("Calendar couldn't be accessed, check permissions")
@@ -128,13 +202,12 @@ class Calendar(commands.Cog, name="calendar"):
         """
         List all calendars for a given channel.
         """
-        calendars = CalendarModel.get_by_channel(ctx.guild.id, ctx.channel.id)
+        calendars = await CalendarModel.aio.get_by_channel(ctx.guild.id, ctx.channel.id)
         if calendars:
-            calendar_names = [util.get_calendar_name(calendar.calendar_id)
-                for calendar in calendars]
             embed = disnake.Embed(title="Calendars:")
-            embed.description = "\n".join(calendar_names)
+            embed.description = "\n".join(calendar.display_name for calendar in calendars)
             await ctx.reply(embed=embed)
+            self.refresh_stale(calendars)
         else:
             await ctx.reply("No calendars added to this channel")
 
@@ -143,11 +216,10 @@ class Calendar(commands.Cog, name="calendar"):
         """
         Stop calendar reminders from being to this channel.
         """
-        calendar = CalendarModel.get(ctx.guild.id, ctx.channel.id, calendar_id)
+        calendar = await CalendarModel.aio.get(ctx.guild.id, ctx.channel.id, calendar_id)
         if calendar:
-            calendar.remove()
-            calendar_name = util.get_calendar_name(calendar.calendar_id)
-            await ctx.reply(f"{calendar_name} calendar removed")
+            await calendar.aio.remove()
+            await ctx.reply(f"{calendar.display_name} calendar removed")
         else:
             await ctx.reply("No calendar found with that id")
 
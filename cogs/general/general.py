@@ -5,15 +5,22 @@ Description:
 Holds common utility commands.
 """
 
+import asyncio
 import json
+import logging as log
 import os
 import random
 import sys
+import time
 
-from helpers.db_manager import BacklogModel, RoleMenuModel
+from helpers import cache
+from helpers.db_manager import BacklogModel, BountyModel, RoleMenuModel
+from helpers.emoji import emoji_key
+from helpers.paginator import send_pages
+from helpers.pipeline import RateLimitedQueue, TokenBucket
 
 import disnake
-from disnake.ext import commands, tasks
+from disnake.ext import commands
 
 if not os.path.isfile("config.json"):
     sys.exit("'config.json' not found! Please add it and try again.")
@@ -21,9 +28,21 @@ else:
     with open("config.json") as file:
         config = json.load(file)
 
+BACKLOG_TEMPLATE = "{}. {}".format
+BOUNTY_RESULT_TEMPLATE = "**[{}]({})**: {} coins".format
+# Results shown by a search
+SEARCH_LIMIT = 20
+
+# Members whose roles are changed per second while reconciling role menus
+ROLE_RATE = 2
+ROLE_BURST = 5
+
 class General(commands.Cog, name="general"):
     def __init__(self, bot):
         self.bot = bot
+        self.role_queue = RateLimitedQueue("Role menu reconcile",
+            TokenBucket(ROLE_RATE, ROLE_BURST))
+        self.reconciling = asyncio.Lock()
 
     @commands.command(name="status", usage="status")
     async def info(self, ctx: commands.Context):
@@ -98,22 +117,34 @@ class General(commands.Cog, name="general"):
         else:
             raise commands.MissingPermissions([])
 
+    @commands.command(name="cachestats", usage="cachestats")
+    async def cachestats(self, ctx: commands.Context):
+        """
+        Print hit/miss counters for the bot's caches.
+        """
+        if ctx.message.author.id in config["owners"]:
+            embed = disnake.Embed(title="Cache stats", color=0x42F56C)
+            for name, c in cache.caches.items():
+                stats = c.stats()
+                embed.add_field(name=name,
+                    value=f"{stats['hits']} hits, {stats['misses']} misses, " \
+                        f"{stats['size']}/{stats['maxsize']} entries",
+                    inline=False)
+            embed.set_footer(text=f"{len(RoleMenuModel.menus)} role menus indexed")
+            await ctx.send(embed=embed)
+        else:
+            raise commands.MissingPermissions([])
+
     @commands.command(name="backlog", usage="backlog")
     async def backlog(self, ctx: commands.Context):
         """
         Print current bot backlog.
         """
         
-        backlog_items = BacklogModel.get_all()
-        if len(backlog_items) > 0:
-            msg = ""
-            for i in range(len(backlog_items)):
-                msg += f"{i+1}. {backlog_items[i].item}\n\n"
-
-            embed = disnake.Embed(title="My backlog", description=msg)
-            await ctx.send(embed=embed)
-        else:
-            await ctx.send("No items in the backlog!")
+        backlog_items = await BacklogModel.aio.get_all()
+        await send_pages(ctx, "My backlog",
+            (BACKLOG_TEMPLATE(i, x.item) for i, x in enumerate(backlog_items, start=1)),
+            "No items in the backlog!", author_id=ctx.author.id, sep="\n\n")
 
     @commands.command(name="todo", usage="todo <item>")
     async def todo(self, ctx: commands.Context, item: str):
@@ -122,7 +153,7 @@ class General(commands.Cog, name="general"):
         """
 
         if ctx.message.author.id in config["owners"]:
-            BacklogModel.add(item)
+            await BacklogModel.aio.add(item)
             await ctx.send("Added item to backlog.")
         else:
             embed = disnake.Embed(
@@ -132,6 +163,27 @@ class General(commands.Cog, name="general"):
             )
             await ctx.send(embed=embed)
 
+    @commands.command(name="search", usage="search <backlog|bounty> <query>")
+    async def search(self, ctx: commands.Context, kind: str, *, query: str):
+        """
+        Searches the backlog or the server's bounties, closest matches first.
+        """
+
+        kind = kind.lower()
+        if kind == "backlog":
+            items = await BacklogModel.aio.search(query, SEARCH_LIMIT)
+            lines = (BACKLOG_TEMPLATE(i + 1, x.item) for i, x in enumerate(items))
+        elif kind == "bounty":
+            if ctx.guild is None:
+                raise commands.NoPrivateMessage(message="Command must be used in a server")
+            bounties = await BountyModel.aio.search(ctx.guild.id, query, SEARCH_LIMIT)
+            lines = (BOUNTY_RESULT_TEMPLATE(x.title, x.jump_url, x.amt) for x in bounties)
+        else:
+            raise commands.UserInputError(message="Can only search backlog or bounty")
+
+        await send_pages(ctx, f"Results for '{query}'", lines, "Nothing matched.",
+            author_id=ctx.author.id, max_lines=10)
+
     @commands.command(name="finished", usage="finished <item>")
     async def finished(self, ctx: commands.Context, item: str):
         """
@@ -139,12 +191,11 @@ class General(commands.Cog, name="general"):
         """
 
         if ctx.message.author.id in config["owners"]:
-            result = None
-            with self.open_db() as c:
-                if BacklogModel.find_and_remove(item):
-                    await ctx.send("Removed item from backlog.")
-                else:
-                    await ctx.send("Couldn't find item in backlog.")
+            removed = await BacklogModel.aio.find_and_remove(item)
+            if removed is not None:
+                await ctx.send(f"Removed '{removed}' from backlog.")
+            else:
+                await ctx.send("Couldn't find item in backlog.")
         else:
             raise commands.MissingPermissions([])
 
@@ -168,41 +219,174 @@ class General(commands.Cog, name="general"):
         menu = await ctx.send(embed=embed)
 
         for emoji, role in zip(emojis, roles):
-            RoleMenuModel.add_option(menu.id, ctx.guild.id, role.name, emoji)
+            await RoleMenuModel.aio.add_option(menu.id, ctx.guild.id, role.id, role.name,
+                emoji, ctx.channel.id)
             await menu.add_reaction(emoji)
 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """
+        Fills in role IDs for role menus saved when roles were stored by name.
+        """
+        resolved = []
+        for option in await RoleMenuModel.aio.get_unresolved():
+            guild = self.bot.get_guild(option.guild_id)
+            role = None if guild is None else disnake.utils.get(guild.roles, name=option.role)
+            if role is not None:
+                option.role_id = role.id
+                resolved.append(option)
+        if resolved:
+            await RoleMenuModel.aio.set_role_ids(resolved)
+
+        # Catch up on reactions added while the bot was down
+        scanned, changed, elapsed = await self.reconcile()
+        log.info(f"Reconciled role menus: {scanned} members scanned, " \
+            f"{changed} roles changed in {elapsed:.1f}s")
+
+    async def find_menu(self, guild: disnake.Guild, message_id: int, channel_id: int):
+        """
+        Fetches a role menu's message, searching the guild's text channels
+        for menus saved before their channel was recorded.
+        """
+        if channel_id is not None:
+            channel = guild.get_channel(channel_id)
+            return None if channel is None else await channel.fetch_message(message_id)
+
+        for channel in guild.text_channels:
+            try:
+                message = await channel.fetch_message(message_id)
+            except (disnake.NotFound, disnake.Forbidden):
+                continue
+            await RoleMenuModel.aio.set_channel(message_id, channel.id)
+            return message
+        return None
+
+    async def reconcile(self, guild_id: int = None, prune: bool = False):
+        """
+        Gives every member the roles for their reactions on role menus. With
+        prune, also takes a menu role from members who hold it without a
+        matching reaction on any menu, which strips it from members given it
+        by other means. Returns the members scanned, roles changed and
+        seconds taken.
+        """
+        async with self.reconciling:
+            started = time.perf_counter()
+            scanned = set()
+            # (guild_id, role_id) -> members reacting for it on any menu
+            wanted = {}
+            # Roles offered by a menu that couldn't be read, never pruned
+            incomplete = set()
+
+            for message_id, menu_guild_id, channel_id in await RoleMenuModel.aio.get_locations():
+                guild = self.bot.get_guild(menu_guild_id)
+                options = RoleMenuModel.get_options(message_id)
+                if guild is None or not options \
+                    or (guild_id is not None and menu_guild_id != guild_id):
+                    continue
+
+                for role_id in options.values():
+                    wanted.setdefault((guild.id, role_id), set())
+                try:
+                    message = await self.find_menu(guild, message_id, channel_id)
+                except disnake.HTTPException as e:
+                    log.warning(f"Couldn't fetch role menu {message_id}: {e}")
+                    message = None
+                if message is None:
+                    incomplete.update((guild.id, x) for x in options.values())
+                    continue
+                if not guild.chunked:
+                    await guild.chunk()
+
+                for reaction in message.reactions:
+                    role_id = options.get(emoji_key(reaction.emoji))
+                    if role_id is not None:
+                        wanted[(guild.id, role_id)].update(
+                            [user.id async for user in reaction.users() if not user.bot])
+
+            # (guild_id, member_id) -> roles to add and roles to remove
+            changes = {}
+            for (role_guild_id, role_id), members in wanted.items():
+                role = self.bot.get_guild(role_guild_id).get_role(role_id)
+                if role is None:
+                    continue
+                holders = {member.id for member in role.members if not member.bot}
+                scanned.update((role_guild_id, x) for x in members | holders)
+                for member_id in members - holders:
+                    changes.setdefault((role_guild_id, member_id), ([], []))[0].append(role)
+                if prune and (role_guild_id, role_id) not in incomplete:
+                    for member_id in holders - members:
+                        changes.setdefault((role_guild_id, member_id), ([], []))[1].append(role)
+
+            changed = 0
+            async def apply(member_guild_id, member_id, add, remove):
+                nonlocal changed
+                member = self.bot.get_guild(member_guild_id).get_member(member_id)
+                if member is None:
+                    return
+                if add:
+                    await member.add_roles(*add, reason="Role menu reconciliation")
+                    changed += len(add)
+                if remove:
+                    await member.remove_roles(*remove, reason="Role menu reconciliation")
+                    changed += len(remove)
+
+            for (member_guild_id, member_id), (add, remove) in changes.items():
+                self.role_queue.put(lambda x=member_guild_id, y=member_id,
+                    add=add, remove=remove: apply(x, y, add, remove))
+            await self.role_queue.join()
+            return len(scanned), changed, time.perf_counter() - started
+
+    @commands.command(name="reconcile", usage="reconcile [--prune]")
+    async def reconcile_menus(self, ctx: commands.Context, mode: str = None):
+        """
+        Gives roles for reactions on this server's role menus, and with
+        --prune takes menu roles from anyone who hasn't reacted (owner only).
+        """
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage(message="Command must be used in a server")
+        if ctx.message.author.id not in config["owners"]:
+            raise commands.MissingPermissions([])
+        if mode not in (None, "--prune"):
+            raise commands.UserInputError(message="Only --prune is supported")
+
+        scanned, changed, elapsed = await self.reconcile(ctx.guild.id, prune=mode == "--prune")
+        rate = changed / elapsed if elapsed > 0 else 0
+        await ctx.reply(f"Scanned {scanned} members and changed {changed} roles " \
+            f"in {elapsed:.1f}s ({rate:.1f} changes/sec)")
+
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: disnake.RawReactionActionEvent):
         if payload.member is None or payload.member.bot:
             return
 
-        options = RoleMenuModel.get(payload.message_id, payload.guild_id)
-        if len(options) > 0:
-            guild = self.bot.get_guild(payload.guild_id)
-            for option in options:
-                if option.emoji == str(payload.emoji.name):
-                    role = disnake.utils.get(guild.roles, name=option.role)
-                    if role not in payload.member.roles:
-                        await payload.member.add_roles(role)
+        role_id = RoleMenuModel.get_role(payload.message_id, emoji_key(payload.emoji))
+        if role_id is None:
+            return
+
+        role = self.bot.get_guild(payload.guild_id).get_role(role_id)
+        if role is not None and payload.member.get_role(role_id) is None:
+            await payload.member.add_roles(role)
 
     @commands.Cog.listener()
     async def on_raw_reaction_remove(self, payload: disnake.RawReactionActionEvent):
-        options = RoleMenuModel.get(payload.message_id, payload.guild_id)
-        if len(options) > 0:
-            guild = self.bot.get_guild(payload.guild_id)
-            member = guild.get_member(payload.user_id)
-            if member is None:
-                return
-            for option in options:
-                if option.emoji == str(payload.emoji.name):
-
-                    role = disnake.utils.get(guild.roles, name=option.role)
-                    if role in member.roles:
-                        await member.remove_roles(role)
+        role_id = RoleMenuModel.get_role(payload.message_id, emoji_key(payload.emoji))
+        if role_id is None:
+            return
+
+        guild = self.bot.get_guild(payload.guild_id)
+        member = guild.get_member(payload.user_id)
+        if member is None:
+            return
+        role = member.get_role(role_id)
+        if role is not None:
+            await member.remove_roles(role)
 
     @commands.Cog.listener()
     async def on_raw_message_delete(self, payload: disnake.RawReactionActionEvent):
-        RoleMenuModel.delete_menu(payload.message_id, payload.guild_id)
+        if not RoleMenuModel.is_menu(payload.message_id):
+            return
+
+        await RoleMenuModel.aio.delete_menu(payload.message_id, payload.guild_id)
 
 def setup(bot):
     bot.add_cog(General(bot))
@@ -9,16 +9,18 @@ import json
 import os
 import sys
 
-import disnake
 from disnake.ext import commands
 from disnake.ext.commands import Context
 
+from helpers.paginator import send_pages
+
 if not os.path.isfile("config.json"):
     sys.exit("'config.json' not found! Please add it and try again.")
 else:
     with open("config.json") as file:
         config = json.load(file)
 
+HELP_TEMPLATE = "{}{} \n ```{}```".format
 
 class Help(commands.Cog, name="help"):
     def __init__(self, bot):
@@ -32,22 +34,16 @@ class Help(commands.Cog, name="help"):
         prefix = config["bot_prefix"]
         if not isinstance(prefix, str):
             prefix = prefix[0]
-        embed = disnake.Embed(
-            title="Help", description="List of available commands:", color=0x42F56C
-        )
-        for i in self.bot.cogs:
-            cog = self.bot.get_cog(i.lower())
-            commands = cog.get_commands()
-            command_usage = [command.usage for command in commands ]
-            command_description = [command.help for command in commands]
-            help_text = "\n".join(
-                f"{prefix}{u} \n ```{h}```" for u, h
-                    in zip(command_usage, command_description)
-            )
-            embed.add_field(
-                name=i.capitalize(), value=f"{help_text}", inline=False
-            )
-        await ctx.send(embed=embed)
+
+        def lines():
+            for i in self.bot.cogs:
+                cog = self.bot.get_cog(i.lower())
+                yield f"**{i.capitalize()}**"
+                for command in cog.get_commands():
+                    yield HELP_TEMPLATE(prefix, command.usage, command.help)
+
+        await send_pages(ctx, "Help", lines(), "No commands available",
+            author_id=ctx.author.id, color=0x42F56C)
 
 def setup(bot):
     bot.add_cog(Help(bot))
@@ -5,64 +5,146 @@ Description:
 Create and post small reminders.
 """
 
-import datetime as dt
+import re
+from datetime import datetime
+
 import dateparser as dp
-from typing import List
 
 import disnake
-from disnake.ext import commands, tasks
+from disnake.ext import commands
+
+from helpers.db_manager import ReminderModel
+from helpers.scheduler import TimerHeap
+
+# Shortest allowed gap between recurring reminders, in seconds
+MIN_INTERVAL = 60
+
+INTERVAL_UNITS = {
+    "m": 60, "min": 60, "minute": 60,
+    "h": 3600, "hr": 3600, "hour": 3600,
+    "d": 86400, "day": 86400,
+    "w": 604800, "week": 604800,
+}
+
+# The full name of each unit, largest first, for showing intervals
+DISPLAY_UNITS = sorted({seconds: max((name for name, x in INTERVAL_UNITS.items()
+    if x == seconds), key=len) for seconds in INTERVAL_UNITS.values()}.items(), reverse=True)
+
+def parse_interval(text: str):
+    """
+    Converts text like "2 hours" or "1 week" to seconds, or None.
+    """
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([a-z]+?)s?", text.strip().lower())
+    if match is None or match.group(2) not in INTERVAL_UNITS:
+        return None
+    return float(match.group(1)) * INTERVAL_UNITS[match.group(2)]
+
+def format_interval(seconds: float):
+    """
+    Converts seconds back to text like "2 weeks", in the largest unit that
+    divides them evenly.
+    """
+    for size, name in DISPLAY_UNITS:
+        if seconds % size == 0 or size == DISPLAY_UNITS[-1][0]:
+            count = seconds / size
+            return name if count == 1 else f"{count:g} {name}s"
 
 class RemindFlags(commands.FlagConverter):
     reason: str = ""
     time: str
-
-class Reminder(object):
-    def __init__(self, ctx: commands.Context, members: commands.Greedy[disnake.Member],
-        reason: str, time: dt.datetime):
-        self.ctx = ctx
-        self.members = members
-        self.time = time
-        self.reason = reason
-    
-    async def send_msg(self):
-        refids = ", ".join(f"<@{x.id}>" for x in self.members)
-        if self.reason == "":
-            await self.ctx.send(f"{refids} Here's your reminder")
-        else:
-            await self.ctx.send(f"{refids} {self.reason}")
-
-    def is_ready(self):
-        return self.time < dt.datetime.now()
+    every: str = ""
 
 class Remind(commands.Cog, name="remind"):
     def __init__(self, bot):
         self.bot = bot
-        self.reminders = []
+        # Holds only (due, id) per reminder, the rest is read when it fires
+        self.timers = TimerHeap(self.fire)
 
-    @tasks.loop(seconds=10)
-    async def send_reminders(self):
-        for reminder in self.reminders:
-            if reminder.is_ready():
-                self.reminders.remove(reminder)
-                await reminder.send_msg()
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if not self.timers.is_running():
+            self.timers.load(await ReminderModel.aio.get_schedule())
+            self.timers.start()
 
-        if len(self.reminders) == 0:
-            self.send_reminders.stop()
+    async def fire(self, id: int, due: float):
+        reminder = await ReminderModel.aio.claim(id, due, self.timers.clock())
+        if reminder is None:
+            # Cancelled, or a stale entry for a rescheduled reminder
+            return
+        if reminder.next_due is not None:
+            self.timers.push(reminder.next_due, reminder.id)
+
+        channel = self.bot.get_channel(reminder.channel_id)
+        if channel is None:
+            channel = await self.bot.fetch_channel(reminder.channel_id)
+
+        refids = ", ".join(f"<@{x}>" for x in reminder.member_ids)
+        if reminder.reason == "":
+            await channel.send(f"{refids} Here's your reminder")
+        else:
+            await channel.send(f"{refids} {reminder.reason}")
 
     @commands.command(name="remind", 
-        usage="remind <member1> <member2> ... reason: <reason (optional)> time: <time info>")
+        usage="remind <member1> <member2> ... reason: <reason (optional)> time: <time info> " \
+            "every: <interval (optional)>")
     async def add_remind(self, ctx: commands.Context, members: commands.Greedy[disnake.Member],
         *, flags: RemindFlags):
         """
         Reminds the list of members of a custom message at a set time.
         'time info' follows example format: "Jan 02 01:30 AM"
+        'interval' repeats the reminder, e.g. "1 day" or "2 weeks"
         """
 
         rtime = dp.parse(flags.time)
-        self.reminders.append(Reminder(ctx, members, flags.reason, rtime))
-        await ctx.send(f"Reminder set for {rtime.strftime('%b %d %I:%M %p')}")
-        if not self.send_reminders.is_running():
-            self.send_reminders.start()
+        if rtime is None:
+            raise commands.UserInputError(message="Couldn't understand that time")
+
+        interval = None
+        if flags.every != "":
+            interval = parse_interval(flags.every)
+            if interval is None or interval < MIN_INTERVAL:
+                raise commands.UserInputError(
+                    message="Interval must look like \"2 hours\" and be at least a minute")
+
+        reminder = await ReminderModel.aio.create(ctx.channel.id, ctx.author.id,
+            [member.id for member in members], flags.reason, rtime.timestamp(), interval)
+        self.timers.push(reminder.due, reminder.id)
+        await ctx.send(f"Reminder {reminder.id} set for {rtime.strftime('%b %d %I:%M %p')}")
+
+    @commands.command(name="reminders", usage="reminders")
+    async def list_reminders(self, ctx: commands.Context):
+        """
+        Lists your upcoming reminders.
+        """
+
+        reminders = await ReminderModel.aio.get_by_author(ctx.author.id)
+        if not reminders:
+            await ctx.reply("You have no reminders set")
+            return
+
+        lines = []
+        for reminder in reminders:
+            due = datetime.fromtimestamp(reminder.due).strftime('%b %d %I:%M %p')
+            line = f"`{reminder.id}` {due}"
+            if reminder.interval:
+                line += f" (every {format_interval(reminder.interval)})"
+            if reminder.reason != "":
+                line += f": {reminder.reason}"
+            lines.append(line)
+
+        embed = disnake.Embed(title="Your reminders", description="\n".join(lines))
+        await ctx.reply(embed=embed)
+
+    @commands.command(name="cancelreminder", usage="cancelreminder <id>")
+    async def cancel_reminder(self, ctx: commands.Context, id: int):
+        """
+        Cancels one of your reminders.
+        """
+
+        if await ReminderModel.aio.delete(id, ctx.author.id):
+            await ctx.reply(f"Reminder {id} cancelled")
+        else:
+            await ctx.reply("You have no reminder with that id")
 
 def setup(bot):
     bot.add_cog(Remind(bot))
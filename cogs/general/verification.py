@@ -6,18 +6,21 @@ Verifies email domain of new members.
 """
 
 import json
+import math
 import os
 import sys
-import random
-import smtplib
-from email.message import EmailMessage
+import time
 
 import disnake
 from disnake.ext import commands
 
 from helpers import email
-from helpers.db_manager import VerificationModel, MemberModel
-from exceptions import SMTPError
+from helpers.cache import LRUCache, MISSING
+from helpers.codes import codes
+from helpers.db_manager import VerificationModel, MemberModel, OutboxModel, VerifCodeModel
+from helpers.outbox import Outbox, SMTPPool
+from helpers.pipeline import MicroBatcher, RateLimitedQueue, TokenBucket
+from helpers.scheduler import Interval
 
 if not os.path.isfile("config.json"):
     sys.exit("'config.json' not found! Please add it and try again.")
@@ -25,24 +28,101 @@ else:
     with open("config.json") as file:
         config = json.load(file)
 
-def send_verif_email(to: str, code: int):
-    email_msg = EmailMessage()
-    email_msg.set_content("Your code is: {}".format(code))
-    email_msg["Subject"] = "Purdue ARC Verification Code"
-    email_msg["From"] = config["smtp_user"]
-    email_msg["To"] = to
+VERIF_SUBJECT = "Purdue ARC Verification Code"
+# Seconds delivered and failed emails are kept in the outbox
+OUTBOX_RETENTION = 7 * 86400
+# Guilds, roles and members fetched over REST when missing from the gateway cache
+rest_cache = LRUCache("verification_rest", maxsize=512, ttl=300)
 
-    s = smtplib.SMTP(config["smtp_server"], config["smtp_port"])
-    s.ehlo()
-    s.starttls()
-    s.login(config["smtp_user"].split("@")[0], config["smtp_password"])
-
-    s.send_message(email_msg)
-    s.quit()
+# Joins written to the database per transaction, and the longest a join waits
+JOIN_BATCH = 200
+JOIN_DELAY = 0.5
+# Welcome DMs per second on average, and the largest burst
+DM_RATE = 1
+DM_BURST = 5
 
 class Verification(commands.Cog, name="verification"):
     def __init__(self, bot):
         self.bot = bot
+        pool = SMTPPool(config["smtp_server"], config["smtp_port"],
+            config["smtp_user"].split("@")[0], config["smtp_password"])
+        self.outbox = Outbox(pool, config["smtp_user"], self.report_delivery)
+
+        bot.scheduler.add_cron("outbox_purge", Interval(86400), self.purge_outbox)
+        bot.scheduler.add_cron("verif_code_purge", Interval(3600), self.purge_codes)
+        # Members already told they're out of attempts
+        self.throttled = set()
+
+        # Join waves are written in batches and welcomed at a steady rate
+        self.joins = MicroBatcher(self.process_joins, JOIN_BATCH, JOIN_DELAY)
+        self.dms = RateLimitedQueue("Welcome DM", TokenBucket(DM_RATE, DM_BURST))
+
+    def cog_unload(self):
+        self.outbox.close()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if not self.outbox.is_running():
+            self.outbox.start()
+
+    async def purge_outbox(self):
+        await OutboxModel.aio.purge(time.time() - OUTBOX_RETENTION)
+
+    async def purge_codes(self):
+        await VerifCodeModel.aio.purge(time.time())
+
+    async def save_code(self, member_id: int):
+        row = codes.row(member_id)
+        if row is None:
+            await VerifCodeModel.aio.delete(member_id)
+        else:
+            await VerifCodeModel.aio.save(*row)
+
+    async def report_delivery(self, message: OutboxModel, status: str):
+        """
+        Tells the member in their DM how sending their code went.
+        """
+        channel = self.bot.get_channel(message.notify_id)
+        if channel is None:
+            channel = await self.bot.fetch_channel(message.notify_id)
+
+        if status == Outbox.SENT:
+            await channel.send("Email sent. " \
+                "**Reply here with your verification code**. " \
+                "If you haven't received it, check your spam folder.")
+        elif status == Outbox.RETRYING:
+            await channel.send("Your email is delayed, I'll keep trying to send it.")
+        else:
+            await channel.send("Email failed to send, contact server admin.")
+
+    async def resolve(self, key, get, fetch):
+        """
+        Returns an object from the gateway cache, then the REST cache, and
+        only then from the API with `fetch()`.
+        """
+        value = get()
+        if value is not None:
+            return value
+        value = rest_cache.get(key)
+        if value is MISSING:
+            value = await fetch()
+            rest_cache.set(key, value)
+        return value
+
+    async def resolve_verification(self, guild_id: int, role_id: int, member_id: int):
+        guild = await self.resolve(("guild", guild_id),
+            lambda: self.bot.get_guild(guild_id),
+            lambda: self.bot.fetch_guild(guild_id))
+
+        async def fetch_role():
+            return disnake.utils.get(await guild.fetch_roles(), id=role_id)
+        role = await self.resolve(("role", guild_id, role_id),
+            lambda: guild.get_role(role_id), fetch_role)
+
+        member = await self.resolve(("member", guild_id, member_id),
+            lambda: guild.get_member(member_id),
+            lambda: guild.fetch_member(member_id))
+        return guild, role, member
 
     async def handle_message(self, msg: disnake.Message):
         """
@@ -51,56 +131,69 @@ class Verification(commands.Cog, name="verification"):
 
         msg_content = msg.content.strip()
 
-        member_verif = None
-        verif_config = None
-        for i in MemberModel.get_all(msg.author.id):
-            verif_config = VerificationModel.get(i.guild_id)
-            if verif_config is None or i.verified == 1:
-                continue
-            member_verif = i
-            break
-
-        if member_verif is None:
-            return        
-
-        if msg_content.isdigit() and int(msg_content) == member_verif.code:
-            # TODO: Handle bizarre circumstance where don't exist
-            guild = self.bot.get_guild(member_verif.guild_id)
-            if guild is None:
-                guild = await self.bot.fetch_guild(member_verif.guild_id)
-            
-            role = guild.get_role(verif_config.role_id)
-            if role is None:
-                role = await self.bot.fetch_role(verif_config.role_id)
-
-            member = guild.get_member(msg.author.id)
-            if member is None:
-                member = await self.bot.fetch_member(msg.author.id)
+        # Every code request or guess spends from the member's budget
+        wait = codes.take_attempt(msg.author.id)
+        if wait:
+            if msg.author.id not in self.throttled:
+                self.throttled.add(msg.author.id)
+                await msg.channel.send("Too many attempts, try again in " \
+                    f"{math.ceil(wait / 60)} minutes.")
+            return
+        self.throttled.discard(msg.author.id)
+
+        pending = await MemberModel.aio.get_pending(msg.author.id)
+        if pending is None:
+            await self.save_code(msg.author.id)
+            return
+        member_verif, verif_config = pending
+        guild_id = member_verif.guild_id
+
+        if msg_content.isdigit() and codes.check(msg.author.id, guild_id, int(msg_content)):
+            await self.save_code(msg.author.id)
+            guild, role, member = await self.resolve_verification(
+                guild_id, verif_config.role_id, msg.author.id)
 
             if role not in member.roles:
                 await member.add_roles(role)
-            member_verif.update_verified(1)
+            await member_verif.aio.update_verified(1)
             await msg.channel.send("You are verified on {}.".format(guild.name))
         elif email.check(msg_content):
             # Handle user DMing valid email
             if msg_content.split("@")[1] == verif_config.domain:
-                code = random.randint(100000, 999999)
-                member_verif.update_code(code)
-
-                try:
-                    send_verif_email(msg_content, code)
-                    await msg.channel.send("Email sent. " \
-                        "**Reply here with your verification code**. " \
-                        "If you haven't received it, check your spam folder.")
-                except Exception as e:
-                    await msg.channel.send("Email failed to send, contact server admin.")
-                    raise SMTPError(e)
+                code = codes.issue(msg.author.id, guild_id)
+                await self.save_code(msg.author.id)
+
+                await self.outbox.send(msg_content, VERIF_SUBJECT,
+                    "Your code is: {}".format(code), msg.channel.id)
             else:
+                await self.save_code(msg.author.id)
                 await msg.channel.send("You need to use a Purdue email.")
-        elif member_verif.code != 0:
-            await msg.channel.send("Invalid code, please try again")
         else:
-            await msg.channel.send("Invalid email, please try again")
+            await self.save_code(msg.author.id)
+            if codes.has_code(msg.author.id, guild_id):
+                await msg.channel.send("Invalid code, please try again")
+            elif msg_content.isdigit():
+                await msg.channel.send("You have no active code, " \
+                    "reply with your email for a new one")
+            else:
+                await msg.channel.send("Invalid email, please try again")
+
+    async def process_joins(self, batch):
+        """
+        Records a batch of (member, enrolling) joins and queues welcome DMs.
+        Members being enrolled in bulk are only messaged if unverified.
+        """
+        rows = await MemberModel.aio.add_many(
+            [(member.id, member.guild.id) for member, _ in batch])
+
+        for (member, enrolling), (_, _, verified) in zip(batch, rows):
+            if member.bot or (enrolling and verified == 1):
+                continue
+            config = await VerificationModel.aio.get(member.guild.id)
+            if config is not None:
+                text = f"Reply here with your @{config.domain} email address " \
+                    f"to be verified on the {member.guild.name}"
+                self.dms.put(lambda member=member, text=text: member.send(text))
 
     @commands.Cog.listener()
     async def on_member_join(self, member: disnake.Member):
@@ -108,13 +201,44 @@ class Verification(commands.Cog, name="verification"):
         DMs user to verify email address is under Purdue domain.
         """
 
-        MemberModel.get_or_create(member.id, member.guild.id)
-        config = VerificationModel.get(member.guild.id)
-        if config is not None:
-            await member.send(
-                f"Reply here with your @{config.domain} email address " \
-                f"to be verified on the {member.guild.name}"
-            )
+        self.joins.add((member, False))
+
+    @commands.command(name="enrollall", usage="enrollall")
+    async def enroll_all(self, ctx: commands.Context):
+        """
+        Asks every unverified member of the server to verify (owner only).
+        """
+
+        if ctx.guild is None:
+            raise commands.NoPrivateMessage(message="Command must be used in a server")
+        if ctx.message.author.id not in config["owners"]:
+            raise commands.MissingPermissions([])
+        if await VerificationModel.aio.get(ctx.guild.id) is None:
+            await ctx.reply("You must configure verification settings first")
+            return
+
+        if not ctx.guild.chunked:
+            await ctx.guild.chunk()
+        members = [member for member in ctx.guild.members if not member.bot]
+        for member in members:
+            self.joins.add((member, True))
+        await ctx.reply(f"Enrolling {len(members)} members, " \
+            "check progress with the onboarding command")
+
+    @commands.command(name="onboarding", usage="onboarding")
+    async def onboarding(self, ctx: commands.Context):
+        """
+        Prints the backlog of joins and welcome DMs still being processed.
+        """
+
+        dms = self.dms.stats()
+        embed = disnake.Embed(title="Onboarding", color=0x42F56C)
+        embed.add_field(name="Joins waiting", value=str(len(self.joins)))
+        embed.add_field(name="Joins recorded", value=str(self.joins.flushed))
+        embed.add_field(name="DMs waiting", value=str(dms["backlog"]))
+        embed.add_field(name="DMs sent", value=str(dms["done"]))
+        embed.add_field(name="DMs failed", value=str(dms["failed"]))
+        await ctx.send(embed=embed)
 
     @commands.command(name="configureverify", usage="configureverify <role> <domain>")
     async def configure(self, ctx: commands.Context, role: disnake.Role, domain: str):
@@ -125,7 +249,7 @@ class Verification(commands.Cog, name="verification"):
         if ctx.guild is None:
             raise commands.NoPrivateMessage(message="Command must be used in a server")
 
-        VerificationModel.configure(ctx.guild.id, role.id, domain)
+        await VerificationModel.aio.configure(ctx.guild.id, role.id, domain)
         await ctx.reply(f"Verification configured for @{domain} domains")
 
     @commands.command(name="verify", usage="verify")
@@ -137,11 +261,12 @@ class Verification(commands.Cog, name="verification"):
         if ctx.guild is None:
             raise commands.NoPrivateMessage(message="Command must be used in a server")
         
-        config = VerificationModel.get(ctx.guild.id)
+        config = await VerificationModel.aio.get(ctx.guild.id)
         if config is not None:
-            member_verif = MemberModel.get_or_create(ctx.author.id, ctx.guild.id)
-            member_verif.update_verified(0)
-            member_verif.update_code(0)
+            member_verif = await MemberModel.aio.get_or_create(ctx.author.id, ctx.guild.id)
+            await member_verif.aio.update_verified(0)
+            codes.discard(ctx.author.id)
+            await self.save_code(ctx.author.id)
             await ctx.message.author.send(
                 "Reply here with your @{} email address.".format(config.domain)
             )
@@ -1,6 +1,132 @@
-import random
+"""
+ARCdle's word lists and the daily solution.
 
-def pick_solution():
-    with open("./helpers/arcdle.txt") as f:
-        lines = f.readlines()
-        return random.choice(lines)
\ No newline at end of file
+Words are packed into integers, five bits per letter, so the solution list
+is a flat array and checking a guess is one set lookup. The day's solution
+comes from the date alone: arcdle.txt lists solutions in the order they're
+played, starting at EPOCH, so every process agrees on the word without
+storing it. The list is append-only. New words go at the end, where they
+don't move any other day's word. Once every word has been played the
+order starts over, and from then on its restart point moves with the
+list's length, so keep words queued ahead of the current day.
+"""
+
+import array
+import datetime
+import logging as log
+import os
+
+WORD_LEN = 5
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Words that can be the solution, in the order they're played
+SOLUTIONS_PATH = os.path.join(HERE, "arcdle.txt")
+# Further words accepted as guesses, any five letters are accepted without it
+GUESSES_PATH = os.path.join(HERE, "arcdle_guesses.txt")
+# Hour in UTC the next day's word starts, midnight EST
+DAY_START = 5
+# The day the first word in the solution list was played
+EPOCH = datetime.date(2026, 9, 21)
+
+def encode(word: str):
+    code = 0
+    for letter in word:
+        code = code << 5 | (ord(letter) - 96)
+    return code
+
+def decode(code: int):
+    letters = []
+    for _ in range(WORD_LEN):
+        letters.append(chr((code & 31) + 96))
+        code >>= 5
+    return "".join(reversed(letters))
+
+# Feedback for one letter, a pattern holds one per letter as a base-3 digit
+GRAY = 0
+YELLOW = 1
+GREEN = 2
+# Number of distinct patterns, and the pattern of a correct guess
+PATTERNS = 3 ** WORD_LEN
+SOLVED = PATTERNS - 1
+
+def score(guess: str, solution: str):
+    """
+    Returns the feedback pattern for guess, the first letter being the
+    lowest digit. Repeated letters are only yellow as many times as the
+    solution has them spare.
+    """
+    spare = [s for g, s in zip(guess, solution) if g != s]
+    pattern = 0
+    for i, (g, s) in enumerate(zip(guess, solution)):
+        if g == s:
+            pattern += GREEN * 3 ** i
+        elif g in spare:
+            spare.remove(g)
+            pattern += YELLOW * 3 ** i
+    return pattern
+
+def digits(pattern: int):
+    """
+    Splits a pattern into per-letter feedback, first letter first.
+    """
+    result = []
+    for _ in range(WORD_LEN):
+        result.append(pattern % 3)
+        pattern //= 3
+    return result
+
+def is_word(word: str):
+    return len(word) == WORD_LEN and word.isascii() and word.isalpha() \
+        and word.islower()
+
+def read_words(path: str):
+    """
+    Returns the valid, distinct words in a file, in order.
+    """
+    words = {}
+    with open(path) as f:
+        for line in f:
+            word = line.strip().lower()
+            if is_word(word):
+                words[word] = None
+    return list(words)
+
+def game_date(now: datetime.datetime = None):
+    """
+    The ARCdle day it is, which changes at DAY_START UTC.
+    """
+    if now is None:
+        now = datetime.datetime.utcnow()
+    return (now - datetime.timedelta(hours=DAY_START)).date()
+
+class WordIndex(object):
+    def __init__(self, solutions, guesses=None):
+        self.solutions = array.array("I", map(encode, solutions))
+        self.allowed = frozenset(self.solutions).union(map(encode, guesses or ()))
+        # Without a guess list, only the word's shape is checked
+        self.strict = guesses is not None
+
+    @classmethod
+    def load(cls, solutions_path: str = SOLUTIONS_PATH, guesses_path: str = GUESSES_PATH):
+        solutions = read_words(solutions_path)
+        if os.path.isfile(guesses_path):
+            guesses = read_words(guesses_path)
+        else:
+            log.warning(f"No ARCdle guess list at {guesses_path}, accepting any word")
+            guesses = None
+        return cls(solutions, guesses)
+
+    def __len__(self):
+        return len(self.solutions)
+
+    def is_allowed(self, word: str):
+        return is_word(word) and (not self.strict or encode(word) in self.allowed)
+
+    def solution(self, day: datetime.date = None):
+        """
+        The solution for `day`, today's if not given.
+        """
+        if day is None:
+            day = game_date()
+        return decode(self.solutions[(day - EPOCH).days % len(self.solutions)])
+
+words = WordIndex.load()
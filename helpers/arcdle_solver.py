@@ -0,0 +1,148 @@
+"""
+Precomputed ARCdle feedback and the analytics built on it.
+
+The pattern every allowed guess gets against every solution is computed
+once with NumPy into a guesses x solutions matrix of base-3 patterns, so
+scoring a guess is a lookup. Hints pick the guess whose patterns split the
+solutions still possible most evenly, i.e. with the most expected
+information, and a day's difficulty is how many guesses that strategy
+needs to find its word.
+
+Benchmark (from the bot's directory):
+    python -m helpers.benchmarks arcdle
+"""
+
+import numpy as np
+
+from helpers.arcdle import PATTERNS, SOLVED, WORD_LEN, WordIndex, decode, encode, score
+
+# Guess rows scored at a time, bounding the temporary arrays' size
+CHUNK = 256
+# Guesses the solver may take before a word counts as unsolved
+MAX_STEPS = 10
+# (most guesses needed, rating) from easiest up
+RATINGS = [
+    (2, "Easy"),
+    (3, "Medium"),
+    (4, "Hard"),
+    (MAX_STEPS, "Very hard"),
+]
+
+def letters(codes: np.ndarray):
+    """
+    Unpacks word codes into an (n, WORD_LEN) array of letter numbers.
+    """
+    shifts = np.arange(WORD_LEN - 1, -1, -1, dtype=np.uint32) * 5
+    return ((codes[:, None] >> shifts) & 31).astype(np.uint8)
+
+def pattern_matrix(guesses: np.ndarray, solutions: np.ndarray):
+    """
+    Returns the pattern of every guess against every solution, given both
+    as letter arrays from `letters`. Matches `arcdle.score`.
+    """
+    matrix = np.empty((len(guesses), len(solutions)), dtype=np.uint8)
+    s = solutions[None, :, :]
+    for start in range(0, len(guesses), CHUNK):
+        g = guesses[start:start + CHUNK, None, :]
+        green = g == s
+        pattern = np.zeros(green.shape[:2], dtype=np.uint8)
+        for i in range(WORD_LEN):
+            letter = g[:, :, i:i + 1]
+            # Copies of the letter the solution has that aren't matched exactly
+            spare = ((s == letter) & ~green).sum(axis=2)
+            # Earlier copies in the guess that already used one up
+            used = ((g[:, :, :i] == letter) & ~green[:, :, :i]).sum(axis=2)
+            yellow = ~green[:, :, i] & (spare > used)
+            pattern += (2 * green[:, :, i] + yellow).astype(np.uint8) * 3 ** i
+        matrix[start:start + CHUNK] = pattern
+    return matrix
+
+class Solver(object):
+    def __init__(self, index: WordIndex):
+        self.solutions = np.array(index.solutions, dtype=np.uint32)
+        self.guesses = np.array(sorted(index.allowed), dtype=np.uint32)
+        self.matrix = pattern_matrix(letters(self.guesses), letters(self.solutions))
+        self.rows = {code: i for i, code in enumerate(self.guesses.tolist())}
+        self.cols = {code: i for i, code in enumerate(self.solutions.tolist())}
+        # Each guess's column as a solution, or -1 if it can't be one
+        self.guess_cols = np.array([self.cols.get(code, -1) for code in self.guesses.tolist()])
+
+    def pattern(self, guess: str, solution: str):
+        row = self.rows.get(encode(guess))
+        col = self.cols.get(encode(solution))
+        if row is None or col is None:
+            return score(guess, solution)
+        return int(self.matrix[row, col])
+
+    def candidates(self, guesses, solution: str):
+        """
+        Returns a mask of the solutions consistent with the feedback the
+        guesses got against solution.
+        """
+        mask = np.ones(len(self.solutions), dtype=bool)
+        for guess in guesses:
+            pattern = self.pattern(guess, solution)
+            row = self.rows.get(encode(guess))
+            if row is not None:
+                mask &= self.matrix[row] == pattern
+            else:
+                mask &= np.array([score(guess, decode(code)) == pattern
+                    for code in self.solutions.tolist()])
+        return mask
+
+    def information(self, mask: np.ndarray):
+        """
+        Returns the expected bits of information of every guess when the
+        solutions in mask are equally likely.
+        """
+        remaining = int(mask.sum())
+        sub = self.matrix[:, mask].astype(np.intp)
+        offsets = np.arange(len(self.guesses), dtype=np.intp)[:, None] * PATTERNS
+        counts = np.bincount((sub + offsets).ravel(),
+            minlength=len(self.guesses) * PATTERNS).reshape(-1, PATTERNS)
+        p = counts / remaining
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return -np.where(counts > 0, p * np.log2(p), 0.0).sum(axis=1)
+
+    def best_guess(self, mask: np.ndarray):
+        """
+        Returns (guess, bits) for the most informative guess, preferring ones
+        that could still be the solution.
+        """
+        bits = self.information(mask)
+        possible = (self.guess_cols >= 0) & mask[self.guess_cols]
+        row = int(np.argmax(bits + possible * 1e-9))
+        return decode(int(self.guesses[row])), float(bits[row])
+
+    def hint(self, guesses, solution: str):
+        """
+        Returns (guess, bits, remaining) for the best next guess.
+        """
+        mask = self.candidates(guesses, solution)
+        guess, bits = self.best_guess(mask)
+        return guess, bits, int(mask.sum())
+
+    def solve(self, solution: str):
+        """
+        Returns how many guesses following hints takes to find solution.
+        """
+        guesses = []
+        mask = np.ones(len(self.solutions), dtype=bool)
+        while len(guesses) < MAX_STEPS:
+            guess, _ = self.best_guess(mask)
+            guesses.append(guess)
+            pattern = self.pattern(guess, solution)
+            if pattern == SOLVED:
+                break
+            mask &= self.matrix[self.rows[encode(guess)]] == pattern
+        return len(guesses)
+
+    def difficulty(self, solution: str):
+        """
+        Returns (rating, steps), steps being the guesses `solve` needs.
+        """
+        steps = self.solve(solution)
+        for most, rating in RATINGS:
+            if steps <= most:
+                return rating, steps
+        return RATINGS[-1][1], steps
@@ -0,0 +1,726 @@
+"""
+Benchmarks for the bot's hot paths, run against a throwaway database.
+
+db_manager connects to the database named in ./config.json when it's
+imported, so each run first moves into a temporary directory with its own
+config and only then imports the modules being measured.
+
+Usage (from the bot's directory):
+    python -m helpers.benchmarks loop        # event-loop lag under .thanks/.balance
+    python -m helpers.benchmarks leaderboard # .leaderboard/.rank with 100k members
+    python -m helpers.benchmarks dms         # routing a burst of DMs in on_message
+    python -m helpers.benchmarks calendar    # .week over 20 calendars on a stub API
+    python -m helpers.benchmarks render      # formatting and paging 10k events
+    python -m helpers.benchmarks search      # .search over a 50k-item backlog
+    python -m helpers.benchmarks reminders   # firing reminders with 100k pending
+    python -m helpers.benchmarks arcdle      # ARCdle solver's patterns and ratings
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def scratch_dir():
+    """
+    Moves into a new temporary directory whose config.json points at an
+    empty database there, returning its path.
+    """
+    workdir = tempfile.mkdtemp(prefix="arc_assistant_bench_")
+    with open(os.path.join(workdir, "config.json"), "w") as f:
+        json.dump({"db": os.path.join(workdir, "bot.db"), "owners": []}, f)
+    os.chdir(workdir)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return workdir
+
+def report(name: str, samples):
+    """
+    Prints the mean, 99th percentile and worst of samples in seconds.
+    """
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(f"{name}: mean {statistics.mean(samples) * 1000:.3f}ms, " \
+        f"p99 {p99 * 1000:.3f}ms, max {samples[-1] * 1000:.3f}ms")
+
+#
+# Event-loop lag under currency commands
+#
+
+# Simulated members sending .thanks and .balance, arriving at a steady rate
+# the way messages come in from the gateway
+LOOP_MEMBERS = 200
+LOOP_COMMANDS = 4000
+LOOP_RATE = 1000
+# A second process (a backup, `python -m helpers.ledger`) holding the write
+# lock this long, this often, so .thanks has to wait for it
+LOCK_HOLD = 0.05
+LOCK_EVERY = 0.25
+# How often the lag probe expects to wake up
+PROBE_INTERVAL = 0.001
+
+async def probe_lag(samples, done: asyncio.Event):
+    """
+    Records how late each short sleep wakes up, which is how long the
+    event loop was blocked.
+    """
+    while not done.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+def hold_write_lock(path: str, stop):
+    """
+    Takes the database's write lock for LOCK_HOLD every LOCK_EVERY seconds
+    until stop is set, from its own connection like another process would.
+    """
+    con = sqlite3.connect(path, isolation_level=None)
+    while not stop.wait(LOCK_EVERY - LOCK_HOLD):
+        con.execute("BEGIN IMMEDIATE")
+        time.sleep(LOCK_HOLD)
+        con.execute("COMMIT")
+    con.close()
+
+def bench_loop():
+    from helpers.db_manager import init_db, config, CurrencyModel
+    init_db()
+    for member_id in range(LOOP_MEMBERS):
+        CurrencyModel.credit(member_id, 100.0, "bench")
+
+    rand = random.Random(1)
+    commands = [(rand.random() < 0.5, *rand.sample(range(LOOP_MEMBERS), 2))
+        for _ in range(LOOP_COMMANDS)]
+
+    async def blocking(is_thanks: bool, sender: int, receiver: int):
+        # Before the async layer, cogs called the models on the event loop
+        if is_thanks:
+            CurrencyModel.transfer(sender, receiver, 1.1, "thanks", received_amt=1.0)
+        else:
+            CurrencyModel.get_balance_or_create(sender)
+
+    async def awaited(is_thanks: bool, sender: int, receiver: int):
+        if is_thanks:
+            await CurrencyModel.aio.transfer(sender, receiver, 1.1, "thanks",
+                received_amt=1.0)
+        else:
+            await CurrencyModel.aio.get_balance_or_create(sender)
+
+    async def run(command):
+        samples = []
+        latencies = []
+        done = asyncio.Event()
+        probe = asyncio.create_task(probe_lag(samples, done))
+
+        async def handle(x):
+            start = time.perf_counter()
+            await command(*x)
+            latencies.append(time.perf_counter() - start)
+
+        tasks = []
+        start = time.perf_counter()
+        for i, x in enumerate(commands):
+            delay = start + i / LOOP_RATE - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(handle(x)))
+        await asyncio.gather(*tasks)
+        done.set()
+        await probe
+        return samples, latencies
+
+    print(f"{LOOP_COMMANDS} .thanks/.balance commands from {LOOP_MEMBERS} members, " \
+        f"{LOOP_RATE} per second")
+    for contended in (False, True):
+        if contended:
+            print(f"another writer holding the lock {LOCK_HOLD * 1000:.0f}ms " \
+                f"every {LOCK_EVERY * 1000:.0f}ms:")
+        for name, command in (("blocking", blocking), ("async", awaited)):
+            stop = threading.Event()
+            holder = threading.Thread(target=hold_write_lock, args=(config["db"], stop))
+            if contended:
+                holder.start()
+            samples, latencies = asyncio.run(run(command))
+            stop.set()
+            if contended:
+                holder.join()
+            report(f"{name} loop lag", samples)
+            report(f"{name} command latency", latencies)
+
+#
+# Leaderboard with many members
+#
+
+BOARD_MEMBERS = 100000
+BOARD_GUILD = 1
+BOARD_QUERIES = 1000
+# Rows on one leaderboard page
+BOARD_PAGE = 15
+
+# What .leaderboard ran before the in-memory index, followed by one
+# balance lookup per row
+RICHEST_QUERY = """
+    SELECT member.rowid, member.member_id, guild_id, verified FROM member
+    JOIN currency ON member.member_id = currency.member_id
+    WHERE member.guild_id = (?)
+    ORDER BY balance desc LIMIT (?)
+"""
+BALANCE_QUERY = "SELECT balance FROM currency WHERE member_id = (?)"
+RANK_QUERY = """
+    SELECT COUNT(*) + 1 FROM member
+    JOIN currency ON member.member_id = currency.member_id
+    WHERE member.guild_id = (?) AND balance > (?)
+"""
+
+def timed(func, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def bench_leaderboard():
+    from helpers.db_manager import init_db, open_db, MemberModel
+    from helpers.leaderboard import leaderboard
+    init_db()
+
+    rand = random.Random(2)
+    with open_db() as c:
+        # Member IDs start at 1, 0 is the bounty escrow account
+        c.executemany("INSERT INTO member VALUES (?, ?, 1)",
+            ((x, BOARD_GUILD) for x in range(1, BOARD_MEMBERS + 1)))
+        c.executemany("INSERT INTO currency VALUES (?, ?)",
+            ((x, round(rand.expovariate(0.1), 2)) for x in range(1, BOARD_MEMBERS + 1)))
+    print(f"{BOARD_MEMBERS} members in one guild")
+
+    start = time.perf_counter()
+    leaderboard.load(MemberModel.get_all_balances())
+    print(f"Index loaded in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    c = open_db()
+    def sql_page():
+        rows = c.execute(RICHEST_QUERY, (BOARD_GUILD, BOARD_PAGE)).fetchall()
+        return [c.execute(BALANCE_QUERY, (row[1],)).fetchone() for row in rows]
+    def sql_rank(member_id: int):
+        balance = c.execute(BALANCE_QUERY, (member_id,)).fetchone()[0]
+        return c.execute(RANK_QUERY, (BOARD_GUILD, balance)).fetchone()
+
+    members = [(rand.randint(1, BOARD_MEMBERS),) for _ in range(BOARD_QUERIES)]
+    report("SQL leaderboard page", timed(sql_page, [()] * 50))
+    report("Index leaderboard page", timed(leaderboard.top,
+        [(BOARD_GUILD, BOARD_PAGE)] * BOARD_QUERIES))
+    report("SQL rank", timed(sql_rank, members[:50]))
+    report("Index rank", timed(lambda x: leaderboard.rank(BOARD_GUILD, x), members))
+    report("Index balance update", timed(leaderboard.update,
+        [(x, round(rand.expovariate(0.1), 2)) for (x,) in members]))
+
+#
+# Routing direct messages
+#
+
+DM_MEMBERS = 5000
+DM_GUILDS = 3
+# Members with an ARCdle game or pending verification
+DM_PLAYERS = 500
+DM_VERIFYING = 500
+DM_BURST = 20000
+
+# What on_message and Verification.handle_message queried per DM before
+# the session registry
+ACTIVE_GAME_QUERY = """
+    SELECT arcdle.rowid, message_id, visible, hidden, status
+    FROM arcdle
+    INNER JOIN member_arcdle on member_arcdle.arcdle_rowid = arcdle.rowid
+    WHERE status=0 AND member_id=(?)
+"""
+MEMBER_GUILDS_QUERY = "SELECT rowid, * FROM member WHERE member_id=(?)"
+VERIFICATION_QUERY = "SELECT * FROM verification WHERE guild_id=(?)"
+
+def bench_dms():
+    from helpers.db_manager import init_db, open_db, ARCdleModel, MemberModel, \
+        VerificationModel
+    from helpers.sessions import sessions
+    init_db()
+
+    rand = random.Random(3)
+    with open_db() as c:
+        c.executemany("INSERT INTO member VALUES (?, ?, ?)",
+            ((x, guild_id, 0 if x < DM_VERIFYING else 1)
+                for x in range(1, DM_MEMBERS + 1) for guild_id in range(DM_GUILDS)))
+    for guild_id in range(DM_GUILDS):
+        VerificationModel.configure(guild_id, 1, "purdue.edu")
+    for member_id in range(DM_MEMBERS - DM_PLAYERS + 1, DM_MEMBERS + 1):
+        ARCdleModel.create_game(member_id, 0, 1, member_id)
+    sessions.load(ARCdleModel.get_active_sessions(), MemberModel.get_unverified())
+
+    burst = [(rand.randint(1, DM_MEMBERS),) for _ in range(DM_BURST)]
+    c = open_db()
+    queries = []
+    c.set_trace_callback(queries.append)
+
+    # Both decide where a DM goes. A game's row is fetched either way once
+    # it's routed, so that isn't timed.
+    def route_queries(member_id: int):
+        if c.execute(ACTIVE_GAME_QUERY, (member_id,)).fetchone() is not None:
+            return "game"
+        for member in c.execute(MEMBER_GUILDS_QUERY, (member_id,)).fetchall():
+            c.execute(VERIFICATION_QUERY, (member[2],)).fetchone()
+        return "verification"
+
+    def route_sessions(member_id: int):
+        if sessions.get_game(member_id) is not None:
+            return "game"
+        if sessions.is_verifying(member_id):
+            return "verification"
+        return "commands"
+
+    print(f"Burst of {DM_BURST} DMs from {DM_MEMBERS} members, " \
+        f"{DM_PLAYERS} playing and {DM_VERIFYING} verifying")
+    for name, route in (("queries", route_queries), ("registry", route_sessions)):
+        queries.clear()
+        samples = timed(route, burst)
+        print(f"{name}: {DM_BURST / sum(samples):.0f} DMs/sec, " \
+            f"{len(queries) / DM_BURST:.1f} queries per DM")
+        report(f"{name} per DM", samples)
+    c.set_trace_callback(None)
+
+#
+# Calendar fetching against a stand-in for the Calendar API
+#
+
+class StubRequest(object):
+    def __init__(self, service, handler, params):
+        self.service = service
+        self.handler = handler
+        self.params = params
+
+    def execute(self, http=None):
+        self.service.requests += 1
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        return self.handler(**self.params)
+
+class StubResponse(object):
+    def __init__(self, status: int):
+        self.status = status
+
+class StubHttpError(Exception):
+    """
+    An error response shaped like googleapiclient's HttpError.
+    """
+
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.resp = StubResponse(status)
+
+class StubResource(object):
+    def __init__(self, service, **handlers):
+        for name, handler in handlers.items():
+            setattr(self, name, lambda handler=handler, **params:
+                StubRequest(service, handler, params))
+
+def parse_timestamp(value: str):
+    from datetime import datetime
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+class StubCalendarService(object):
+    """
+    Stands in for the Calendar API client so calendar code runs offline.
+    Serves `calendars().get` and `events().list` from memory after
+    `latency` seconds, with paging, sync tokens and expired tokens like the
+    real API.
+    """
+
+    def __init__(self, latency: float = 0.0, page_size: int = 250):
+        self.latency = latency
+        self.page_size = page_size
+        # calendar_id -> {event_id: (version, event)}
+        self.events_by_calendar = {}
+        self.version = 0
+        # Sync tokens older than this get a 410 Gone
+        self.oldest_token = 0
+        self.requests = 0
+
+    def add_calendar(self, calendar_id: str, events=()):
+        self.events_by_calendar[calendar_id] = {}
+        for event in events:
+            self.put_event(calendar_id, event)
+
+    def put_event(self, calendar_id: str, event):
+        self.version += 1
+        self.events_by_calendar[calendar_id][event["id"]] = (self.version, event)
+
+    def cancel_event(self, calendar_id: str, event_id: str):
+        self.put_event(calendar_id, {"id": event_id, "status": "cancelled"})
+
+    def expire_tokens(self):
+        self.oldest_token = self.version + 1
+
+    def calendars(self):
+        return StubResource(self, get=self._get_calendar)
+
+    def events(self):
+        return StubResource(self, list=self._list_events)
+
+    def _error(self, status: int):
+        return StubHttpError(status)
+
+    def _get_calendar(self, calendarId: str):
+        if calendarId not in self.events_by_calendar:
+            raise self._error(404)
+        return {"id": calendarId, "summary": f"Calendar {calendarId}",
+            "timeZone": "America/Indiana/Indianapolis"}
+
+    def _list_events(self, calendarId: str, syncToken: str = None, pageToken: str = None,
+        maxResults: int = None, timeMin: str = None, timeMax: str = None, **params):
+        events = self.events_by_calendar.get(calendarId)
+        if events is None:
+            raise self._error(404)
+
+        if syncToken is not None:
+            if int(syncToken) < self.oldest_token:
+                raise self._error(410)
+            items = [event for version, event in events.values() if version > int(syncToken)]
+        else:
+            items = [event for _, event in events.values() if event.get("status") != "cancelled"]
+            if timeMin is not None:
+                items = [x for x in items if stub_time(x["end"]) > parse_timestamp(timeMin)]
+            if timeMax is not None:
+                items = [x for x in items if stub_time(x["start"]) < parse_timestamp(timeMax)]
+            items.sort(key=lambda x: stub_time(x["start"]))
+
+        size = min(maxResults or self.page_size, self.page_size)
+        offset = int(pageToken or 0)
+        result = {"items": items[offset:offset + size]}
+        if offset + size < len(items):
+            result["nextPageToken"] = str(offset + size)
+        else:
+            result["nextSyncToken"] = str(self.version)
+        return result
+
+def stub_time(when):
+    if "dateTime" in when:
+        return parse_timestamp(when["dateTime"])
+    return parse_timestamp(when["date"] + "T00:00:00+00:00")
+
+def stub_event(calendar_id: str, n: int, start: float, length: float = 3600):
+    """
+    Makes a Calendar API event starting at the `start` timestamp.
+    """
+    from datetime import datetime, timezone
+    def when(timestamp):
+        return {"dateTime": datetime.fromtimestamp(int(timestamp), timezone.utc).isoformat()}
+    return {
+        "id": f"{calendar_id}-{n}",
+        "summary": f"Meeting {n}",
+        "htmlLink": f"https://calendar.google.com/event?eid={calendar_id}-{n}",
+        "start": when(start),
+        "end": when(start + length),
+    }
+
+CAL_CALENDARS = 20
+CAL_EVENTS = 50
+# Seconds a Calendar API round trip takes
+CAL_LATENCY = 0.15
+CAL_REPEATS = 20
+
+def bench_calendar():
+    from datetime import datetime, timedelta, timezone
+    from helpers import calendar_util
+    from helpers.db_manager import init_db
+    init_db()
+
+    rand = random.Random(5)
+    now = time.time()
+    stub = StubCalendarService(latency=CAL_LATENCY)
+    calendar_ids = [f"calendar{i}" for i in range(CAL_CALENDARS)]
+    for calendar_id in calendar_ids:
+        stub.add_calendar(calendar_id, [stub_event(calendar_id, n,
+            now + rand.uniform(0, 7 * calendar_util.DAY)) for n in range(CAL_EVENTS)])
+    calendar_util._service = (stub, lambda: None)
+    print(f".week over {CAL_CALENDARS} calendars of {CAL_EVENTS} events, " \
+        f"{CAL_LATENCY * 1000:.0f}ms per API request")
+
+    def fetch_sequentially():
+        # Before the shared client, each calendar was fetched in turn on the
+        # event loop (the per-call client rebuild isn't counted)
+        start = datetime.now(timezone.utc)
+        end = start + timedelta(days=7)
+        events = []
+        for calendar_id in calendar_ids:
+            events.extend(stub.events().list(calendarId=calendar_id,
+                timeMin=start.isoformat(), timeMax=end.isoformat(),
+                singleEvents=True, orderBy="startTime").execute()["items"])
+        return events
+
+    start = time.perf_counter()
+    fetch_sequentially()
+    print(f"Sequential fetch: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    async def week():
+        start = time.perf_counter()
+        events = await calendar_util.collect_week(calendar_ids)
+        return time.perf_counter() - start, len(events)
+
+    async def run():
+        elapsed, count = await week()
+        print(f"First .week, syncing every calendar concurrently: " \
+            f"{elapsed * 1000:.0f}ms for {count} events")
+        report("Cached .week", [(await week())[0] for _ in range(CAL_REPEATS)])
+
+        start = time.perf_counter()
+        await calendar_util.sync_calendars(calendar_ids)
+        print(f"Incremental sync of every calendar: " \
+            f"{(time.perf_counter() - start) * 1000:.0f}ms")
+
+    asyncio.run(run())
+
+#
+# Rendering calendar events into pages
+#
+
+RENDER_EVENTS = 10000
+RENDER_REPEATS = 20
+
+def legacy_calendar_msg(calendar_event):
+    """
+    construct_calendar_msg as it was before the shared paginator, parsing
+    with strptime and building each format string per call.
+    """
+    from datetime import datetime
+    if 'date' in calendar_event['start']:
+        start_date = datetime.strptime(calendar_event['start']['date'], '%Y-%m-%d')
+        end_date = datetime.strptime(calendar_event['end']['date'], '%Y-%m-%d')
+        date_msg = datetime.strftime(start_date, "%b %d ")
+        if start_date.date() != end_date.date():
+            date_msg += datetime.strftime(end_date, "to %b %d")
+    else:
+        start_datetime = datetime.strptime(
+            calendar_event['start']['dateTime'][:-6], '%Y-%m-%dT%H:%M:%S')
+        end_datetime = datetime.strptime(
+            calendar_event['end']['dateTime'][:-6], '%Y-%m-%dT%H:%M:%S')
+        date_msg = datetime.strftime(start_datetime, "%b %d from %I:%M %p ")
+        if start_datetime.date() != end_datetime.date():
+            date_msg += datetime.strftime(end_datetime, "to %b %d %I:%M %p")
+        else:
+            date_msg += datetime.strftime(end_datetime, "to %I:%M %p")
+    return '[{name}]({event_url})\n {date_msg}'.format(
+        name=calendar_event['summary'],
+        event_url=calendar_event['htmlLink'],
+        date_msg=date_msg
+    )
+
+def bench_render():
+    from helpers import calendar_util
+    from helpers.paginator import paginate
+
+    rand = random.Random(15)
+    now = time.time()
+    events = [stub_event("render", n, now + rand.uniform(0, 7 * calendar_util.DAY),
+        length=rand.choice([1800, 3600, calendar_util.DAY + 3600]))
+        for n in range(RENDER_EVENTS)]
+    print(f"Rendering {RENDER_EVENTS} events")
+
+    def one_description():
+        # Before, every event went into a single description, which Discord
+        # rejects past 4096 characters
+        return "\n\n".join(legacy_calendar_msg(event) for event in events)
+
+    def first_page():
+        return next(paginate(map(calendar_util.construct_calendar_msg, events),
+            sep="\n\n"))
+
+    def every_page():
+        return list(paginate(map(calendar_util.construct_calendar_msg, events),
+            sep="\n\n"))
+
+    pages = every_page()
+    print(f"{len(pages)} pages, largest {max(map(len, pages))} characters, " \
+        f"against {len(one_description())} in one description")
+    report("Formatting into one description", timed(one_description,
+        [()] * RENDER_REPEATS))
+    report("First page, as .week sends it", timed(first_page, [()] * RENDER_REPEATS))
+    report("Every page, as digests send them", timed(every_page, [()] * RENDER_REPEATS))
+
+#
+# Searching the backlog
+#
+
+SEARCH_ITEMS = 50000
+SEARCH_QUERIES = 200
+SEARCH_LIMIT = 10
+SEARCH_VOCABULARY = 5000
+
+# How items were found before the trigram index
+LIKE_QUERY = "SELECT * FROM backlog WHERE item LIKE (?) ORDER BY id LIMIT (?)"
+
+def misspell(rand: random.Random, text: str):
+    """
+    Swaps two neighbouring letters somewhere in text.
+    """
+    i = rand.randrange(len(text) - 1)
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+def bench_search():
+    from helpers.db_manager import init_db, open_db, BacklogModel
+    init_db()
+
+    rand = random.Random(23)
+    words = ["".join(rand.choice("bcdfghjklmnprstvw") + rand.choice("aeiou")
+        for _ in range(rand.randint(2, 4))) for _ in range(SEARCH_VOCABULARY)]
+    items = [" ".join(rand.sample(words, rand.randint(4, 8)))
+        for _ in range(SEARCH_ITEMS)]
+    with open_db() as c:
+        c.executemany("INSERT INTO backlog(item) VALUES (?)", ((x,) for x in items))
+    print(f"{SEARCH_ITEMS} backlog items, {SEARCH_QUERIES} queries of each kind")
+
+    # (id of the item a query comes from, query). Words are shared by more
+    # items than a search shows, so most word searches won't find theirs.
+    single = []
+    exact = []
+    for n in rand.sample(range(SEARCH_ITEMS), SEARCH_QUERIES):
+        item = items[n].split()
+        i = rand.randrange(len(item) - 1)
+        single.append((n + 1, item[i]))
+        exact.append((n + 1, " ".join(item[i:i + 2])))
+    typos = [(id, misspell(rand, query)) for id, query in exact]
+
+    c = open_db()
+    def like(query: str):
+        return [row[0] for row in
+            c.execute(LIKE_QUERY, ("%" + query + "%", SEARCH_LIMIT)).fetchall()]
+    def fts(query: str):
+        return [x.id for x in BacklogModel.search(query, SEARCH_LIMIT)]
+
+    for name, search in (("LIKE", like), ("FTS", fts)):
+        for kind, queries in (("word", single), ("phrase", exact),
+            ("misspelt phrase", typos)):
+            samples = []
+            found = 0
+            for id, query in queries:
+                start = time.perf_counter()
+                ids = search(query)
+                samples.append(time.perf_counter() - start)
+                found += id in ids
+            report(f"{name} {kind}, found {found}/{len(queries)}", samples)
+
+#
+# Firing reminders
+#
+
+REMINDERS = 100000
+# Reminders coming due during the run, over REMINDER_WINDOW seconds
+REMINDERS_DUE = 1000
+REMINDER_WINDOW = 3.0
+
+def bench_reminders():
+    from helpers.db_manager import init_db, open_db, ReminderModel
+    from helpers.scheduler import TimerHeap
+    init_db()
+
+    rand = random.Random(10)
+    start = time.time() + 1
+    due = [start + rand.uniform(0, REMINDER_WINDOW) for _ in range(REMINDERS_DUE)]
+    due += [start + rand.uniform(3600, 30 * 86400) for _ in range(REMINDERS - REMINDERS_DUE)]
+    with open_db() as c:
+        c.executemany("INSERT INTO reminder(channel_id, author_id, member_ids, " \
+            "reason, due, interval) VALUES (1, 1, '1', '', ?, ?)",
+            ((x, 86400 if i % 2 else None) for i, x in enumerate(due)))
+    print(f"{REMINDERS} pending reminders, {REMINDERS_DUE} due over " \
+        f"{REMINDER_WINDOW:g}s, half of them repeating")
+
+    lateness = []
+    async def fire(id: int, fire_at: float):
+        reminder = await ReminderModel.aio.claim(id, fire_at, time.time())
+        if reminder is None:
+            return
+        if reminder.next_due is not None:
+            timers.push(reminder.next_due, reminder.id)
+        lateness.append(time.time() - fire_at)
+
+    async def run():
+        load_start = time.perf_counter()
+        timers.load(await ReminderModel.aio.get_schedule())
+        print(f"Loaded the schedule in {(time.perf_counter() - load_start) * 1000:.0f}ms")
+        timers.start()
+        while len(lateness) < REMINDERS_DUE:
+            await asyncio.sleep(0.1)
+        timers.task.cancel()
+
+    timers = TimerHeap(fire)
+    asyncio.run(run())
+    report("Time from due to claimed", lateness)
+
+#
+# ARCdle hints and difficulty
+#
+
+# Solutions rated by following hints, each a few hundred milliseconds
+ARCDLE_RATED = 20
+
+def bench_arcdle():
+    import numpy as np
+    from helpers.arcdle import decode, score, words
+    from helpers.arcdle_solver import RATINGS, Solver
+
+    start = time.perf_counter()
+    solver = Solver(words)
+    elapsed = time.perf_counter() - start
+    guesses, solutions = solver.matrix.shape
+    print(f"NumPy: {guesses} guesses x {solutions} solutions in {elapsed * 1000:.1f}ms")
+
+    guess_words = [decode(code) for code in solver.guesses.tolist()]
+    solution_words = [decode(code) for code in solver.solutions.tolist()]
+    start = time.perf_counter()
+    expected = [[score(g, s) for s in solution_words] for g in guess_words]
+    elapsed = time.perf_counter() - start
+    print(f"Python: same matrix in {elapsed * 1000:.1f}ms")
+    if not np.array_equal(solver.matrix, np.array(expected, dtype=np.uint8)):
+        raise SystemExit("NumPy and Python patterns differ")
+
+    rated = random.Random(25).sample(solution_words, min(ARCDLE_RATED, solutions))
+    samples = []
+    ratings = []
+    for solution in rated:
+        start = time.perf_counter()
+        ratings.append(solver.difficulty(solution)[0])
+        samples.append(time.perf_counter() - start)
+    counts = ", ".join(f"{r}: {ratings.count(r)}" for _, r in RATINGS)
+    report(f"Rating {len(rated)} solutions ({counts})", samples)
+
+BENCHMARKS = {
+    "arcdle": bench_arcdle,
+    "calendar": bench_calendar,
+    "dms": bench_dms,
+    "leaderboard": bench_leaderboard,
+    "loop": bench_loop,
+    "reminders": bench_reminders,
+    "render": bench_render,
+    "search": bench_search,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a benchmark on a scratch database.")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    workdir = scratch_dir()
+    try:
+        BENCHMARKS[args.benchmark]()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Bounded in-memory caches for hot database lookups.
+"""
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by LRUCache.get on a miss, since None is a valid cached value
+MISSING = object()
+
+# Every cache by name, for reporting hit/miss counters
+caches = {}
+
+class LRUCache(object):
+    """
+    Least-recently-used cache with an optional time-to-live per entry.
+
+    `generation` changes on every invalidation, so a value read from the
+    database before an invalidation can be dropped instead of cached.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = None,
+        clock=time.monotonic):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        caches[name] = self
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires > self.clock():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.entries[key]
+            self.misses += 1
+            return MISSING
+
+    def set(self, key, value, generation: int = None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            expires = None if self.ttl is None else self.clock() + self.ttl
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses,
+                "size": len(self.entries), "maxsize": self.maxsize}
+
+def cached(cache: LRUCache):
+    """
+    Read-through caching for a function keyed by its positional args.
+    The cache is exposed as `func.cache` so awaited model calls can answer
+    hits without leaving the event loop.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            value = cache.get(args)
+            if value is MISSING:
+                generation = cache.generation
+                value = func(*args)
+                cache.set(args, value, generation)
+            return value
+        wrapper.cache = cache
+        return wrapper
+    return decorator
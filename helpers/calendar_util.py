@@ -1,15 +1,40 @@
-from datetime import datetime, timedelta
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 import json
+import logging as log
 import os
 import sys
+import threading
+import time
 from typing import List
 
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from google.oauth2 import service_account
-from helpers.db_manager import CalendarModel
+from helpers.db_manager import CalendarEventModel
 
-TIMEZONE_LEN = 6
+# Length of "YYYY-MM-DDTHH:MM:SS", the part of a dateTime before its offset
+DATETIME_LEN = 19
+
+EVENT_TEMPLATE = '[{name}]({event_url})\n {date_msg}'.format
+DATE_FORMAT = "%b %d "
+DATE_RANGE_FORMAT = "to %b %d"
+DATETIME_FORMAT = "%b %d from %I:%M %p "
+DATETIME_RANGE_FORMAT = "to %b %d %I:%M %p"
+TIME_RANGE_FORMAT = "to %I:%M %p"
+
+# Seconds before a single Calendar API request is abandoned
+REQUEST_TIMEOUT = 10
+# Calendar API requests in flight at once
+MAX_REQUESTS = 8
+
+DAY = 86400
+# Events that ended longer ago than this are dropped from the local cache
+KEEP_PAST = DAY
+
+_service = None
+_service_lock = threading.Lock()
+# httplib2 connections aren't thread-safe, so each worker gets its own
+_local = threading.local()
+_executor = ThreadPoolExecutor(max_workers=MAX_REQUESTS, thread_name_prefix="gcal")
 
 def construct_calendar_msg(calendar_event):
     """
@@ -24,52 +49,32 @@ def construct_calendar_msg(calendar_event):
 
     if 'date' in calendar_event['start']:
         # Convert date strings to datetime objects
-        start_date = datetime.strptime(
-            calendar_event['start']['date'],
-            '%Y-%m-%d'
-        )
-        end_date = datetime.strptime(
-            calendar_event['end']['date'],
-            '%Y-%m-%d'
-        )
+        start_date = datetime.fromisoformat(calendar_event['start']['date'])
+        end_date = datetime.fromisoformat(calendar_event['end']['date'])
 
         # List first day
-        date_msg = datetime.strftime(
-            start_date, "%b %d "
-        )
+        date_msg = start_date.strftime(DATE_FORMAT)
 
         # If event lasts more than one day, state range
         if start_date.date() != end_date.date():
-            date_msg += datetime.strftime(
-                end_date, "to %b %d"
-            )
+            date_msg += end_date.strftime(DATE_RANGE_FORMAT)
     else:
-        # Convert date strings to datetime objects
-        start_datetime = datetime.strptime(
-            calendar_event['start']['dateTime'][:-TIMEZONE_LEN],
-            '%Y-%m-%dT%H:%M:%S'
-        )
-        end_datetime = datetime.strptime(
-            calendar_event['end']['dateTime'][:-TIMEZONE_LEN],
-            '%Y-%m-%dT%H:%M:%S'
-        )
+        # Convert date strings to datetime objects, ignoring the UTC offset
+        start_datetime = datetime.fromisoformat(
+            calendar_event['start']['dateTime'][:DATETIME_LEN])
+        end_datetime = datetime.fromisoformat(
+            calendar_event['end']['dateTime'][:DATETIME_LEN])
 
         # List first day
-        date_msg = datetime.strftime(
-            start_datetime, "%b %d from %I:%M %p "
-        )
+        date_msg = start_datetime.strftime(DATETIME_FORMAT)
 
         # If event lasts more than one day, append date end-point
         if start_datetime.date() != end_datetime.date():
-            date_msg += datetime.strftime(
-                end_datetime, "to %b %d %I:%M %p"
-            )
+            date_msg += end_datetime.strftime(DATETIME_RANGE_FORMAT)
         else:
-            date_msg += datetime.strftime(
-                end_datetime, "to %I:%M %p"
-            )
+            date_msg += end_datetime.strftime(TIME_RANGE_FORMAT)
 
-    description = '[{name}]({event_url})\n {date_msg}'.format(
+    description = EVENT_TEMPLATE(
         name=calendar_event['summary'],
         event_url=calendar_event['htmlLink'],
         date_msg=date_msg
@@ -77,63 +82,199 @@ def construct_calendar_msg(calendar_event):
     return description
 
 
-def create_service():
-    """Initilizes Google Service account from env json"""
+def load_credentials():
+    """Loads Google Service account credentials from env json"""
+    from google.oauth2 import service_account
     if not os.path.isfile("config.json"):
         sys.exit("'config.json' not found! Please add it and try again.")
     else:
         with open("config.json") as file:
             config = json.load(file)
     info = config["google_service"]
-    creds = service_account.Credentials.from_service_account_info(info)
-    return build('calendar', 'v3', credentials=creds)
+    return service_account.Credentials.from_service_account_info(info)
 
-def get_calendar_name(calendar_id: str):
+def create_service(creds=None):
+    """Initilizes Google Service account from env json"""
+    from googleapiclient.discovery import build
+    if creds is None:
+        creds = load_credentials()
+    return build('calendar', 'v3', credentials=creds, cache_discovery=False)
+
+def connect(creds):
+    """
+    Opens an authorized HTTP connection for one worker thread.
+    """
+    import google_auth_httplib2
+    import httplib2
+    return google_auth_httplib2.AuthorizedHttp(creds,
+        http=httplib2.Http(timeout=REQUEST_TIMEOUT)
+    )
+
+def get_service():
     """
-    Gets name associated with a calendar id.
+    Returns the Calendar service and a function opening connections for
+    it, building them on first use only.
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                creds = load_credentials()
+                _service = (create_service(creds), lambda: connect(creds))
+    return _service
+
+def http_status(error: Exception):
+    """
+    Returns the HTTP status of a Calendar API error response, or None if
+    the request failed some other way.
+    """
+    return getattr(getattr(error, "resp", None), "status", None)
+
+def _execute(request):
+    """
+    Runs a prepared request on this worker thread's own connection.
+    """
+    http = getattr(_local, "http", None)
+    if http is None:
+        _, open_connection = get_service()
+        http = open_connection()
+        _local.http = http
+    return request.execute(http=http)
+
+async def _fetch(build_request):
+    """
+    Builds and runs a request off the event loop, giving up after
+    REQUEST_TIMEOUT seconds.
+    """
+    loop = asyncio.get_running_loop()
+    def run():
+        service, _ = get_service()
+        return _execute(build_request(service))
+    return await asyncio.wait_for(loop.run_in_executor(_executor, run),
+        timeout=REQUEST_TIMEOUT)
+
+async def get_calendar_meta(calendar_id: str):
+    """
+    Gets the (name, timezone) of a calendar, or None if it can't be read.
     """
     try:
-        calendar_api = create_service().calendars()
-        calendar = calendar_api.get(calendarId=calendar_id).execute()
-        return calendar['summary']
-    except HttpError:
+        calendar = await _fetch(lambda service: service.calendars().get(
+            calendarId=calendar_id))
+        return calendar['summary'], calendar.get('timeZone')
+    except (asyncio.TimeoutError, OSError) as e:
+        log.warning(f"Couldn't get name of calendar {calendar_id}: {e!r}")
+        return None
+    except Exception as e:
+        if http_status(e) is None:
+            raise
         return None
 
-def collect_today(calendar_ids: List[str]):
+def parse_time(when) -> float:
     """
-    Gets events within 24 hours of current time.
+    Converts an event's start or end to a UTC timestamp. All-day events
+    are taken to start at midnight UTC.
+    """
+    if 'dateTime' in when:
+        return datetime.fromisoformat(when['dateTime'].replace('Z', '+00:00')).timestamp()
+    return datetime.strptime(when['date'], '%Y-%m-%d') \
+        .replace(tzinfo=timezone.utc).timestamp()
+
+def to_row(event):
+    """
+    Converts a Calendar API event to an (event_id, start, end, data) row,
+    keeping only the fields construct_calendar_msg needs.
+    """
+    data = {key: event[key] for key in ('htmlLink', 'start', 'end')}
+    data['summary'] = event.get('summary', '(No title)')
+    return (event['id'], parse_time(event['start']), parse_time(event['end']),
+        json.dumps(data))
+
+async def sync_calendar(calendar_id: str, sync_token: str = None):
     """
-    start = datetime.utcnow()
-    end = start + timedelta(1)
+    Pulls a calendar's changes since `sync_token` into the local cache, or
+    all of its current events if there's no token or it has expired.
+    """
+    cutoff = time.time() - KEEP_PAST
+    events = {}
+    deleted = set()
+    page_token = None
+    while True:
+        params = {"calendarId": calendar_id, "singleEvents": True, "maxResults": 2500}
+        if sync_token is not None:
+            params["syncToken"] = sync_token
+        else:
+            # Old events aren't needed, and incremental syncs can't filter by time
+            params["timeMin"] = datetime.fromtimestamp(cutoff, timezone.utc).isoformat()
+        if page_token is not None:
+            params["pageToken"] = page_token
 
-    events_api = create_service().events()
-    events = []
-    for calendar_id in calendar_ids:
         try:
-            events_result = events_api.list(calendarId=calendar_id,
-                timeMin=start.isoformat() + 'Z', timeMax=end.isoformat() + 'Z',
-                singleEvents=True, orderBy='startTime').execute()
-        except HttpError:
-            continue
-        events.extend(events_result.get('items', []))
-    return events
+            result = await _fetch(lambda service: service.events().list(**params))
+        except Exception as e:
+            if http_status(e) == 410 and sync_token is not None:
+                # Token expired, Google requires a full resync
+                sync_token = None
+                page_token = None
+                events.clear()
+                deleted.clear()
+                continue
+            raise
+
+        for event in result.get('items', []):
+            if event.get('status') == 'cancelled':
+                events.pop(event['id'], None)
+                deleted.add(event['id'])
+                continue
+            row = to_row(event)
+            if row[2] < cutoff:
+                events.pop(event['id'], None)
+                deleted.add(event['id'])
+            else:
+                deleted.discard(event['id'])
+                events[event['id']] = row
 
+        page_token = result.get('nextPageToken')
+        if page_token is None:
+            break
 
-def collect_week(calendar_ids: List[str]):
+    await CalendarEventModel.aio.apply_sync(calendar_id, sync_token is None,
+        list(events.values()), deleted, result.get('nextSyncToken'))
+
+async def sync_calendars(calendar_ids: List[str], only_new: bool = False):
     """
-    Collects n google calendar events within a week of current time.
+    Syncs every calendar concurrently, or only ones never synced before.
+    Failures are logged and leave that calendar's cache as it was.
     """
-    start = datetime.utcnow()
-    end = start + timedelta(days=7)
+    tokens = await CalendarEventModel.aio.get_sync_tokens()
+    if only_new:
+        calendar_ids = [x for x in calendar_ids if x not in tokens]
 
-    events_api = create_service().events()
-    events = []
-    for calendar_id in calendar_ids:
-        try:
-            events_result = events_api.list(calendarId=calendar_id,
-                timeMin=start.isoformat() + 'Z', timeMax=end.isoformat() + 'Z',
-                singleEvents=True, orderBy='startTime').execute()
-        except HttpError:
-            continue
-        events.extend(events_result.get('items', []))
-    return events
+    results = await asyncio.gather(
+        *(sync_calendar(x, tokens.get(x)) for x in calendar_ids),
+        return_exceptions=True
+    )
+    for calendar_id, result in zip(calendar_ids, results):
+        if isinstance(result, Exception):
+            log.warning(f"Couldn't sync calendar {calendar_id}: {result!r}")
+
+async def collect_events(calendar_ids: List[str], start: float, end: float):
+    """
+    Reads events between start and end from the local cache, syncing
+    calendars that haven't been fetched yet first.
+    """
+    await sync_calendars(calendar_ids, only_new=True)
+    return await CalendarEventModel.aio.get_range(calendar_ids, start, end)
+
+async def collect_today(calendar_ids: List[str]):
+    """
+    Gets events within 24 hours of current time.
+    """
+    start = time.time()
+    return await collect_events(calendar_ids, start, start + DAY)
+
+async def collect_week(calendar_ids: List[str]):
+    """
+    Collects n google calendar events within a week of current time.
+    """
+    start = time.time()
+    return await collect_events(calendar_ids, start, start + 7 * DAY)
@@ -0,0 +1,150 @@
+"""
+In-memory store of pending verification codes and guess budgets.
+
+Each member has at most one live code, which expires after CODE_TTL, and a
+token bucket that every code request or guess draws from. Entries are
+dropped once their code has expired and their bucket has refilled. A heap
+ordered by that time lets each operation sweep a few expired entries, so
+cleanup never scans the whole store. Loaded once at startup from the
+verif_code table; callers persist entries with `row()` after changing them.
+"""
+
+import heapq
+import random
+import time
+
+from helpers.pipeline import TokenBucket
+
+# Seconds a verification code stays valid
+CODE_TTL = 15 * 60
+# Guesses or code requests a member can make in a burst
+ATTEMPTS = 5
+# Attempts regained per second, one every two minutes
+REFILL_RATE = 1 / 120
+# Expired entries removed per operation
+SWEEP_BATCH = 16
+
+class Entry(object):
+    __slots__ = ("guild_id", "code", "code_expires", "bucket")
+
+    def __init__(self, guild_id: int, code: int, code_expires: float, bucket: TokenBucket):
+        self.guild_id = guild_id
+        self.code = code
+        self.code_expires = code_expires
+        self.bucket = bucket
+
+    def expires(self):
+        bucket = self.bucket
+        refilled = bucket.updated + (bucket.capacity - bucket.tokens) / bucket.rate
+        return max(self.code_expires, refilled)
+
+class CodeStore(object):
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.entries = {}
+        # (expires, member_id), may hold stale times for extended entries
+        self.expiry = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _bucket(self, tokens: float = ATTEMPTS, updated: float = None):
+        bucket = TokenBucket(REFILL_RATE, ATTEMPTS, clock=self.clock)
+        bucket.tokens = tokens
+        if updated is not None:
+            bucket.updated = updated
+        return bucket
+
+    def load(self, rows):
+        """
+        Rebuilds from (member_id, guild_id, code, code_expires, tokens,
+        updated) rows.
+        """
+        self.entries = {}
+        for member_id, guild_id, code, code_expires, tokens, updated in rows:
+            self.entries[member_id] = Entry(guild_id, code, code_expires,
+                self._bucket(tokens, updated))
+        self.expiry = [(entry.expires(), member_id)
+            for member_id, entry in self.entries.items()]
+        heapq.heapify(self.expiry)
+
+    def _sweep(self):
+        now = self.clock()
+        for _ in range(SWEEP_BATCH):
+            if not self.expiry or self.expiry[0][0] > now:
+                return
+            _, member_id = heapq.heappop(self.expiry)
+            entry = self.entries.get(member_id)
+            if entry is not None and entry.expires() <= now:
+                del self.entries[member_id]
+
+    def _entry(self, member_id: int):
+        entry = self.entries.get(member_id)
+        if entry is None:
+            entry = Entry(None, None, 0, self._bucket())
+            self.entries[member_id] = entry
+        return entry
+
+    def _touch(self, member_id: int, entry: Entry):
+        heapq.heappush(self.expiry, (entry.expires(), member_id))
+
+    def take_attempt(self, member_id: int):
+        """
+        Spends one attempt, returning 0 or the seconds until one is free.
+        """
+        self._sweep()
+        entry = self._entry(member_id)
+        wait = entry.bucket.take()
+        if not wait:
+            self._touch(member_id, entry)
+        return wait
+
+    def issue(self, member_id: int, guild_id: int):
+        """
+        Creates a new code for the member, replacing any earlier one.
+        """
+        self._sweep()
+        entry = self._entry(member_id)
+        entry.guild_id = guild_id
+        entry.code = random.randint(100000, 999999)
+        entry.code_expires = self.clock() + CODE_TTL
+        self._touch(member_id, entry)
+        return entry.code
+
+    def has_code(self, member_id: int, guild_id: int):
+        entry = self.entries.get(member_id)
+        return entry is not None and entry.guild_id == guild_id \
+            and entry.code is not None and entry.code_expires > self.clock()
+
+    def check(self, member_id: int, guild_id: int, code: int):
+        """
+        Whether `code` is the member's live code for the guild. A correct
+        code is used up.
+        """
+        if not self.has_code(member_id, guild_id) or self.entries[member_id].code != code:
+            return False
+        self.discard(member_id)
+        return True
+
+    def discard(self, member_id: int):
+        """
+        Forgets the member's code, keeping their attempt budget.
+        """
+        entry = self.entries.get(member_id)
+        if entry is not None:
+            entry.guild_id = None
+            entry.code = None
+            entry.code_expires = 0
+
+    def row(self, member_id: int):
+        """
+        Returns the member's entry as a row for the verif_code table, or
+        None if there's nothing worth keeping.
+        """
+        entry = self.entries.get(member_id)
+        if entry is None or entry.expires() <= self.clock():
+            return None
+        return (member_id, entry.guild_id, entry.code, entry.code_expires,
+            entry.bucket.tokens, entry.bucket.updated, entry.expires())
+
+codes = CodeStore()
@@ -1,7 +1,21 @@
+import asyncio
+import functools
 import sqlite3
 import os
 import sys
 import json
+import logging as log
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from helpers import migrations
+from helpers.cache import LRUCache, MISSING, cached
+from helpers.emoji import emoji_key
+from helpers.leaderboard import leaderboard
+from helpers.search import CANDIDATES, MIN_QUERY, fuzzy_query, quote, rank, trigrams
+from helpers.sessions import sessions
 
 if not os.path.isfile("config.json"):
     sys.exit("'config.json' not found! Please add it and try again.")
@@ -9,55 +23,275 @@ else:
     with open("config.json") as file:
         config = json.load(file)
 
+#
+# Connection management
+#
+
+POOL_DEFAULTS = {
+    "readers": 4,
+    "busy_timeout": 10000,
+    "cache_size": -16000,
+    "mmap_size": 268435456,
+    "cached_statements": 256,
+    "write_batch": 64,
+}
+pool_config = {**POOL_DEFAULTS, **config.get("db_pool", {})}
+
+# Each thread keeps one long-lived connection. Threads in the reader pool
+# get query-only connections, every other thread gets a writer connection.
+_local = threading.local()
+
+class WriterConnection(sqlite3.Connection):
+    """
+    Writer connection whose commits can be deferred, letting the writer
+    thread commit a whole batch of queued writes at once.
+    """
+    deferred = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.callbacks = []
+
+    def commit(self):
+        if not self.deferred:
+            super().commit()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # The batch runner rolls the failed write back to its savepoint
+        if self.deferred:
+            return False
+        return super().__exit__(exc_type, exc_value, traceback)
+
+def _connect(read_only: bool):
+    con = sqlite3.connect(config["db"],
+        timeout=pool_config["busy_timeout"] / 1000,
+        cached_statements=pool_config["cached_statements"],
+        factory=sqlite3.Connection if read_only else WriterConnection)
+    if not read_only:
+        con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute(f"PRAGMA cache_size={int(pool_config['cache_size'])}")
+    con.execute(f"PRAGMA mmap_size={int(pool_config['mmap_size'])}")
+    if read_only:
+        con.execute("PRAGMA query_only=ON")
+    return con
+
 def open_db():
-    return sqlite3.connect(config["db"], timeout=10)
+    """
+    Returns the calling thread's persistent connection.
+    Use as `with open_db() as c:` to commit (or roll back) on exit.
+    """
+    con = getattr(_local, "con", None)
+    if con is None:
+        con = _connect(getattr(_local, "read_only", False))
+        _local.con = con
+    return con
+
+def after_commit(callback):
+    """
+    Runs callback once the current write has been committed, e.g. to
+    invalidate a cache without racing readers. Outside the group-commit
+    writer it runs immediately.
+    """
+    con = open_db()
+    if isinstance(con, WriterConnection) and con.deferred:
+        con.callbacks.append(callback)
+    else:
+        callback()
+
+def _init_reader():
+    _local.read_only = True
+
+def read_only(func):
+    """
+    Marks a model method as read-only so awaited calls run on the reader
+    pool and never queue behind writes.
+    """
+    func.read_only = True
+    return func
 
 #
-# Setup initial database
+# Async access
 #
 
-def init_db():
-    with open_db() as c:
-        # Member tables
-        c.execute("CREATE TABLE IF NOT EXISTS member(member_id INTEGER, " \
-            "guild_id INTEGER, verified INTEGER, code INTEGER)")
-        c.execute("CREATE TABLE IF NOT EXISTS member_arcdle(arcdle_rowid INTEGER PRIMARY KEY, " \
-            "member_id INTEGER, guild_id INTEGER, channel_id INTEGER) WITHOUT ROWID")
+class GroupCommitWriter(object):
+    """
+    Single writer thread that drains queued writes in batches. Each write
+    runs under its own savepoint so a failure only undoes that write, and
+    the batch shares one COMMIT (group commit). Callers are only resolved
+    once their batch is committed.
+    """
+
+    def __init__(self, max_batch: int):
+        self.max_batch = max_batch
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name="db-write", daemon=True)
+        self.thread.start()
+
+    def submit(self, func) -> Future:
+        future = Future()
+        self.queue.put((future, func))
+        return future
+
+    def _run(self):
+        con = open_db()
+        while True:
+            jobs = [self.queue.get()]
+            while len(jobs) < self.max_batch:
+                try:
+                    jobs.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._run_batch(con, jobs)
+
+    def _run_batch(self, con: WriterConnection, jobs):
+        results = []
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            con.deferred = True
+            for future, func in jobs:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                con.execute("SAVEPOINT job")
+                callback_cnt = len(con.callbacks)
+                try:
+                    results.append((future, func(), None))
+                except Exception as e:
+                    con.execute("ROLLBACK TO job")
+                    del con.callbacks[callback_cnt:]
+                    results.append((future, None, e))
+                con.execute("RELEASE job")
+            con.deferred = False
+            con.commit()
+        except sqlite3.Error as e:
+            con.deferred = False
+            con.rollback()
+            con.callbacks.clear()
+            for future, func in jobs:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        callbacks = con.callbacks
+        con.callbacks = []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                log.exception("Post-commit callback failed")
 
-        # Currency table
-        c.execute("CREATE TABLE IF NOT EXISTS currency(member_id INTEGER PRIMARY KEY, balance REAL)")
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+# Writes are funneled through one group-committing thread (SQLite allows a
+# single writer anyway), while reads run concurrently on a small pool. In WAL
+# mode readers never block on the writer, so neither stalls the event loop.
+writer = GroupCommitWriter(pool_config["write_batch"])
+read_executor = ThreadPoolExecutor(max_workers=pool_config["readers"],
+    thread_name_prefix="db-read", initializer=_init_reader)
+
+async def run_db(func, *args, **kwargs):
+    """
+    Runs a blocking database call on the reader pool or writer thread.
+    """
+    call = functools.partial(func, *args, **kwargs)
+    if getattr(func, "read_only", False):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(read_executor, call)
+    return await asyncio.wrap_future(writer.submit(call))
+
+class AsyncProxy(object):
+    """
+    Wraps a model class or instance so each method returns an awaitable
+    that runs on a DB worker thread.
+    """
+
+    def __init__(self, target):
+        self._target = target
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
 
-        # Verification table
-        c.execute("CREATE TABLE IF NOT EXISTS verification(guild_id INT, " \
-            "role_id INT, domain TEXT)")
+        # Cache hits are answered without leaving the event loop
+        cache = getattr(attr, "cache", None)
 
-        # Role menu table
-        c.execute("CREATE TABLE IF NOT EXISTS rolemenu(message_id INTEGER, " \
-            "guild_id INTEGER, role TEXT, emoji TEXT)")
+        async def call(*args, **kwargs):
+            if cache is None or kwargs:
+                return await run_db(attr, *args, **kwargs)
 
-        # ARCdle table
-        c.execute("CREATE TABLE IF NOT EXISTS arcdle(message_id INTEGER, visible TEXT, " \
-            "hidden TEXT, status INT)")
+            value = cache.get(args)
+            if value is MISSING:
+                generation = cache.generation
+                value = await run_db(attr.__wrapped__, *args)
+                cache.set(args, value, generation)
+            return value
+        return call
+
+class AsyncAccessor(object):
+    def __get__(self, obj, objtype=None):
+        return AsyncProxy(obj if obj is not None else objtype)
+
+class Model(object):
+    """
+    Base for database models.
+    `await Model.aio.method(...)` is the awaitable form of `Model.method(...)`.
+    """
+    aio = AsyncAccessor()
+
+#
+# Setup initial database
+#
 
-        # Daily ARCoin table
-        c.execute("CREATE TABLE IF NOT EXISTS daily(member_id INTEGER PRIMARY KEY)")
+def init_db():
+    migrations.migrate(open_db())
 
-        # Backlog table
-        c.execute("CREATE TABLE IF NOT EXISTS backlog(id INTEGER PRIMARY KEY, item TEXT)")
+def search_rows(c: sqlite3.Connection, table: str, column: str, query: str,
+    limit: int, where: str = None, params=(), fuzzy: bool = True):
+    """
+    Returns up to `limit` of table's rows whose `column` best matches query,
+    through the table's trigram index. Near misses are only looked for when
+    no row contains the query, and `fuzzy` is set. `where` filters rows
+    further, taking `params`.
+    """
+    where = f" AND {where}" if where else ""
+    if len(query) < MIN_QUERY:
+        return c.execute(
+            f"SELECT * FROM {table} WHERE {column} LIKE (?){where} ORDER BY id LIMIT (?)",
+            ("%" + query + "%", *params, limit)
+        ).fetchall()
 
-        # Calendar table
-        c.execute("CREATE TABLE IF NOT EXISTS calendar(guild_id INTEGER, " \
-            "channel_id INTEGER, calendar_id TEXT)")
+    match = f"""
+        SELECT {table}.* FROM {table}_fts
+        JOIN {table} ON {table}.id = {table}_fts.rowid
+        WHERE {table}_fts MATCH (?){where}
+        ORDER BY bm25({table}_fts) LIMIT (?)
+    """
+    results = c.execute(match, (quote(query), *params, limit)).fetchall()
+    wanted = list(trigrams(query))
+    if results or not fuzzy or not wanted:
+        return results
 
-        # Bounty table
-        c.execute("CREATE TABLE IF NOT EXISTS bounty(title TEXT, " \
-            "owner_id INT, guild_id INT, channel_id INT, message_id INT, amt REAL)")
+    marks = ", ".join("?" * len(wanted))
+    counts = dict(c.execute(
+        f"SELECT term, doc FROM {table}_vocab WHERE term IN ({marks})", wanted
+    ).fetchall())
+    fuzzy_match = fuzzy_query(query, counts)
+    if fuzzy_match is None:
+        return []
+    cursor = c.execute(match, (fuzzy_match, *params, CANDIDATES))
+    i = [x[0] for x in cursor.description].index(column)
+    return rank(query, cursor.fetchall(), lambda x: x[i], limit)
 
 #
 # Define database models
 #
 
-class MemberModel(object):
+class MemberModel(Model):
     @staticmethod
     def get_or_create(member_id: int, guild_id: int):
         try:
@@ -65,67 +299,127 @@ class MemberModel(object):
             c = con.cursor()
 
             result = c.execute(
-                "SELECT rowid, * FROM member WHERE member_id=(?) AND guild_id=(?)",
+                "SELECT rowid, verified FROM member WHERE member_id=(?) AND guild_id=(?)",
                 (member_id, guild_id)
             ).fetchone()
 
             if result:
-                rowid, _, _, verified, code = result
-                return MemberModel(rowid, member_id, guild_id, verified, code)
+                rowid, verified = result
+                return MemberModel(rowid, member_id, guild_id, verified)
             else:
                 c.execute(
-                    "INSERT INTO member VALUES (?, ?, ?, ?)",
-                    (member_id, guild_id, 0, 0)
+                    "INSERT INTO member VALUES (?, ?, ?)",
+                    (member_id, guild_id, 0)
                 )
                 con.commit()
-                con.close()
 
-                return MemberModel(c.lastrowid, member_id, guild_id, 0, 0)
+                def update_index():
+                    leaderboard.add_member(member_id, guild_id)
+                    sessions.set_verified(member_id, guild_id, 0)
+                after_commit(update_index)
+                return MemberModel(c.lastrowid, member_id, guild_id, 0)
         except sqlite3.Error:
             return None
 
     @staticmethod
+    def add_many(pairs):
+        """
+        Creates any missing members from (member_id, guild_id) pairs in one
+        transaction. Returns (member_id, guild_id, verified) for each pair.
+        """
+        rows = []
+        with open_db() as c:
+            for member_id, guild_id in pairs:
+                rows.append(c.execute(
+                    "INSERT INTO member VALUES (?, ?, 0) " \
+                    "ON CONFLICT(member_id, guild_id) DO UPDATE SET verified=verified " \
+                    "RETURNING member_id, guild_id, verified",
+                    (member_id, guild_id)
+                ).fetchone())
+
+        def update_index():
+            for member_id, guild_id, verified in rows:
+                leaderboard.add_member(member_id, guild_id)
+                if verified == 0:
+                    sessions.set_verified(member_id, guild_id, 0)
+        after_commit(update_index)
+        return rows
+
+    @staticmethod
+    @read_only
     def get_all(member_id: int):
         with open_db() as c:
             results = c.execute(
-                "SELECT rowid, * FROM member WHERE member_id=(?)",
+                "SELECT rowid, guild_id, verified FROM member WHERE member_id=(?)",
                 (member_id,)
             ).fetchall()
 
             if results:
                 members = []
                 for result in results:
-                    rowid, _, guild_id, verified, code = result
+                    rowid, guild_id, verified = result
                     members.append(
-                        MemberModel(rowid, member_id, guild_id, verified, code))
+                        MemberModel(rowid, member_id, guild_id, verified))
                 return members
             return []
 
     @staticmethod
-    def get_richest(guild_id: int, n: int = 10):
-        members = []
+    @read_only
+    def get_pending(member_id: int):
+        """
+        Returns (member, verification config) for the first guild where the
+        member is unverified and verification is configured, or None.
+        """
         with open_db() as c:
-            results = c.execute(
+            result = c.execute(
                 """
-                SELECT member.rowid, member.member_id, guild_id, verified, code FROM member
-                JOIN currency ON member.member_id = currency.member_id
-                WHERE member.guild_id = (?)
-                ORDER BY balance desc LIMIT (?)
+                SELECT member.rowid, member.member_id, member.guild_id,
+                    member.verified, verification.role_id,
+                    verification.domain
+                FROM member
+                JOIN verification ON verification.guild_id = member.guild_id
+                WHERE member.member_id = (?) AND member.verified = 0
+                ORDER BY member.rowid LIMIT 1
                 """,
-                (guild_id, n)
+                (member_id,)
+            ).fetchone()
+            if result:
+                rowid, member_id, guild_id, verified, role_id, domain = result
+                return (MemberModel(rowid, member_id, guild_id, verified),
+                    VerificationModel(guild_id, role_id, domain))
+            return None
+
+    @staticmethod
+    @read_only
+    def get_unverified():
+        """
+        Returns (member_id, guild_id) for every unverified member.
+        """
+        with open_db() as c:
+            return c.execute(
+                "SELECT member_id, guild_id FROM member WHERE verified=0"
             ).fetchall()
 
-            for i in results:
-                rowid, member_id, guild_id, verified, code = i
-                members.append(MemberModel(rowid, member_id, guild_id, verified, code))
-        return members
+    @staticmethod
+    @read_only
+    def get_all_balances():
+        """
+        Returns (member_id, guild_id, balance) for every member, with
+        balance None if the member has no currency account.
+        """
+        with open_db() as c:
+            return c.execute(
+                """
+                SELECT member.member_id, guild_id, balance FROM member
+                LEFT JOIN currency ON member.member_id = currency.member_id
+                """
+            ).fetchall()
 
-    def __init__(self, rowid: int, member_id: int, guild_id: int, verified: int, code: int):
+    def __init__(self, rowid: int, member_id: int, guild_id: int, verified: int):
         self.rowid = rowid
         self.member_id = member_id
         self.guild_id = guild_id
         self.verified = verified
-        self.code = code
 
     def update_verified(self, verified: int):
         with open_db() as c:
@@ -134,16 +428,9 @@ class MemberModel(object):
                 (verified, self.rowid)
             )
             self.verified = verified
+        after_commit(lambda: sessions.set_verified(self.member_id, self.guild_id, verified))
 
-    def update_code(self, code: int):
-        with open_db() as c:
-            c.execute(
-                "UPDATE member SET code=(?) WHERE rowid=(?)",
-                (code, self.rowid)
-            )
-            self.code = code
-
-class CurrencyModel(object):
+class CurrencyModel(Model):
     @staticmethod
     def get_balance_or_create(member_id: int):
         with open_db() as c:
@@ -158,6 +445,7 @@ class CurrencyModel(object):
                     "INSERT INTO currency VALUES (?, ?)",
                     (member_id, balance)
                 )
+                after_commit(lambda: leaderboard.update(member_id, balance))
             else:
                 balance = result[1]
 
@@ -165,24 +453,219 @@ class CurrencyModel(object):
     
     @staticmethod
     def update_balance(member_id: int, balance: float):
+        """
+        Sets a member's balance, recording the difference as an adjustment.
+        """
         with open_db() as c:
+            CurrencyModel.open_account(c, member_id)
             c.execute(
+                """
+                INSERT INTO ledger(member_id, amount, kind, created_at)
+                SELECT member_id, (?) - balance, 'adjust', (?)
+                FROM currency WHERE member_id=(?) AND balance != (?)
+                """,
+                (balance, int(time.time()), member_id, balance)
+            )
+            updated = c.execute(
                 "UPDATE currency SET balance=(?) WHERE member_id=(?)",
                 (balance, member_id)
-            )
+            ).rowcount
+            if updated:
+                after_commit(lambda: leaderboard.update(member_id, balance))
+
+    @staticmethod
+    def open_account(c: sqlite3.Connection, member_id: int):
+        """
+        Creates an empty account using the caller's open transaction.
+        """
+        created = c.execute(
+            "INSERT OR IGNORE INTO currency VALUES (?, ?)",
+            (member_id, 0.0)
+        ).rowcount
+        if created:
+            after_commit(lambda: leaderboard.update(member_id, 0.0))
+
+    @staticmethod
+    def credit(member_id: int, amt: float, kind: str):
+        """
+        Adds to a member's balance, returning the new balance.
+        """
+        with open_db() as c:
+            CurrencyModel.open_account(c, member_id)
+            result = c.execute(
+                "UPDATE currency SET balance = balance + (?) " \
+                "WHERE member_id=(?) RETURNING balance",
+                (amt, member_id)
+            ).fetchall()
+            LedgerModel.record(c, [(member_id, amt, kind, None)])
+            balance = result[0][0]
+            after_commit(lambda: leaderboard.update(member_id, balance))
+            return balance
 
-class ARCdleModel(object):
     @staticmethod
-    def get_num_games():
+    def debit(member_id: int, amt: float, kind: str):
+        """
+        Takes from a member's balance, returning the new balance or
+        None if the member can't afford it.
+        """
         with open_db() as c:
+            CurrencyModel.open_account(c, member_id)
             result = c.execute(
+                "UPDATE currency SET balance = balance - (?) " \
+                "WHERE member_id=(?) AND balance >= (?) RETURNING balance",
+                (amt, member_id, amt)
+            ).fetchall()
+            if not result:
+                return None
+
+            LedgerModel.record(c, [(member_id, -amt, kind, None)])
+            balance = result[0][0]
+            after_commit(lambda: leaderboard.update(member_id, balance))
+            return balance
+
+    @staticmethod
+    def move(c: sqlite3.Connection, sender_id: int, receiver_id: int, amt: float,
+        kind: str, received_amt: float = None, require_funds: bool = True):
+        """
+        Moves coins between accounts using the caller's open transaction.
+        Returns False without changing any balance if the sender can't
+        afford it and `require_funds` is set.
+        """
+        if received_amt is None:
+            received_amt = amt
+
+        CurrencyModel.open_account(c, sender_id)
+        CurrencyModel.open_account(c, receiver_id)
+        debited = c.execute(
+            "UPDATE currency SET balance = balance - (?) " \
+            "WHERE member_id=(?) AND (balance >= (?) OR NOT (?)) RETURNING balance",
+            (amt, sender_id, amt, require_funds)
+        ).fetchall()
+        if not debited:
+            return False
+
+        credited = c.execute(
+            "UPDATE currency SET balance = balance + (?) " \
+            "WHERE member_id=(?) RETURNING balance",
+            (received_amt, receiver_id)
+        ).fetchall()
+        LedgerModel.record(c, [
+            (sender_id, -amt, kind, receiver_id),
+            (receiver_id, received_amt, kind, sender_id),
+        ])
+        def update_index():
+            leaderboard.update(sender_id, debited[0][0])
+            leaderboard.update(receiver_id, credited[0][0])
+        after_commit(update_index)
+        return True
+
+    @staticmethod
+    def transfer(sender_id: int, receiver_id: int, amt: float, kind: str,
+        received_amt: float = None):
+        """
+        Moves coins between members in a single transaction. The receiver
+        gets `received_amt` if given (e.g. minted thanks), otherwise `amt`.
+        Returns False without changing anything if the sender can't afford it.
+        """
+        with open_db() as c:
+            return CurrencyModel.move(c, sender_id, receiver_id, amt, kind, received_amt)
+
+class LedgerModel(Model):
+    """
+    Append-only history of every balance change. Entries are written in the
+    same transaction as the balance update they describe, and the writer's
+    group commit batches them under load. Snapshots let a balance be
+    computed from the last snapshot plus newer entries only.
+    """
+
+    @staticmethod
+    def record(c: sqlite3.Connection, entries):
+        """
+        Appends (member_id, amount, kind, counterparty_id) entries using
+        the caller's open transaction.
+        """
+        now = int(time.time())
+        c.executemany(
+            "INSERT INTO ledger(member_id, amount, kind, counterparty_id, created_at) " \
+            "VALUES (?, ?, ?, ?, ?)",
+            [entry + (now,) for entry in entries]
+        )
+
+    @staticmethod
+    @read_only
+    def get_balance(member_id: int):
+        """
+        Replays a member's entries on top of their latest snapshot.
+        """
+        with open_db() as c:
+            snapshot = c.execute(
                 """
-                SELECT COUNT(*)
-                FROM arcdle
+                SELECT ledger_id, balance FROM ledger_snapshot
+                WHERE member_id=(?) ORDER BY ledger_id DESC LIMIT 1
                 """,
+                (member_id,)
+            ).fetchone()
+            ledger_id, balance = snapshot if snapshot else (0, 0.0)
+
+            result = c.execute(
+                "SELECT TOTAL(amount) FROM ledger WHERE member_id=(?) AND id > (?)",
+                (member_id, ledger_id)
             ).fetchone()
-        return result[0]
+            return balance + result[0]
 
+    @staticmethod
+    @read_only
+    def get_history(member_id: int, n: int = 10):
+        with open_db() as c:
+            results = c.execute(
+                """
+                SELECT id, member_id, amount, kind, counterparty_id, created_at
+                FROM ledger WHERE member_id=(?)
+                ORDER BY id DESC LIMIT (?)
+                """,
+                (member_id, n)
+            ).fetchall()
+            return list(map(lambda x: LedgerModel(*x), results))
+
+    @staticmethod
+    def snapshot():
+        """
+        Records every member's balance as of the newest entry, using each
+        member's previous snapshot so only new entries are summed.
+        Returns the ledger id the snapshot was taken at.
+        """
+        with open_db() as c:
+            ledger_id = c.execute("SELECT MAX(id) FROM ledger").fetchone()[0]
+            if ledger_id is None:
+                return 0
+
+            c.execute(
+                """
+                INSERT OR IGNORE INTO ledger_snapshot(member_id, ledger_id, balance)
+                SELECT ledger.member_id, (?),
+                    COALESCE(last.balance, 0.0) + TOTAL(ledger.amount)
+                FROM ledger
+                LEFT JOIN (
+                    SELECT member_id, MAX(ledger_id) AS ledger_id, balance
+                    FROM ledger_snapshot GROUP BY member_id
+                ) AS last ON last.member_id = ledger.member_id
+                WHERE ledger.id > COALESCE(last.ledger_id, 0) AND ledger.id <= (?)
+                GROUP BY ledger.member_id
+                """,
+                (ledger_id, ledger_id)
+            )
+            return ledger_id
+
+    def __init__(self, id: int, member_id: int, amount: float, kind: str,
+        counterparty_id: int, created_at: int):
+        self.id = id
+        self.member_id = member_id
+        self.amount = amount
+        self.kind = kind
+        self.counterparty_id = counterparty_id
+        self.created_at = created_at
+
+class ARCdleModel(Model):
     @staticmethod
     def clear_games():
         with open_db() as c:
@@ -191,13 +674,48 @@ class ARCdleModel(object):
                 DELETE FROM arcdle
                 """,
             )
+            c.execute("DELETE FROM member_arcdle")
+        after_commit(sessions.clear_games)
+
+    @staticmethod
+    @read_only
+    def get_active_sessions():
+        """
+        Returns (member_id, arcdle_rowid) for every game in progress.
+        """
+        with open_db() as c:
+            return c.execute(
+                """
+                SELECT member_id, arcdle.rowid
+                FROM arcdle
+                INNER JOIN member_arcdle on member_arcdle.arcdle_rowid = arcdle.rowid
+                WHERE status=0
+                """
+            ).fetchall()
 
     @staticmethod
+    @read_only
+    def get(rowid: int):
+        with open_db() as c:
+            result = c.execute(
+                """
+                SELECT rowid, message_id, visible, hidden, status, guesses
+                FROM arcdle WHERE rowid=(?)
+                """,
+                (rowid,)
+            ).fetchone()
+            if result is None:
+                return None
+
+            return ARCdleModel(*result)
+
+    @staticmethod
+    @read_only
     def get_member_active_game(member_id: int):
         with open_db() as c:
             result = c.execute(
                 """
-                SELECT arcdle.rowid, message_id, visible, hidden, status
+                SELECT arcdle.rowid, message_id, visible, hidden, status, guesses
                 FROM arcdle
                 INNER JOIN member_arcdle on member_arcdle.arcdle_rowid = arcdle.rowid
                 WHERE status=0 AND member_id=(?)
@@ -207,10 +725,10 @@ class ARCdleModel(object):
             if result is None:
                 return None
             
-            rowid, message_id, visible, hidden, status = result
-            return ARCdleModel(rowid, message_id, visible, hidden, status)
+            return ARCdleModel(*result)
 
     @staticmethod
+    @read_only
     def get_member_recent_game(member_id: int):
         with open_db() as c:
             result = c.execute(
@@ -235,7 +753,7 @@ class ARCdleModel(object):
         con = open_db()
         c = con.cursor()
         c.execute(
-            "INSERT INTO arcdle VALUES (?, ?, ?, ?)",
+            "INSERT INTO arcdle(message_id, visible, hidden, status) VALUES (?, ?, ?, ?)",
             (message_id, "", "", 0)
         )
         con.commit()
@@ -246,16 +764,22 @@ class ARCdleModel(object):
             (arcdle_rowid, member_id, guild_id, channel_id)
         )
         con.commit()
-        con.close()
+        after_commit(lambda: sessions.start_game(member_id, arcdle_rowid))
         return ARCdleModel.get_member_active_game(member_id)
 
-    def __init__(self, rowid: int, message_id: int, visible: str, hidden: str, status: int):
+    def __init__(self, rowid: int, message_id: int, visible: str, hidden: str, status: int,
+        guesses: str = ""):
         self.rowid = rowid
         self.message_id = message_id
         self.visible = visible
         self.hidden = hidden
         self.status = status
+        self.guesses = guesses
 
+    def get_guesses(self):
+        return self.guesses.split(",") if self.guesses else []
+
+    @read_only
     def get_origin(self):
         with open_db() as c:
             result = c.execute(
@@ -269,17 +793,19 @@ class ARCdleModel(object):
             ).fetchone()
             return result
 
-    def update(self, visible: str, hidden: str, status: int):
+    def update(self, visible: str, hidden: str, status: int, guesses: str):
         with open_db() as c:
             c.execute(
                 """
-                UPDATE arcdle SET visible=(?), hidden=(?), status=(?)
+                UPDATE arcdle SET visible=(?), hidden=(?), status=(?), guesses=(?)
                 WHERE rowid=(?);
                 """,
-                (visible, hidden, status, self.rowid),
+                (visible, hidden, status, guesses, self.rowid),
             )
+        if status != 0:
+            after_commit(lambda: sessions.end_game(self.rowid))
 
-class DailyModel(object):
+class DailyModel(Model):
     @staticmethod
     def redeem(member_id: int):
         if DailyModel.was_redeemed(member_id):
@@ -291,6 +817,7 @@ class DailyModel(object):
             )
 
     @staticmethod
+    @read_only
     def was_redeemed(member_id: int):
         with open_db() as c:
             result = c.execute("SELECT * FROM daily " \
@@ -304,61 +831,156 @@ class DailyModel(object):
         with open_db() as c:
             result = c.execute("DELETE FROM daily")
 
-class RoleMenuModel(object):
+class RoleMenuModel(Model):
+    # message_id -> {emoji key: role_id} for every role menu, so reactions
+    # are matched to a role without touching the database
+    menus = {}
+
     @staticmethod
-    def get(message_id: int, guild_id: int):
+    @read_only
+    def load_index():
+        menus = {}
         with open_db() as c:
             results = c.execute(
-                """
-                SELECT *
-                FROM rolemenu
-                WHERE message_id=(?) and guild_id=(?)
-                """,
-                (message_id, guild_id)
+                "SELECT message_id, emoji_key, role_id FROM rolemenu"
             ).fetchall()
-            return list(map(lambda x: RoleMenuModel(x[0], x[1], x[2], x[3]), results))
+            for message_id, key, role_id in results:
+                options = menus.setdefault(message_id, {})
+                if role_id is not None:
+                    options[key] = role_id
+        RoleMenuModel.menus = menus
+
+    @staticmethod
+    def is_menu(message_id: int):
+        return message_id in RoleMenuModel.menus
+
+    @staticmethod
+    def get_options(message_id: int):
+        """
+        Returns a menu's {emoji key: role_id} dict, which mustn't be modified.
+        """
+        return RoleMenuModel.menus.get(message_id, {})
+
+    @staticmethod
+    def get_role(message_id: int, key: str):
+        """
+        Returns the ID of the role a menu gives for an emoji key, or None.
+        """
+        return RoleMenuModel.menus.get(message_id, {}).get(key)
 
     @staticmethod
-    def add_option(message_id: int, guild_id: int, role: str, emoji: str):
+    @read_only
+    def get_locations():
+        """
+        Returns (message_id, guild_id, channel_id) for every role menu, with
+        channel_id None if it isn't known yet.
+        """
+        with open_db() as c:
+            return c.execute(
+                "SELECT message_id, guild_id, max(channel_id) FROM rolemenu " \
+                "GROUP BY message_id"
+            ).fetchall()
+
+    @staticmethod
+    def set_channel(message_id: int, channel_id: int):
+        with open_db() as c:
+            c.execute("UPDATE rolemenu SET channel_id=(?) WHERE message_id=(?)",
+                (channel_id, message_id))
+
+    @staticmethod
+    def add_option(message_id: int, guild_id: int, role_id: int, role: str, emoji: str,
+        channel_id: int = None):
+        key = emoji_key(emoji)
         with open_db() as c:
             c.execute(
-                "INSERT INTO rolemenu VALUES (?, ?, ?, ?)",
-                (message_id, guild_id, role, emoji)
+                "INSERT INTO rolemenu (message_id, guild_id, role, emoji, role_id, " \
+                "emoji_key, channel_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (message_id, guild_id, role, emoji, role_id, key, channel_id)
             )
 
+        def update_index():
+            RoleMenuModel.menus.setdefault(message_id, {})[key] = role_id
+        after_commit(update_index)
+
     @staticmethod
     def delete_menu(message_id: int, guild_id: int):
-        with self.open_db() as c:
+        with open_db() as c:
             c.execute("DELETE FROM rolemenu WHERE message_id=(?) AND guild_id=(?)",
                 (message_id, guild_id)
             )
+        after_commit(lambda: RoleMenuModel.menus.pop(message_id, None))
+
+    @staticmethod
+    @read_only
+    def get_unresolved():
+        """
+        Returns options saved before roles were stored by ID.
+        """
+        with open_db() as c:
+            results = c.execute(
+                "SELECT message_id, guild_id, role, emoji, role_id, emoji_key " \
+                "FROM rolemenu WHERE role_id IS NULL"
+            ).fetchall()
+            return list(map(lambda x: RoleMenuModel(*x), results))
+
+    @staticmethod
+    def set_role_ids(options):
+        """
+        Stores role IDs for options from get_unresolved.
+        """
+        with open_db() as c:
+            c.executemany(
+                "UPDATE rolemenu SET role_id=(?) WHERE message_id=(?) AND emoji_key=(?)",
+                ((x.role_id, x.message_id, x.emoji_key) for x in options)
+            )
 
-    def __init__(self, message_id: int, guild_id: int, role: str, emoji: str):
+        def update_index():
+            for x in options:
+                RoleMenuModel.menus.setdefault(x.message_id, {})[x.emoji_key] = x.role_id
+        after_commit(update_index)
+
+    def __init__(self, message_id: int, guild_id: int, role: str, emoji: str,
+        role_id: int = None, emoji_key: str = None):
         self.message_id = message_id
         self.guild_id = guild_id
         self.role = role
         self.emoji = emoji
+        self.role_id = role_id
+        self.emoji_key = emoji_key
         
-class BacklogModel(object):
+class BacklogModel(Model):
     @staticmethod
+    @read_only
     def get_all():
         with open_db() as c:
             results = c.execute("SELECT * FROM backlog").fetchall()
             return list(map(lambda x: BacklogModel(x[0], x[1]), results))
 
+    @staticmethod
+    @read_only
+    def search(query: str, limit: int = 10):
+        """
+        Returns the items best matching query, including near misses.
+        """
+        with open_db() as c:
+            results = search_rows(c, "backlog", "item", query, limit)
+            return list(map(lambda x: BacklogModel(x[0], x[1]), results))
+
     @staticmethod
     def find_and_remove(item: str):
+        """
+        Removes the best ranked item containing `item`, returning its text
+        or None if no item does.
+        """
         with open_db() as c:
-            result = c.execute(
-                "SELECT * FROM backlog WHERE item LIKE (?)",
-                ("%" + item + "%",)
-            ).fetchone()
+            results = search_rows(c, "backlog", "item", item, 1, fuzzy=False)
+            result = results[0] if results else None
             if result is not None:
                 c.execute(
                     "DELETE FROM backlog WHERE id=(?)", (result[0],)
                 )
-                return True
-        return False
+                return result[1]
+        return None
 
     @staticmethod
     def add(item: str):
@@ -371,7 +993,9 @@ class BacklogModel(object):
         self.id = id
         self.item = item
 
-class VerificationModel(object):
+class VerificationModel(Model):
+    cache = LRUCache("verification", maxsize=1024, ttl=600)
+
     @staticmethod
     def configure(guild_id: int, role_id: int, domain: str):
         with open_db() as c:
@@ -385,8 +1009,11 @@ class VerificationModel(object):
                 "WHERE guild_id=(?)",
                 (role_id, domain, guild_id)
             )
+        after_commit(lambda: VerificationModel.cache.invalidate((guild_id,)))
 
     @staticmethod
+    @cached(cache)
+    @read_only
     def get(guild_id: int):
         with open_db() as c:
             result = c.execute(
@@ -405,14 +1032,147 @@ class VerificationModel(object):
         self.role_id = role_id
         self.domain = domain
 
-class CalendarModel(object):
+class OutboxModel(Model):
+    """
+    Queued outgoing emails. Claiming a batch pushes its next attempt out by
+    a lease, so messages in flight when the bot stops are retried later.
+    """
+
+    PENDING = 0
+    SENT = 1
+    FAILED = 2
+
+    @staticmethod
+    def add(recipient: str, subject: str, body: str, notify_id: int):
+        with open_db() as c:
+            now = time.time()
+            cursor = c.execute(
+                "INSERT INTO outbox (recipient, subject, body, notify_id, " \
+                "next_attempt, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (recipient, subject, body, notify_id, now, now)
+            )
+            return cursor.lastrowid
+
+    @staticmethod
+    def claim(now: float, lease: float, limit: int):
+        """
+        Claims up to `limit` pending messages that are due, counting an
+        attempt for each.
+        """
+        with open_db() as c:
+            results = c.execute(
+                """
+                UPDATE outbox SET attempts = attempts + 1, next_attempt = (?)
+                WHERE id IN (
+                    SELECT id FROM outbox
+                    WHERE status = 0 AND next_attempt <= (?)
+                    ORDER BY next_attempt LIMIT (?)
+                )
+                RETURNING id, recipient, subject, body, notify_id, attempts
+                """,
+                (now + lease, now, limit)
+            ).fetchall()
+            return list(map(lambda x: OutboxModel(*x), results))
+
+    @staticmethod
+    @read_only
+    def get_next_attempt():
+        with open_db() as c:
+            return c.execute(
+                "SELECT min(next_attempt) FROM outbox WHERE status = 0"
+            ).fetchone()[0]
+
+    @staticmethod
+    def mark_sent(ids):
+        # Bodies hold verification codes, so they aren't kept after delivery
+        with open_db() as c:
+            c.executemany(
+                "UPDATE outbox SET status = 1, body = '', error = NULL, " \
+                "updated_at = (?) WHERE id = (?)",
+                ((time.time(), id) for id in ids)
+            )
+
+    @staticmethod
+    def retry(id: int, next_attempt: float, error: str):
+        with open_db() as c:
+            c.execute(
+                "UPDATE outbox SET next_attempt = (?), error = (?), updated_at = (?) " \
+                "WHERE id = (?)",
+                (next_attempt, error, time.time(), id)
+            )
+
+    @staticmethod
+    def mark_failed(id: int, error: str):
+        with open_db() as c:
+            c.execute(
+                "UPDATE outbox SET status = 2, body = '', error = (?), updated_at = (?) " \
+                "WHERE id = (?)",
+                (error, time.time(), id)
+            )
+
+    @staticmethod
+    def purge(before: float):
+        """
+        Deletes delivered and failed messages last updated before `before`.
+        """
+        with open_db() as c:
+            c.execute("DELETE FROM outbox WHERE status != 0 AND updated_at < (?)",
+                (before,))
+
+    def __init__(self, id: int, recipient: str, subject: str, body: str,
+        notify_id: int, attempts: int):
+        self.id = id
+        self.recipient = recipient
+        self.subject = subject
+        self.body = body
+        self.notify_id = notify_id
+        self.attempts = attempts
+
+class VerifCodeModel(Model):
+    """
+    Persisted copy of the in-memory verification code store, one row per
+    member. `expires` is when the row is no longer needed.
+    """
+
+    @staticmethod
+    @read_only
+    def get_live(now: float):
+        with open_db() as c:
+            return c.execute(
+                "SELECT member_id, guild_id, code, code_expires, tokens, updated " \
+                "FROM verif_code WHERE expires > (?)",
+                (now,)
+            ).fetchall()
+
+    @staticmethod
+    def save(member_id: int, guild_id: int, code: int, code_expires: float,
+        tokens: float, updated: float, expires: float):
+        with open_db() as c:
+            c.execute(
+                "INSERT OR REPLACE INTO verif_code VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (member_id, guild_id, code, code_expires, tokens, updated, expires)
+            )
+
+    @staticmethod
+    def delete(member_id: int):
+        with open_db() as c:
+            c.execute("DELETE FROM verif_code WHERE member_id=(?)", (member_id,))
+
+    @staticmethod
+    def purge(now: float):
+        with open_db() as c:
+            c.execute("DELETE FROM verif_code WHERE expires <= (?)", (now,))
+
+class CalendarModel(Model):
     @staticmethod
+    @read_only
     def get_all():
         with open_db() as c:
             results = c.execute("SELECT * FROM calendar").fetchall()
             return list(map(lambda x: CalendarModel(x[0], x[1], x[2]), results))
 
     @staticmethod
+    @read_only
     def get_by_guild(guild_id: int):
         with open_db() as c:
             results = c.execute(
@@ -426,32 +1186,34 @@ class CalendarModel(object):
             return list(map(lambda x: CalendarModel(x[0], x[1], x[2]), results))
 
     @staticmethod
+    @read_only
     def get_by_channel(guild_id: int, channel_id: int):
         with open_db() as c:
             results = c.execute(
                 """
-                SELECT *
-                FROM calendar
+                SELECT calendar.*, calendar_meta.name, calendar_meta.fetched_at
+                FROM calendar LEFT JOIN calendar_meta USING (calendar_id)
                 WHERE guild_id=(?) AND channel_id=(?)
                 """,
                 (guild_id, channel_id)
             ).fetchall()
-            return list(map(lambda x: CalendarModel(x[0], x[1], x[2]), results))
+            return list(map(lambda x: CalendarModel(*x), results))
 
     @staticmethod
+    @read_only
     def get(guild_id: int, channel_id: int, calendar_id: str):
         with open_db() as c:
             result = c.execute(
                 """
-                SELECT *
-                FROM calendar
+                SELECT calendar.*, calendar_meta.name, calendar_meta.fetched_at
+                FROM calendar LEFT JOIN calendar_meta USING (calendar_id)
                 WHERE guild_id=(?) AND channel_id=(?)
                 AND calendar_id=(?)
                 """,
                 (guild_id, channel_id, calendar_id)
             ).fetchone()
             if result:
-                return CalendarModel(result[0], result[1], result[2])
+                return CalendarModel(*result)
             else:
                 return None
 
@@ -464,10 +1226,38 @@ class CalendarModel(object):
                 (guild_id, channel_id, calendar_id)
             )
 
-    def __init__(self, guild_id: int, channel_id: int, calendar_id: str):
+    @staticmethod
+    @read_only
+    def get_meta(calendar_id: str):
+        """
+        Returns the stored (name, fetched_at) of a calendar, or None.
+        """
+        with open_db() as c:
+            return c.execute(
+                "SELECT name, fetched_at FROM calendar_meta WHERE calendar_id=(?)",
+                (calendar_id,)
+            ).fetchone()
+
+    @staticmethod
+    def set_meta(calendar_id: str, name: str, timezone: str):
+        with open_db() as c:
+            c.execute(
+                "INSERT OR REPLACE INTO calendar_meta VALUES (?, ?, ?, ?)",
+                (calendar_id, name, timezone, time.time())
+            )
+
+    def __init__(self, guild_id: int, channel_id: int, calendar_id: str,
+        name: str = None, fetched_at: float = None):
         self.guild_id = guild_id
         self.channel_id = channel_id
         self.calendar_id = calendar_id
+        # Cached from the Calendar API, only loaded by some queries
+        self.name = name
+        self.fetched_at = fetched_at
+
+    @property
+    def display_name(self):
+        return self.name or self.calendar_id
 
     def remove(self):
         with open_db() as c:
@@ -477,33 +1267,218 @@ class CalendarModel(object):
                 (self.guild_id, self.channel_id, self.calendar_id)
             )
 
-class BountyModel(object):
+class CalendarEventModel(Model):
+    """
+    Local copy of linked Google Calendars' events, kept current with
+    incremental syncs. Events are stored as the JSON fields needed to
+    render them, keyed by start/end timestamps for range queries.
+    """
+
+    @staticmethod
+    @read_only
+    def get_range(calendar_ids, start: float, end: float):
+        """
+        Returns events overlapping [start, end) from the given calendars,
+        earliest first.
+        """
+        if not calendar_ids:
+            return []
+        with open_db() as c:
+            marks = ", ".join("?" * len(calendar_ids))
+            results = c.execute(
+                f"""
+                SELECT data
+                FROM calendar_event
+                WHERE calendar_id IN ({marks}) AND start < (?) AND end > (?)
+                ORDER BY start
+                """,
+                (*calendar_ids, end, start)
+            ).fetchall()
+            return [json.loads(x[0]) for x in results]
+
+    @staticmethod
+    @read_only
+    def get_sync_tokens():
+        """
+        Maps each synced calendar id to its sync token, which may be None.
+        """
+        with open_db() as c:
+            return dict(c.execute(
+                "SELECT calendar_id, sync_token FROM calendar_sync"
+            ).fetchall())
+
+    @staticmethod
+    def apply_sync(calendar_id: str, full: bool, events, deleted, sync_token: str):
+        """
+        Stores a sync's results. `events` are (event_id, start, end, data)
+        rows to upsert and `deleted` are event ids to drop. A full sync
+        replaces everything stored for the calendar.
+        """
+        with open_db() as c:
+            if full:
+                c.execute("DELETE FROM calendar_event WHERE calendar_id=(?)",
+                    (calendar_id,))
+            c.executemany(
+                "DELETE FROM calendar_event WHERE calendar_id=(?) AND event_id=(?)",
+                ((calendar_id, event_id) for event_id in deleted)
+            )
+            c.executemany(
+                "INSERT OR REPLACE INTO calendar_event VALUES (?, ?, ?, ?, ?)",
+                ((calendar_id, *event) for event in events)
+            )
+            c.execute(
+                "INSERT OR REPLACE INTO calendar_sync VALUES (?, ?, ?)",
+                (calendar_id, sync_token, time.time())
+            )
+
+    @staticmethod
+    def prune(before: float):
+        """
+        Drops events that ended before `before` and calendars that are no
+        longer linked to any channel.
+        """
+        with open_db() as c:
+            c.execute("DELETE FROM calendar_event WHERE end < (?)", (before,))
+            c.execute(
+                "DELETE FROM calendar_event WHERE calendar_id NOT IN " \
+                "(SELECT calendar_id FROM calendar)"
+            )
+            c.execute(
+                "DELETE FROM calendar_sync WHERE calendar_id NOT IN " \
+                "(SELECT calendar_id FROM calendar)"
+            )
+            c.execute(
+                "DELETE FROM calendar_meta WHERE calendar_id NOT IN " \
+                "(SELECT calendar_id FROM calendar)"
+            )
+
+class BountyModel(Model):
+    """
+    Open bounties and their pending claims. A bounty's reward is held in the
+    escrow account from when it's posted until it's paid out.
+    """
+
+    # Currency account holding the coins of every open bounty
+    ESCROW_ID = 0
+    # Returned by create when the title is in use in the guild
+    TAKEN = object()
+
+    # Message IDs of pending claims, so other reactions skip the database
+    claim_ids = set()
+
+    @staticmethod
+    @read_only
+    def load_index():
+        with open_db() as c:
+            results = c.execute("SELECT message_id FROM bounty_claim").fetchall()
+            BountyModel.claim_ids = set(x[0] for x in results)
+
+    @staticmethod
+    def is_claim(message_id: int):
+        return message_id in BountyModel.claim_ids
+
     @staticmethod
-    def get(title: str):
+    @read_only
+    def get(guild_id: int, title: str):
         with open_db() as c:
             result = c.execute(
-                "SELECT * FROM bounty WHERE title like (?)",
-                (title,)
+                "SELECT * FROM bounty WHERE guild_id=(?) AND title=(?) COLLATE NOCASE",
+                (guild_id, title)
             ).fetchone()
 
             if result:
-                return BountyModel(result[0], result[1], result[2],
-                    result[3], result[4], result[5])
+                return BountyModel(*result)
             else:
                 return None
 
     @staticmethod
-    def create(title: str, owner_id: int, guild_id: int, channel_id: int,
-        message_id: int, amt: float):
+    @read_only
+    def resolve(guild_id: int, title: str):
+        """
+        Returns the guild's bounty titled `title`, or else the only one whose
+        title contains it. Returns None if that's ambiguous.
+        """
         with open_db() as c:
-            c.execute(
-                "INSERT INTO bounty (title, owner_id, guild_id, channel_id, message_id, amt) " \
-                "VALUES (?, ?, ?, ?, ?, ?)",
-                (title, owner_id, guild_id, channel_id, message_id, amt)
-            )
+            result = c.execute(
+                "SELECT * FROM bounty WHERE guild_id=(?) AND title=(?) COLLATE NOCASE",
+                (guild_id, title)
+            ).fetchone()
+            if result is None:
+                results = search_rows(c, "bounty", "title", title, 2,
+                    "bounty.guild_id=(?)", (guild_id,), fuzzy=False)
+                if len(results) == 1:
+                    result = results[0]
+
+            if result:
+                return BountyModel(*result)
+            else:
+                return None
+
+    @staticmethod
+    @read_only
+    def search(guild_id: int, query: str, limit: int = 10):
+        """
+        Returns the guild's bounties best matching query, including near
+        misses.
+        """
+        with open_db() as c:
+            results = search_rows(c, "bounty", "title", query, limit,
+                "bounty.guild_id=(?)", (guild_id,))
+            return list(map(lambda x: BountyModel(*x), results))
 
-    def __init__(self, title: str, owner_id: int, guild_id: int, channel_id: int,
-        message_id: int, amt: float):
+    @staticmethod
+    @read_only
+    def get_by_guild(guild_id: int):
+        with open_db() as c:
+            results = c.execute(
+                "SELECT * FROM bounty WHERE guild_id=(?) ORDER BY id",
+                (guild_id,)
+            ).fetchall()
+            return list(map(lambda x: BountyModel(*x), results))
+
+    @staticmethod
+    @read_only
+    def get_claim(message_id: int):
+        """
+        Returns (bounty, claimant_id) for a claim message, or None.
+        """
+        with open_db() as c:
+            result = c.execute(
+                """
+                SELECT bounty.*, bounty_claim.claimant_id
+                FROM bounty_claim JOIN bounty ON bounty.id = bounty_claim.bounty_id
+                WHERE bounty_claim.message_id=(?)
+                """,
+                (message_id,)
+            ).fetchone()
+            if result:
+                return BountyModel(*result[:-1]), result[-1]
+            return None
+
+    @staticmethod
+    def create(title: str, owner_id: int, guild_id: int, channel_id: int, amt: float):
+        """
+        Moves the reward into escrow and opens the bounty, returning it,
+        TAKEN if a bounty already has the title or None if the owner can't
+        afford it.
+        """
+        with open_db() as c:
+            result = c.execute(
+                "INSERT INTO bounty (title, owner_id, guild_id, channel_id, amt) " \
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT DO NOTHING RETURNING id",
+                (title, owner_id, guild_id, channel_id, amt)
+            ).fetchone()
+            if result is None:
+                return BountyModel.TAKEN
+            if not CurrencyModel.move(c, owner_id, BountyModel.ESCROW_ID, amt, "bounty"):
+                c.execute("DELETE FROM bounty WHERE id=(?)", (result[0],))
+                return None
+            return BountyModel(result[0], title, owner_id, guild_id,
+                channel_id, None, amt)
+
+    def __init__(self, id: int, title: str, owner_id: int, guild_id: int,
+        channel_id: int, message_id: int, amt: float):
+        self.id = id
         self.title = title
         self.owner_id = owner_id
         self.guild_id = guild_id
@@ -511,23 +1486,230 @@ class BountyModel(object):
         self.message_id = message_id
         self.amt = amt
 
-    def contribute(self, amt: float):
+    @property
+    def jump_url(self):
+        url = f"https://discord.com/channels/{self.guild_id}/{self.channel_id}"
+        return url if self.message_id is None else f"{url}/{self.message_id}"
+
+    def set_message(self, message_id: int):
+        with open_db() as c:
+            c.execute("UPDATE bounty SET message_id=(?) WHERE id=(?)",
+                (message_id, self.id))
+        self.message_id = message_id
+
+    def contribute(self, member_id: int, amt: float):
+        """
+        Adds a member's coins to the reward, returning False if they can't
+        afford it or None if the bounty has closed.
+        """
+        with open_db() as c:
+            if c.execute("SELECT 1 FROM bounty WHERE id=(?)", (self.id,)).fetchone() is None:
+                return None
+            if not CurrencyModel.move(c, member_id, BountyModel.ESCROW_ID, amt, "bounty"):
+                return False
+            self.amt = c.execute(
+                "UPDATE bounty SET amt = amt + (?) WHERE id=(?) RETURNING amt",
+                (amt, self.id)
+            ).fetchone()[0]
+        return True
+
+    def add_claim(self, claimant_id: int, message_id: int):
         with open_db() as c:
             c.execute(
-                """
-                UPDATE bounty SET amt=(?) WHERE
-                "title like (?) AND owner_id=(?)
-                """,
-                (amt + self.amt, self.title, self.owner_id)
+                "INSERT INTO bounty_claim (bounty_id, claimant_id, message_id) " \
+                "VALUES (?, ?, ?)",
+                (self.id, claimant_id, message_id)
             )
-        self.amt += amt
+        after_commit(lambda: BountyModel.claim_ids.add(message_id))
+
+    def _close(self, c: sqlite3.Connection):
+        claims = c.execute(
+            "DELETE FROM bounty_claim WHERE bounty_id=(?) RETURNING message_id",
+            (self.id,)
+        ).fetchall()
+        c.execute("DELETE FROM bounty WHERE id=(?)", (self.id,))
+        after_commit(lambda: BountyModel.claim_ids.difference_update(x[0] for x in claims))
+
+    def pay_out(self, claimant_id: int):
+        """
+        Pays the escrowed reward to the claimant and closes the bounty in
+        one transaction. Returns False if it was already closed.
+        """
+        with open_db() as c:
+            result = c.execute("SELECT amt FROM bounty WHERE id=(?)", (self.id,)).fetchone()
+            if result is None:
+                return False
+            # Escrow holds exactly the open rewards, barring float rounding
+            CurrencyModel.move(c, BountyModel.ESCROW_ID, claimant_id, result[0],
+                "bounty_payout", require_funds=False)
+            self._close(c)
+            return True
+
+    def cancel(self):
+        """
+        Refunds the escrowed reward to the owner and closes the bounty.
+        """
+        with open_db() as c:
+            result = c.execute("SELECT amt FROM bounty WHERE id=(?)", (self.id,)).fetchone()
+            if result is None:
+                return
+            CurrencyModel.move(c, BountyModel.ESCROW_ID, self.owner_id, result[0],
+                "refund", require_funds=False)
+            self._close(c)
+
+class JobModel(Model):
+    """
+    Persisted fire times for the scheduler. Recurring jobs have no handler,
+    one-shot jobs name the handler that runs their JSON payload.
+    """
+
+    @staticmethod
+    @read_only
+    def get_one_shot():
+        with open_db() as c:
+            results = c.execute(
+                "SELECT * FROM scheduled_job WHERE handler IS NOT NULL"
+            ).fetchall()
+            return list(map(lambda x: JobModel(*x), results))
 
-    def complete(self):
+    @staticmethod
+    def get_or_add(name: str, next_fire: float):
+        """
+        Returns the persisted next fire time of a recurring job,
+        registering it with `next_fire` if it's new.
+        """
         with open_db() as c:
             c.execute(
-                """
-                DELETE FROM bounty WHERE
-                title like (?) AND owner_id=(?)
-                """,
-                (self.title, self.owner_id)
-            )
\ No newline at end of file
+                "INSERT OR IGNORE INTO scheduled_job VALUES (?, NULL, NULL, ?)",
+                (name, next_fire)
+            )
+            result = c.execute(
+                "SELECT next_fire FROM scheduled_job WHERE name=(?)",
+                (name,)
+            ).fetchone()
+            return result[0]
+
+    @staticmethod
+    def add(name: str, handler: str, payload: str, next_fire: float):
+        with open_db() as c:
+            c.execute(
+                "INSERT INTO scheduled_job VALUES (?, ?, ?, ?)",
+                (name, handler, payload, next_fire)
+            )
+
+    @staticmethod
+    def claim(name: str, fire_at: float, next_fire: float = None):
+        """
+        Marks the slot at `fire_at` as fired, moving the job on to
+        `next_fire` (or removing it). Returns False if the slot was
+        already claimed.
+        """
+        with open_db() as c:
+            if next_fire is None:
+                claimed = c.execute(
+                    "DELETE FROM scheduled_job WHERE name=(?) AND next_fire=(?)",
+                    (name, fire_at)
+                ).rowcount
+            else:
+                claimed = c.execute(
+                    "UPDATE scheduled_job SET next_fire=(?) " \
+                    "WHERE name=(?) AND next_fire=(?)",
+                    (next_fire, name, fire_at)
+                ).rowcount
+            return claimed == 1
+
+    @staticmethod
+    def delete(name: str):
+        with open_db() as c:
+            c.execute("DELETE FROM scheduled_job WHERE name=(?)", (name,))
+
+    def __init__(self, name: str, handler: str, payload: str, next_fire: float):
+        self.name = name
+        self.handler = handler
+        self.payload = payload
+        self.next_fire = next_fire
+
+class ReminderModel(Model):
+    """
+    Pending reminders, stored as compact IDs rather than Discord objects.
+    Recurring reminders have an interval in seconds.
+    """
+
+    @staticmethod
+    @read_only
+    def get_schedule():
+        """
+        Returns (due, id) for every pending reminder.
+        """
+        with open_db() as c:
+            return c.execute("SELECT due, id FROM reminder").fetchall()
+
+    @staticmethod
+    @read_only
+    def get_by_author(author_id: int, n: int = 25):
+        with open_db() as c:
+            results = c.execute(
+                "SELECT * FROM reminder WHERE author_id=(?) ORDER BY due LIMIT (?)",
+                (author_id, n)
+            ).fetchall()
+            return list(map(lambda x: ReminderModel(*x), results))
+
+    @staticmethod
+    def create(channel_id: int, author_id: int, member_ids, reason: str,
+        due: float, interval: float = None):
+        member_ids = ",".join(str(x) for x in member_ids)
+        with open_db() as c:
+            rowid = c.execute(
+                "INSERT INTO reminder(channel_id, author_id, member_ids, reason, due, interval) " \
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (channel_id, author_id, member_ids, reason, due, interval)
+            ).lastrowid
+            return ReminderModel(rowid, channel_id, author_id, member_ids,
+                reason, due, interval)
+
+    @staticmethod
+    def claim(id: int, due: float, now: float):
+        """
+        Takes the reminder due at `due` for sending, moving a recurring one
+        to its next future occurrence and deleting the rest. Returns None if
+        it was cancelled or already claimed.
+        """
+        with open_db() as c:
+            result = c.execute(
+                "SELECT * FROM reminder WHERE id=(?) AND due=(?)",
+                (id, due)
+            ).fetchone()
+            if result is None:
+                return None
+
+            reminder = ReminderModel(*result)
+            if reminder.interval:
+                missed = max(0, int((now - due) // reminder.interval))
+                reminder.next_due = due + (missed + 1) * reminder.interval
+                c.execute(
+                    "UPDATE reminder SET due=(?) WHERE id=(?)",
+                    (reminder.next_due, id)
+                )
+            else:
+                c.execute("DELETE FROM reminder WHERE id=(?)", (id,))
+            return reminder
+
+    @staticmethod
+    def delete(id: int, author_id: int):
+        with open_db() as c:
+            deleted = c.execute(
+                "DELETE FROM reminder WHERE id=(?) AND author_id=(?)",
+                (id, author_id)
+            ).rowcount
+            return deleted == 1
+
+    def __init__(self, id: int, channel_id: int, author_id: int, member_ids: str,
+        reason: str, due: float, interval: float):
+        self.id = id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.member_ids = [int(x) for x in member_ids.split(",") if x]
+        self.reason = reason
+        self.due = due
+        self.interval = interval
+        self.next_due = None
@@ -0,0 +1,14 @@
+import re
+
+CUSTOM_EMOJI = re.compile(r"<a?:\w+:(\d+)>")
+
+def emoji_key(emoji):
+    """
+    Identifies an emoji given as text or a reaction's emoji. Custom emojis
+    are keyed by ID since their names aren't unique, unicode emojis by
+    themselves.
+    """
+    if not isinstance(emoji, str):
+        return str(emoji.id) if emoji.id else emoji.name
+    match = CUSTOM_EMOJI.fullmatch(emoji.strip())
+    return match.group(1) if match else emoji.strip()
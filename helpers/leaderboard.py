@@ -0,0 +1,87 @@
+"""
+In-memory per-guild ARC coin rankings.
+
+Loaded once at startup and kept current by CurrencyModel/MemberModel, so
+`.leaderboard` and `.rank` never touch the database. A member is ranked in
+a guild once they have both a member row there and a currency account.
+"""
+
+import threading
+from itertools import islice
+
+from sortedcontainers import SortedList
+
+class LeaderboardIndex(object):
+    def __init__(self):
+        # Writes come from the DB writer thread, reads from the event loop
+        self.lock = threading.Lock()
+        self.balances = {}
+        self.guilds = {}
+        # guild_id -> SortedList of (-balance, member_id), richest first
+        self.rankings = {}
+
+    def load(self, rows):
+        """
+        Rebuilds the index from (member_id, guild_id, balance) rows, where
+        balance is None for members without a currency account.
+        """
+        with self.lock:
+            self.balances.clear()
+            self.guilds.clear()
+            entries = {}
+            for member_id, guild_id, balance in rows:
+                self.guilds.setdefault(member_id, set()).add(guild_id)
+                if balance is not None:
+                    self.balances[member_id] = balance
+                    entries.setdefault(guild_id, []).append((-balance, member_id))
+            self.rankings = {guild_id: SortedList(guild_entries)
+                for guild_id, guild_entries in entries.items()}
+
+    def add_member(self, member_id: int, guild_id: int):
+        with self.lock:
+            guilds = self.guilds.setdefault(member_id, set())
+            if guild_id in guilds:
+                return
+            guilds.add(guild_id)
+
+            balance = self.balances.get(member_id)
+            if balance is not None:
+                ranking = self.rankings.setdefault(guild_id, SortedList())
+                ranking.add((-balance, member_id))
+
+    def update(self, member_id: int, balance: float):
+        with self.lock:
+            old = self.balances.get(member_id)
+            if old == balance:
+                return
+            self.balances[member_id] = balance
+
+            for guild_id in self.guilds.get(member_id, ()):
+                ranking = self.rankings.setdefault(guild_id, SortedList())
+                if old is not None:
+                    ranking.discard((-old, member_id))
+                ranking.add((-balance, member_id))
+
+    def top(self, guild_id: int, n: int = 10):
+        """
+        Returns up to n (member_id, balance) pairs, richest first.
+        """
+        with self.lock:
+            ranking = self.rankings.get(guild_id, ())
+            return [(member_id, -neg_balance)
+                for neg_balance, member_id in islice(ranking, n)]
+
+    def rank(self, guild_id: int, member_id: int):
+        """
+        Returns (position, balance, ranked member count) or None if the
+        member isn't ranked in the guild.
+        """
+        with self.lock:
+            balance = self.balances.get(member_id)
+            ranking = self.rankings.get(guild_id)
+            if balance is None or ranking is None \
+                or guild_id not in self.guilds.get(member_id, ()):
+                return None
+            return ranking.index((-balance, member_id)) + 1, balance, len(ranking)
+
+leaderboard = LeaderboardIndex()
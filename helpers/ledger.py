@@ -0,0 +1,90 @@
+"""
+Rebuilds currency balances from the ledger.
+
+Streams every ledger entry in order, so memory only grows with the number
+of accounts, and compares the result with the currency table.
+
+Usage (from the bot's directory):
+    python -m helpers.ledger           # report mismatched balances
+    python -m helpers.ledger --apply   # overwrite balances and snapshot
+    python -m helpers.ledger --history MEMBER_ID [-n 20]  # a member's latest entries
+"""
+
+import argparse
+import sys
+import time
+
+from helpers.db_manager import init_db, open_db, LedgerModel
+
+# Balances are stored as REAL, so ignore rounding noise when comparing
+EPSILON = 1e-6
+
+def replay():
+    """
+    Sums every member's ledger entries in a single streaming pass.
+    """
+    balances = {}
+    cursor = open_db().execute("SELECT member_id, amount FROM ledger ORDER BY id")
+    for member_id, amount in cursor:
+        balances[member_id] = balances.get(member_id, 0.0) + amount
+    return balances
+
+def find_mismatches(balances):
+    mismatches = []
+    stored = dict(open_db().execute("SELECT member_id, balance FROM currency"))
+    for member_id in stored.keys() | balances.keys():
+        expected = balances.get(member_id, 0.0)
+        actual = stored.get(member_id, 0.0)
+        if abs(expected - actual) > EPSILON:
+            mismatches.append((member_id, actual, expected))
+    return mismatches
+
+def apply(balances):
+    with open_db() as c:
+        # Accounts without entries have no history, so they rebuild to zero
+        c.execute("UPDATE currency SET balance=0.0")
+        c.executemany(
+            "INSERT INTO currency(member_id, balance) VALUES (?, ?) " \
+            "ON CONFLICT(member_id) DO UPDATE SET balance=excluded.balance",
+            balances.items()
+        )
+    LedgerModel.snapshot()
+
+def print_history(member_id: int, n: int):
+    entries = LedgerModel.get_history(member_id, n)
+    for entry in entries:
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.created_at))
+        counterparty = "" if entry.counterparty_id is None else f" with {entry.counterparty_id}"
+        print(f"#{entry.id} {when} {entry.amount:+g} {entry.kind}{counterparty}")
+    print(f"{len(entries)} latest entries, ledger balance " \
+        f"{LedgerModel.get_balance(member_id):g}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild balances from the ledger.")
+    parser.add_argument("--apply", action="store_true",
+        help="write rebuilt balances to the currency table")
+    parser.add_argument("--history", type=int, metavar="MEMBER_ID",
+        help="print a member's latest entries instead of checking balances")
+    parser.add_argument("-n", type=int, default=10,
+        help="entries shown with --history (default 10)")
+    args = parser.parse_args()
+
+    init_db()
+    if args.history is not None:
+        print_history(args.history, args.n)
+        return
+
+    balances = replay()
+    mismatches = find_mismatches(balances)
+    for member_id, actual, expected in mismatches:
+        print(f"{member_id}: stored {actual}, ledger {expected}")
+    print(f"{len(balances)} accounts replayed, {len(mismatches)} mismatched")
+
+    if args.apply:
+        apply(balances)
+        print("Balances rebuilt from ledger")
+    elif mismatches:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+Versioned schema migrations.
+
+The schema version is tracked with `PRAGMA user_version`. Each entry in
+MIGRATIONS upgrades the database by one version inside its own transaction,
+so a database that is already current skips every DDL statement.
+"""
+
+import logging as log
+import sqlite3
+
+from helpers.emoji import emoji_key
+
+def create_tables(c: sqlite3.Connection):
+    # Member tables
+    c.execute("CREATE TABLE IF NOT EXISTS member(member_id INTEGER, " \
+        "guild_id INTEGER, verified INTEGER, code INTEGER)")
+    c.execute("CREATE TABLE IF NOT EXISTS member_arcdle(arcdle_rowid INTEGER PRIMARY KEY, " \
+        "member_id INTEGER, guild_id INTEGER, channel_id INTEGER) WITHOUT ROWID")
+
+    # Currency table
+    c.execute("CREATE TABLE IF NOT EXISTS currency(member_id INTEGER PRIMARY KEY, balance REAL)")
+
+    # Verification table
+    c.execute("CREATE TABLE IF NOT EXISTS verification(guild_id INT, " \
+        "role_id INT, domain TEXT)")
+
+    # Role menu table
+    c.execute("CREATE TABLE IF NOT EXISTS rolemenu(message_id INTEGER, " \
+        "guild_id INTEGER, role TEXT, emoji TEXT)")
+
+    # ARCdle table
+    c.execute("CREATE TABLE IF NOT EXISTS arcdle(message_id INTEGER, visible TEXT, " \
+        "hidden TEXT, status INT)")
+
+    # Daily ARCoin table
+    c.execute("CREATE TABLE IF NOT EXISTS daily(member_id INTEGER PRIMARY KEY)")
+
+    # Backlog table
+    c.execute("CREATE TABLE IF NOT EXISTS backlog(id INTEGER PRIMARY KEY, item TEXT)")
+
+    # Calendar table
+    c.execute("CREATE TABLE IF NOT EXISTS calendar(guild_id INTEGER, " \
+        "channel_id INTEGER, calendar_id TEXT)")
+
+    # Bounty table
+    c.execute("CREATE TABLE IF NOT EXISTS bounty(title TEXT, " \
+        "owner_id INT, guild_id INT, channel_id INT, message_id INT, amt REAL)")
+
+def delete_duplicates(c: sqlite3.Connection, table: str, key: str, order: str = "rowid"):
+    """
+    Keeps the first row (by `order`) of each `key` group in `table`.
+    """
+    c.execute(
+        f"""
+        DELETE FROM {table} WHERE rowid IN (
+            SELECT rowid FROM (
+                SELECT rowid, ROW_NUMBER() OVER (
+                    PARTITION BY {key} ORDER BY {order}) AS n
+                FROM {table}
+            ) WHERE n > 1
+        )
+        """
+    )
+
+def add_indexes(c: sqlite3.Connection):
+    # Prefer the verified row when a member was inserted more than once
+    delete_duplicates(c, "member", "member_id, guild_id", "verified DESC, rowid")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS member_key " \
+        "ON member(member_id, guild_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS member_guild ON member(guild_id)")
+
+    c.execute("CREATE INDEX IF NOT EXISTS member_arcdle_member " \
+        "ON member_arcdle(member_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS arcdle_status ON arcdle(status)")
+
+    # Configure rewrites every row for a guild, so keep the latest
+    delete_duplicates(c, "verification", "guild_id", "rowid DESC")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS verification_key " \
+        "ON verification(guild_id)")
+
+    delete_duplicates(c, "rolemenu", "message_id, guild_id, role, emoji")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS rolemenu_key " \
+        "ON rolemenu(message_id, guild_id, role, emoji)")
+
+    delete_duplicates(c, "calendar", "guild_id, channel_id, calendar_id")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS calendar_key " \
+        "ON calendar(guild_id, channel_id, calendar_id)")
+
+    c.execute("CREATE INDEX IF NOT EXISTS bounty_title " \
+        "ON bounty(title COLLATE NOCASE)")
+
+def add_ledger(c: sqlite3.Connection):
+    c.execute("CREATE TABLE IF NOT EXISTS ledger(id INTEGER PRIMARY KEY, " \
+        "member_id INTEGER, amount REAL, kind TEXT, counterparty_id INTEGER, " \
+        "created_at INTEGER)")
+    c.execute("CREATE INDEX IF NOT EXISTS ledger_member ON ledger(member_id, id)")
+    c.execute("CREATE TABLE IF NOT EXISTS ledger_snapshot(member_id INTEGER, " \
+        "ledger_id INTEGER, balance REAL, PRIMARY KEY (member_id, ledger_id)) " \
+        "WITHOUT ROWID")
+
+    # Open every existing account with its current balance
+    c.execute(
+        """
+        INSERT INTO ledger(member_id, amount, kind, created_at)
+        SELECT member_id, balance, 'opening', CAST(strftime('%s', 'now') AS INTEGER)
+        FROM currency WHERE balance != 0
+        """
+    )
+
+def add_scheduled_jobs(c: sqlite3.Connection):
+    c.execute("CREATE TABLE IF NOT EXISTS scheduled_job(name TEXT PRIMARY KEY, " \
+        "handler TEXT, payload TEXT, next_fire REAL)")
+
+def add_reminders(c: sqlite3.Connection):
+    c.execute("CREATE TABLE IF NOT EXISTS reminder(id INTEGER PRIMARY KEY, " \
+        "channel_id INTEGER, author_id INTEGER, member_ids TEXT, reason TEXT, " \
+        "due REAL, interval REAL)")
+    c.execute("CREATE INDEX IF NOT EXISTS reminder_due ON reminder(due)")
+    c.execute("CREATE INDEX IF NOT EXISTS reminder_author ON reminder(author_id)")
+
+    # Move reminders off the generic scheduler, their author wasn't recorded
+    c.execute(
+        """
+        INSERT INTO reminder(channel_id, author_id, member_ids, reason, due)
+        SELECT json_extract(payload, '$.channel_id'), 0,
+            trim(json_extract(payload, '$.member_ids'), '[]'),
+            json_extract(payload, '$.reason'), next_fire
+        FROM scheduled_job WHERE handler = 'reminder'
+        """
+    )
+    c.execute("DELETE FROM scheduled_job WHERE handler = 'reminder'")
+
+def add_calendar_events(c: sqlite3.Connection):
+    c.execute("CREATE TABLE IF NOT EXISTS calendar_event(calendar_id TEXT, " \
+        "event_id TEXT, start REAL, end REAL, data TEXT, " \
+        "PRIMARY KEY(calendar_id, event_id))")
+    c.execute("CREATE INDEX IF NOT EXISTS calendar_event_start " \
+        "ON calendar_event(calendar_id, start)")
+    c.execute("CREATE INDEX IF NOT EXISTS calendar_event_end ON calendar_event(end)")
+    c.execute("CREATE TABLE IF NOT EXISTS calendar_sync(calendar_id TEXT PRIMARY KEY, " \
+        "sync_token TEXT, synced_at REAL)")
+
+def add_calendar_meta(c: sqlite3.Connection):
+    c.execute("CREATE TABLE IF NOT EXISTS calendar_meta(calendar_id TEXT PRIMARY KEY, " \
+        "name TEXT, timezone TEXT, fetched_at REAL)")
+
+def add_outbox(c: sqlite3.Connection):
+    c.execute("CREATE TABLE IF NOT EXISTS outbox(id INTEGER PRIMARY KEY, " \
+        "recipient TEXT, subject TEXT, body TEXT, notify_id INTEGER, " \
+        "status INTEGER DEFAULT 0, attempts INTEGER DEFAULT 0, next_attempt REAL, " \
+        "error TEXT, updated_at REAL)")
+    c.execute("CREATE INDEX IF NOT EXISTS outbox_pending ON outbox(next_attempt) " \
+        "WHERE status = 0")
+
+def add_verif_codes(c: sqlite3.Connection):
+    c.execute("CREATE TABLE IF NOT EXISTS verif_code(member_id INTEGER PRIMARY KEY, " \
+        "guild_id INTEGER, code INTEGER, code_expires REAL, tokens REAL, " \
+        "updated REAL, expires REAL)")
+    c.execute("CREATE INDEX IF NOT EXISTS verif_code_expires ON verif_code(expires)")
+    # Codes used to never expire, make members request fresh ones
+    c.execute("UPDATE member SET code = 0")
+
+def add_rolemenu_ids(c: sqlite3.Connection):
+    c.execute("ALTER TABLE rolemenu ADD COLUMN role_id INTEGER")
+    c.execute("ALTER TABLE rolemenu ADD COLUMN emoji_key TEXT")
+    rows = c.execute("SELECT rowid, emoji FROM rolemenu").fetchall()
+    c.executemany("UPDATE rolemenu SET emoji_key=(?) WHERE rowid=(?)",
+        ((emoji_key(emoji), rowid) for rowid, emoji in rows))
+    delete_duplicates(c, "rolemenu", "message_id, emoji_key")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS rolemenu_emoji " \
+        "ON rolemenu(message_id, emoji_key)")
+    # Role IDs of existing rows are filled in from role names once the bot
+    # can see its guilds, see RoleMenuModel.get_unresolved
+
+def add_rolemenu_channels(c: sqlite3.Connection):
+    # Unknown for older menus until reconciliation finds their channel
+    c.execute("ALTER TABLE rolemenu ADD COLUMN channel_id INTEGER")
+
+def add_bounty_claims(c: sqlite3.Connection):
+    # Rebuilt to give bounties an id and a case-insensitive unique title.
+    # Bounties whose title repeats an earlier one are dropped, so their
+    # coins go back to their owners first.
+    duplicates = c.execute(
+        """
+        SELECT owner_id, amt FROM (
+            SELECT owner_id, amt, ROW_NUMBER() OVER (
+                PARTITION BY title COLLATE NOCASE ORDER BY rowid) AS n
+            FROM bounty
+        ) WHERE n > 1 AND amt > 0
+        """
+    ).fetchall()
+    c.executemany("INSERT OR IGNORE INTO currency VALUES (?, 0.0)",
+        ((owner_id,) for owner_id, _ in duplicates))
+    c.executemany("UPDATE currency SET balance = balance + (?) WHERE member_id=(?)",
+        ((amt, owner_id) for owner_id, amt in duplicates))
+    c.executemany(
+        "INSERT INTO ledger(member_id, amount, kind, created_at) " \
+        "VALUES (?, ?, 'refund', CAST(strftime('%s', 'now') AS INTEGER))",
+        duplicates
+    )
+    delete_duplicates(c, "bounty", "title COLLATE NOCASE")
+    c.execute("CREATE TABLE bounty_new(id INTEGER PRIMARY KEY, title TEXT COLLATE NOCASE, " \
+        "owner_id INTEGER, guild_id INTEGER, channel_id INTEGER, message_id INTEGER, " \
+        "amt REAL)")
+    c.execute("INSERT INTO bounty_new(title, owner_id, guild_id, channel_id, message_id, amt) " \
+        "SELECT title, owner_id, guild_id, channel_id, message_id, amt FROM bounty ORDER BY rowid")
+    c.execute("DROP TABLE bounty")
+    c.execute("ALTER TABLE bounty_new RENAME TO bounty")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS bounty_title ON bounty(title COLLATE NOCASE)")
+    c.execute("CREATE INDEX IF NOT EXISTS bounty_guild ON bounty(guild_id, id)")
+
+    c.execute("CREATE TABLE IF NOT EXISTS bounty_claim(id INTEGER PRIMARY KEY, " \
+        "bounty_id INTEGER, claimant_id INTEGER, message_id INTEGER)")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS bounty_claim_message " \
+        "ON bounty_claim(message_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS bounty_claim_bounty ON bounty_claim(bounty_id)")
+
+    # Coins of open bounties were taken from their owners without being held
+    # anywhere, so the escrow account starts with their total
+    c.execute("INSERT OR IGNORE INTO currency VALUES (0, 0.0)")
+    c.execute("UPDATE currency SET balance = balance + " \
+        "(SELECT coalesce(sum(amt), 0) FROM bounty) WHERE member_id = 0")
+    c.execute(
+        """
+        INSERT INTO ledger(member_id, amount, kind, created_at)
+        SELECT 0, sum(amt), 'opening', CAST(strftime('%s', 'now') AS INTEGER)
+        FROM bounty HAVING sum(amt) > 0
+        """
+    )
+
+def add_search_index(c: sqlite3.Connection):
+    # Trigram indexes over the backlog and bounty titles, which match
+    # substrings and let search rank near misses. They store no text of their
+    # own and are kept in step with their tables by the triggers below.
+    for table, column in (("backlog", "item"), ("bounty", "title")):
+        c.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(" \
+            f"{column}, content='{table}', content_rowid='id', tokenize='trigram')")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} " \
+            f"BEGIN INSERT INTO {table}_fts(rowid, {column}) VALUES (new.id, new.{column}); END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} " \
+            f"BEGIN INSERT INTO {table}_fts({table}_fts, rowid, {column}) " \
+            f"VALUES ('delete', old.id, old.{column}); END")
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {column} ON {table} " \
+            f"BEGIN INSERT INTO {table}_fts({table}_fts, rowid, {column}) " \
+            f"VALUES ('delete', old.id, old.{column}); " \
+            f"INSERT INTO {table}_fts(rowid, {column}) VALUES (new.id, new.{column}); END")
+        c.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+
+def add_arcdle_guesses(c: sqlite3.Connection):
+    # Plain words guessed so far, comma separated, for hints
+    c.execute("ALTER TABLE arcdle ADD COLUMN guesses TEXT NOT NULL DEFAULT ''")
+
+def add_search_vocab(c: sqlite3.Connection):
+    # Per-trigram row counts, so fuzzy search can skip common trigrams
+    for table in ("backlog", "bounty"):
+        c.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table}_vocab " \
+            f"USING fts5vocab({table}_fts, row)")
+
+def drop_member_codes(c: sqlite3.Connection):
+    # Codes live in verif_code since the code store replaced this column
+    c.execute("ALTER TABLE member DROP COLUMN code")
+
+def scope_bounty_titles(c: sqlite3.Connection):
+    # Titles only need to be unique within a guild
+    c.execute("DROP INDEX IF EXISTS bounty_title")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS bounty_title " \
+        "ON bounty(guild_id, title COLLATE NOCASE)")
+
+# Order matters: the database's user_version is the number of entries applied
+MIGRATIONS = [
+    create_tables,
+    add_indexes,
+    add_ledger,
+    add_scheduled_jobs,
+    add_reminders,
+    add_calendar_events,
+    add_calendar_meta,
+    add_outbox,
+    add_verif_codes,
+    add_rolemenu_ids,
+    add_rolemenu_channels,
+    add_bounty_claims,
+    add_search_index,
+    add_arcdle_guesses,
+    add_search_vocab,
+    drop_member_codes,
+    scope_bounty_titles,
+]
+
+def migrate(con: sqlite3.Connection):
+    """
+    Applies any migrations newer than the database's user_version.
+    """
+    version = con.execute("PRAGMA user_version").fetchone()[0]
+    if version >= len(MIGRATIONS):
+        return
+
+    for i in range(version, len(MIGRATIONS)):
+        migration = MIGRATIONS[i]
+        try:
+            con.execute("BEGIN")
+            migration(con)
+            con.execute(f"PRAGMA user_version={i + 1}")
+            con.commit()
+        except sqlite3.Error:
+            con.rollback()
+            raise
+        log.info(f"Applied database migration {i + 1} ({migration.__name__})")
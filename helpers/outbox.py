@@ -0,0 +1,232 @@
+"""
+Sends queued emails in the background over pooled SMTP sessions.
+
+Messages are persisted in the outbox table before anything is sent, so the
+bot never blocks on SMTP and nothing is lost if it restarts. A worker task
+claims due messages in batches, splits each batch across a few
+authenticated sessions running on their own threads, and retries
+temporary failures with exponential backoff.
+"""
+
+import asyncio
+import logging as log
+import queue
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+from helpers.db_manager import OutboxModel
+
+# Authenticated SMTP sessions kept open, which is also how many send at once
+POOL_SIZE = 3
+# Messages claimed from the outbox at a time
+BATCH_SIZE = 30
+# Seconds a claimed batch has to be delivered before it's claimed again
+LEASE = 300
+# Seconds before an SMTP connect or command is abandoned
+SMTP_TIMEOUT = 30
+# Sessions idle longer than this are checked with NOOP before reuse
+IDLE_CHECK = 60
+# Delay before the first retry, doubled after every further attempt
+BACKOFF = 30
+MAX_ATTEMPTS = 6
+
+def is_permanent(error: Exception):
+    """
+    Whether retrying can't help, e.g. the address was rejected.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        # A 4xx refusal (e.g. a full mailbox or greylisting) can clear up
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        # Bad credentials affect every message, retry while an admin fixes them
+        return False
+    return isinstance(error, smtplib.SMTPResponseException) \
+        and 500 <= error.smtp_code < 600
+
+class SMTPPool(object):
+    """
+    Reuses logged-in SMTP sessions across threads. A session is only ever
+    used by the thread that checked it out. `tls` upgrades each session
+    with STARTTLS before logging in.
+    """
+
+    def __init__(self, host: str, port: int, user: str, password: str,
+        size: int = POOL_SIZE, tls: bool = True):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.size = size
+        self.tls = tls
+        # Most recently used first, so idle sessions age out
+        self.sessions = queue.LifoQueue()
+
+    def _connect(self):
+        session = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        session.ehlo()
+        if self.tls:
+            session.starttls()
+            session.ehlo()
+        session.login(self.user, self.password)
+        return session
+
+    def _checkout(self):
+        try:
+            session, last_used = self.sessions.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+        if time.monotonic() - last_used > IDLE_CHECK:
+            try:
+                if session.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected()
+            except (smtplib.SMTPException, OSError):
+                self._discard(session)
+                return self._connect()
+        return session
+
+    def _checkin(self, session: smtplib.SMTP):
+        self.sessions.put((session, time.monotonic()))
+
+    def _discard(self, session: smtplib.SMTP):
+        try:
+            session.quit()
+        except (smtplib.SMTPException, OSError):
+            session.close()
+
+    def send_all(self, messages):
+        """
+        Sends messages over one session, returning None or the raised error
+        for each. A session that drops is replaced for the rest.
+        """
+        results = []
+        session = None
+        for message in messages:
+            try:
+                if session is None:
+                    session = self._checkout()
+                session.send_message(message)
+                results.append(None)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                smtplib.SMTPDataError) as e:
+                # The server rejected this message but the session is fine
+                results.append(e)
+            except (smtplib.SMTPException, OSError) as e:
+                results.append(e)
+                if session is not None:
+                    self._discard(session)
+                    session = None
+        if session is not None:
+            self._checkin(session)
+        return results
+
+    def close(self):
+        while not self.sessions.empty():
+            self._discard(self.sessions.get_nowait()[0])
+
+class Outbox(object):
+    """
+    Delivers queued emails and reports each one's status through
+    `on_status(message, status)`. Status is SENT, RETRYING (only after
+    the first failed attempt) or FAILED.
+    """
+
+    SENT = "sent"
+    RETRYING = "retrying"
+    FAILED = "failed"
+
+    def __init__(self, pool: SMTPPool, sender: str, on_status,
+        batch_size: int = BATCH_SIZE, clock=time.time):
+        self.pool = pool
+        self.sender = sender
+        self.on_status = on_status
+        self.batch_size = batch_size
+        self.clock = clock
+        self.executor = ThreadPoolExecutor(max_workers=pool.size,
+            thread_name_prefix="smtp")
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def is_running(self):
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def send(self, recipient: str, subject: str, body: str, notify_id: int):
+        """
+        Queues an email. `notify_id` is passed back with its status.
+        """
+        id = await OutboxModel.aio.add(recipient, subject, body, notify_id)
+        self.wakeup.set()
+        return id
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                batch = await OutboxModel.aio.claim(self.clock(), LEASE, self.batch_size)
+                if batch:
+                    await self.deliver(batch)
+                    continue
+                next_attempt = await OutboxModel.aio.get_next_attempt()
+            except Exception:
+                log.exception("Outbox delivery failed")
+                next_attempt = self.clock() + BACKOFF
+
+            delay = None if next_attempt is None else max(next_attempt - self.clock(), 0)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _build(self, model: OutboxModel):
+        message = EmailMessage()
+        message.set_content(model.body)
+        message["Subject"] = model.subject
+        message["From"] = self.sender
+        message["To"] = model.recipient
+        return message
+
+    async def deliver(self, batch):
+        loop = asyncio.get_running_loop()
+        chunks = [batch[i::self.pool.size] for i in range(self.pool.size)]
+        chunks = [chunk for chunk in chunks if chunk]
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, self.pool.send_all,
+                [self._build(model) for model in chunk])
+            for chunk in chunks
+        ))
+
+        sent = []
+        statuses = []
+        for chunk, errors in zip(chunks, results):
+            for model, error in zip(chunk, errors):
+                if error is None:
+                    sent.append(model.id)
+                    statuses.append((model, self.SENT))
+                elif is_permanent(error) or model.attempts >= MAX_ATTEMPTS:
+                    log.error(f"Giving up on email {model.id}: {error!r}")
+                    await OutboxModel.aio.mark_failed(model.id, repr(error))
+                    statuses.append((model, self.FAILED))
+                else:
+                    delay = BACKOFF * 2 ** (model.attempts - 1)
+                    await OutboxModel.aio.retry(model.id, self.clock() + delay, repr(error))
+                    if model.attempts == 1:
+                        statuses.append((model, self.RETRYING))
+        if sent:
+            await OutboxModel.aio.mark_sent(sent)
+
+        for model, status in statuses:
+            try:
+                await self.on_status(model, status)
+            except Exception:
+                log.exception(f"Couldn't report status of email {model.id}")
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+        self.executor.shutdown(wait=False)
+        self.pool.close()
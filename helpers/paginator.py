@@ -0,0 +1,139 @@
+"""
+Splits long listings into embed pages that fit Discord's limits.
+
+Lines are pulled lazily from an iterable, so the first page is sent as soon
+as it's full and later pages are only rendered when someone pages to them.
+"""
+
+import disnake
+
+# Discord's limit on an embed description
+DESCRIPTION_LIMIT = 4096
+# Seconds the page buttons stay active after the last use
+PAGE_TIMEOUT = 180
+
+def paginate(lines, limit: int = DESCRIPTION_LIMIT, sep: str = "\n",
+    max_lines: int = None):
+    """
+    Groups strings into pages of at most `limit` characters, and at most
+    `max_lines` strings if given. Strings longer than a page are cut short.
+    """
+    page = []
+    size = 0
+    for line in lines:
+        if len(line) > limit:
+            line = line[:limit - 1] + "…"
+        extra = len(line) + (len(sep) if page else 0)
+        if page and (size + extra > limit or len(page) == max_lines):
+            yield sep.join(page)
+            page = []
+            extra = len(line)
+            size = 0
+        page.append(line)
+        size += extra
+    if page:
+        yield sep.join(page)
+
+class Paginator(disnake.ui.View):
+    """
+    Shows one page at a time with previous/next buttons. Pages already
+    seen are kept so going back doesn't re-render them.
+    """
+
+    def __init__(self, pages, make_embed, author_id: int = None,
+        timeout: float = PAGE_TIMEOUT):
+        super().__init__(timeout=timeout)
+        self.pages = iter(pages)
+        self.make_embed = make_embed
+        self.author_id = author_id
+        self.rendered = []
+        self.exhausted = False
+        self.index = 0
+        self.message = None
+
+    def _load(self, index: int):
+        """
+        Renders pages up to `index`, returning False if there aren't enough.
+        """
+        while len(self.rendered) <= index and not self.exhausted:
+            page = next(self.pages, None)
+            if page is None:
+                self.exhausted = True
+            else:
+                self.rendered.append(page)
+        return index < len(self.rendered)
+
+    def _embed(self):
+        embed = self.make_embed(self.rendered[self.index])
+        if self.index > 0 or self._load(1):
+            embed.set_footer(text=f"Page {self.index + 1}")
+        return embed
+
+    def _update_buttons(self):
+        self.previous.disabled = self.index == 0
+        self.next.disabled = not self._load(self.index + 1)
+
+    async def start(self, target: disnake.abc.Messageable, empty: str):
+        """
+        Sends the first page to `target`, or `empty` if there are no pages.
+        """
+        if not self._load(0):
+            await target.send(empty)
+            self.stop()
+            return
+        if not self._load(1):
+            # A single page needs no buttons
+            await target.send(embed=self._embed())
+            self.stop()
+            return
+        self._update_buttons()
+        self.message = await target.send(embed=self._embed(), view=self)
+
+    async def interaction_check(self, interaction: disnake.MessageInteraction):
+        if self.author_id is not None and interaction.author.id != self.author_id:
+            await interaction.response.send_message(
+                "Only the person who asked can turn the pages", ephemeral=True)
+            return False
+        return True
+
+    async def _show(self, interaction: disnake.MessageInteraction, index: int):
+        self.index = index
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self._embed(), view=self)
+
+    @disnake.ui.button(label="Previous", style=disnake.ButtonStyle.secondary)
+    async def previous(self, button: disnake.ui.Button, interaction: disnake.MessageInteraction):
+        await self._show(interaction, max(self.index - 1, 0))
+
+    @disnake.ui.button(label="Next", style=disnake.ButtonStyle.secondary)
+    async def next(self, button: disnake.ui.Button, interaction: disnake.MessageInteraction):
+        if self._load(self.index + 1):
+            await self._show(interaction, self.index + 1)
+
+    async def on_timeout(self):
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except disnake.HTTPException:
+                pass
+
+async def send_pages(target: disnake.abc.Messageable, title: str, lines,
+    empty: str, author_id: int = None, sep: str = "\n", max_lines: int = None,
+    **embed_kwargs):
+    """
+    Sends lines as paged embeds titled `title`, or `empty` if there are none.
+    """
+    def make_embed(text):
+        return disnake.Embed(title=title, description=text, **embed_kwargs)
+
+    pages = paginate(lines, sep=sep, max_lines=max_lines)
+    paginator = Paginator(pages, make_embed, author_id)
+    await paginator.start(target, empty)
+
+def embed_pages(title: str, lines, sep: str = "\n", max_lines: int = None,
+    **embed_kwargs):
+    """
+    Renders every page up front, for messages nobody will page through.
+    """
+    return [disnake.Embed(title=title, description=text, **embed_kwargs)
+        for text in paginate(lines, sep=sep, max_lines=max_lines)]
@@ -0,0 +1,127 @@
+"""
+Building blocks for background work that arrives in bursts: batching
+writes together and spacing out Discord API calls.
+"""
+
+import asyncio
+import collections
+import logging as log
+import time
+
+class TokenBucket(object):
+    """
+    Allows `rate` actions per second on average, with bursts of up to
+    `capacity` actions.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, n: float = 1):
+        """
+        Takes n tokens and returns 0, or returns the seconds until n
+        tokens will be available without taking any.
+        """
+        self._refill()
+        if self.tokens >= n:
+            self.tokens -= n
+            return 0
+        return (n - self.tokens) / self.rate
+
+class MicroBatcher(object):
+    """
+    Collects items and awaits `flush(items)` with up to `size` of them at
+    a time, waiting at most `delay` seconds for a batch to fill.
+    """
+
+    def __init__(self, flush, size: int = 100, delay: float = 0.5):
+        self.flush = flush
+        self.size = size
+        self.delay = delay
+        self.pending = []
+        self.full = asyncio.Event()
+        self.task = None
+        self.flushed = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, item):
+        self.pending.append(item)
+        if len(self.pending) >= self.size:
+            self.full.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self.pending:
+            if len(self.pending) < self.size:
+                try:
+                    await asyncio.wait_for(self.full.wait(), timeout=self.delay)
+                except asyncio.TimeoutError:
+                    pass
+            self.full.clear()
+
+            batch = self.pending[:self.size]
+            del self.pending[:self.size]
+            try:
+                await self.flush(batch)
+                self.flushed += len(batch)
+            except Exception:
+                log.exception(f"Failed to flush a batch of {len(batch)}")
+
+class RateLimitedQueue(object):
+    """
+    Runs queued coroutine functions one at a time, no faster than its
+    token bucket allows. `len()` is the backlog still waiting to run.
+    """
+
+    def __init__(self, name: str, bucket: TokenBucket):
+        self.name = name
+        self.bucket = bucket
+        self.pending = collections.deque()
+        self.task = None
+        self.done = 0
+        self.failed = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def put(self, job):
+        self.pending.append(job)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self.pending:
+            wait = self.bucket.take()
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+
+            job = self.pending.popleft()
+            try:
+                await job()
+                self.done += 1
+            except Exception as e:
+                self.failed += 1
+                log.warning(f"{self.name} job failed: {e!r}")
+
+    async def join(self):
+        """
+        Waits until every queued job has run.
+        """
+        while self.task is not None and not self.task.done():
+            await asyncio.shield(self.task)
+
+    def stats(self):
+        return {"backlog": len(self.pending), "done": self.done, "failed": self.failed}
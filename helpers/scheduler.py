@@ -0,0 +1,253 @@
+"""
+Persistent job scheduler shared by every cog.
+
+Recurring jobs follow a Cron schedule and one-shot jobs fire once at a set
+time. Upcoming fire times live in a heap, and the scheduler sleeps until the
+earliest one instead of polling. Every fire time is persisted in the
+scheduled_job table and claimed there before its callback runs, so a slot
+fires once even across restarts, and slots missed while the bot was down
+are caught up on startup.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging as log
+import time
+from datetime import datetime, timedelta, timezone
+
+from helpers.db_manager import JobModel
+
+class Cron(object):
+    """
+    Fires at the given UTC minutes past the given hours, optionally
+    only on some weekdays (0 is Monday). Hours default to every hour.
+    """
+
+    def __init__(self, minutes=(0,), hours=None, weekdays=None):
+        self.minutes = sorted(minutes)
+        self.hours = sorted(hours) if hours is not None else list(range(24))
+        self.weekdays = set(weekdays) if weekdays is not None else None
+
+    def next_after(self, ts: float):
+        start = datetime.fromtimestamp(ts, timezone.utc)
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        for _ in range(8):
+            if self.weekdays is None or day.weekday() in self.weekdays:
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        fire = day + timedelta(hours=hour, minutes=minute)
+                        if fire > start:
+                            return fire.timestamp()
+            day += timedelta(days=1)
+        raise ValueError("Cron schedule never fires")
+
+class Interval(object):
+    """
+    Fires every `seconds` seconds.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def next_after(self, ts: float):
+        return ts + self.seconds
+
+class Job(object):
+    def __init__(self, name: str, callback, schedule=None, grace: float = None,
+        handler: str = None, payload=None, fire_at: float = None):
+        self.name = name
+        self.callback = callback
+        self.schedule = schedule
+        self.grace = grace
+        self.handler = handler
+        self.payload = payload
+        self.fire_at = fire_at
+
+class TimerHeap(object):
+    """
+    Min-heap of (fire_at, key) entries with a task that sleeps until the
+    earliest one is due and awaits `on_due(key, fire_at)` for it. Entries
+    can't be removed, so `on_due` must ignore ones that went stale. Whether
+    an entry is due is always decided by `clock`, and run_due lets a fake
+    clock fire entries without the task.
+    """
+
+    def __init__(self, on_due, clock=time.time):
+        self.on_due = on_due
+        self.clock = clock
+        self.heap = []
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def is_running(self):
+        return self.task is not None and not self.task.done()
+
+    def push(self, fire_at: float, key):
+        heapq.heappush(self.heap, (fire_at, next(self.counter), key))
+        self.wakeup.set()
+
+    def load(self, entries):
+        """
+        Bulk-adds (fire_at, key) entries in linear time.
+        """
+        self.heap.extend((fire_at, next(self.counter), key) for fire_at, key in entries)
+        heapq.heapify(self.heap)
+        self.wakeup.set()
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def run_due(self):
+        """
+        Handles every entry due by the clock, returning how many there were.
+        """
+        handled = 0
+        while self.heap and self.heap[0][0] <= self.clock():
+            fire_at, _, key = heapq.heappop(self.heap)
+            handled += 1
+            try:
+                await self.on_due(key, fire_at)
+            except Exception:
+                log.exception(f"Timer {key} failed")
+        return handled
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            await self.run_due()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+
+            delay = self.heap[0][0] - self.clock()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+class Scheduler(object):
+    def __init__(self, clock=time.time):
+        # Injectable so tests can drive time
+        self.clock = clock
+        self.jobs = {}
+        self.handlers = {}
+        self.counter = itertools.count()
+        self.timers = TimerHeap(self._on_due, self.clock)
+
+    def is_running(self):
+        return self.timers.is_running()
+
+    def add_cron(self, name: str, schedule, callback, grace: float = None):
+        """
+        Registers a recurring job. `callback` is a coroutine function taking
+        no arguments. Slots missed by more than `grace` seconds are skipped.
+        """
+        job = Job(name, callback, schedule=schedule, grace=grace)
+        self.jobs[name] = job
+        if self.is_running():
+            asyncio.create_task(self._register(job))
+
+    def add_handler(self, handler: str, callback):
+        """
+        Registers a coroutine function, taking the job's payload, that runs
+        one-shot jobs created with schedule_once(handler, ...).
+        """
+        self.handlers[handler] = callback
+
+    async def schedule_once(self, handler: str, fire_at: float, payload=None):
+        """
+        Persists a one-shot job and returns its name.
+        """
+        name = f"{handler}:{time.time_ns()}:{next(self.counter)}"
+        await JobModel.aio.add(name, handler, json.dumps(payload), fire_at)
+        self._push(Job(name, None, handler=handler, payload=payload, fire_at=fire_at))
+        return name
+
+    async def cancel(self, name: str):
+        job = self.jobs.pop(name, None)
+        await JobModel.aio.delete(name)
+        return job is not None
+
+    def start(self):
+        asyncio.create_task(self.load())
+        self.timers.start()
+
+    async def load(self):
+        """
+        Registers recurring jobs and reloads pending one-shot jobs, without
+        starting the timer task. start() calls it.
+        """
+        for job in list(self.jobs.values()):
+            if job.schedule is not None:
+                await self._register(job)
+
+        for model in await JobModel.aio.get_one_shot():
+            self._push(Job(model.name, None, handler=model.handler,
+                payload=json.loads(model.payload), fire_at=model.next_fire))
+
+    async def run_due(self):
+        """
+        Fires every job due by the clock, returning how many were handled.
+        The timer task does this itself, tests call it after moving a fake
+        clock.
+        """
+        return await self.timers.run_due()
+
+    async def _register(self, job: Job):
+        fire_at = job.schedule.next_after(self.clock())
+        job.fire_at = await JobModel.aio.get_or_add(job.name, fire_at)
+        self._push(job)
+
+    def _push(self, job: Job):
+        self.jobs[job.name] = job
+        self.timers.push(job.fire_at, job.name)
+
+    async def _on_due(self, name: str, fire_at: float):
+        job = self.jobs.get(name)
+        if job is None or job.fire_at != fire_at:
+            # Cancelled or rescheduled since it was pushed
+            return
+        await self._fire(job)
+
+    async def _fire(self, job: Job):
+        now = self.clock()
+        if job.schedule is not None:
+            next_fire = job.schedule.next_after(max(now, job.fire_at))
+        else:
+            next_fire = None
+
+        # Claiming the slot in the database first keeps it from firing twice
+        claimed = await JobModel.aio.claim(job.name, job.fire_at, next_fire)
+        missed = job.grace is not None and now - job.fire_at > job.grace
+
+        if next_fire is None:
+            del self.jobs[job.name]
+        else:
+            job.fire_at = next_fire
+            self._push(job)
+
+        if not claimed or missed:
+            return
+
+        if job.handler is not None:
+            handler = self.handlers.get(job.handler)
+            if handler is None:
+                log.error(f"No handler registered for job {job.name}")
+                return
+            coro = handler(job.payload)
+        else:
+            coro = job.callback()
+        asyncio.create_task(self._run_callback(job.name, coro))
+
+    async def _run_callback(self, name: str, coro):
+        try:
+            await coro
+        except Exception:
+            log.exception(f"Scheduled job {name} failed")
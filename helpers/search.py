@@ -0,0 +1,58 @@
+"""
+Fuzzy matching on top of the FTS5 trigram indexes.
+
+Rows containing the query are returned as they are. Only when there are
+none, the query's rarest trigrams are looked up and any row sharing one is a
+candidate, ordered by bm25. Common trigrams are left out because they match
+most of the table, which bm25 would then have to order. Candidates are
+scored by the share of the query's trigrams they contain and weak matches
+are dropped.
+"""
+
+# FTS5's trigram tokenizer can't match anything shorter
+MIN_QUERY = 3
+# Candidates taken from the index before scoring
+CANDIDATES = 50
+# Lowest score a fuzzy match needs to be returned
+MIN_SCORE = 0.4
+# Rarest query trigrams fuzzy matching looks for
+FUZZY_TERMS = 4
+
+def trigrams(text: str):
+    text = " ".join(text.lower().split())
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def quote(text: str):
+    """
+    Quotes text as an FTS5 string, which with trigrams matches it as a
+    substring.
+    """
+    return '"' + text.replace('"', '""') + '"'
+
+def fuzzy_query(text: str, counts):
+    """
+    Builds an FTS5 query matching rows that share any of text's FUZZY_TERMS
+    rarest trigrams, or None if no row has any. `counts` maps trigrams to
+    how many rows contain them.
+    """
+    terms = sorted((x for x in trigrams(text) if x in counts), key=lambda x: (counts[x], x))
+    if not terms:
+        return None
+    return " OR ".join(quote(x) for x in terms[:FUZZY_TERMS])
+
+def score(query: str, text: str):
+    if query.lower() in text.lower():
+        return 1.0
+    wanted = trigrams(query)
+    if not wanted:
+        return 0.0
+    return len(wanted & trigrams(text)) / len(wanted)
+
+def rank(query: str, rows, key, limit: int):
+    """
+    Orders rows by how well `key(row)` matches query, dropping weak matches.
+    Rows should already be in bm25 order, which breaks ties.
+    """
+    scored = [(score(query, key(row)), i, row) for i, row in enumerate(rows)]
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    return [row for s, _, row in scored if s >= MIN_SCORE][:limit]
@@ -0,0 +1,58 @@
+"""
+In-memory registry of members with an open DM conversation with the bot.
+
+Rebuilt from the database at startup and kept current by the models, so
+on_message can route a direct message with dict lookups alone.
+"""
+
+class SessionRegistry(object):
+    def __init__(self):
+        # member_id -> rowid of their active ARCdle game
+        self.games = {}
+        self.game_members = {}
+        # member_id -> guild_ids where they haven't verified yet
+        self.unverified = {}
+
+    def load(self, games, unverified):
+        """
+        Rebuilds from (member_id, arcdle_rowid) and (member_id, guild_id) rows.
+        """
+        self.games = dict(games)
+        self.game_members = {rowid: member_id for member_id, rowid in self.games.items()}
+        self.unverified = {}
+        for member_id, guild_id in unverified:
+            self.unverified.setdefault(member_id, set()).add(guild_id)
+
+    def get_game(self, member_id: int):
+        return self.games.get(member_id)
+
+    def start_game(self, member_id: int, rowid: int):
+        self.games[member_id] = rowid
+        self.game_members[rowid] = member_id
+
+    def end_game(self, rowid: int):
+        member_id = self.game_members.pop(rowid, None)
+        if member_id is not None and self.games.get(member_id) == rowid:
+            del self.games[member_id]
+
+    def clear_games(self):
+        self.games = {}
+        self.game_members = {}
+
+    def is_verifying(self, member_id: int):
+        return member_id in self.unverified
+
+    def get_unverified(self, member_id: int):
+        return self.unverified.get(member_id, set())
+
+    def set_verified(self, member_id: int, guild_id: int, verified: int):
+        if verified:
+            guilds = self.unverified.get(member_id)
+            if guilds is not None:
+                guilds.discard(guild_id)
+                if not guilds:
+                    del self.unverified[member_id]
+        else:
+            self.unverified.setdefault(member_id, set()).add(guild_id)
+
+sessions = SessionRegistry()
@@ -0,0 +1,45 @@
+"""
+Runs the tests against a throwaway database. db_manager reads config.json
+from the working directory when it's imported and connects lazily, so the
+session moves into a temporary directory with its own config first and
+never touches the bot's database.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_DB = os.path.join(ROOT, "bot.db")
+
+sys.path.insert(0, ROOT)
+workdir = tempfile.mkdtemp(prefix="arc_assistant_tests_")
+with open(os.path.join(workdir, "config.json"), "w") as f:
+    json.dump({"db": os.path.join(workdir, "bot.db"), "owners": []}, f)
+os.chdir(workdir)
+
+def pytest_unconfigure(config):
+    os.chdir(ROOT)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+@pytest.fixture
+def bot_db_copy(tmp_path):
+    """
+    Path to a copy of the repo's bot.db.
+    """
+    path = tmp_path / "bot.db"
+    shutil.copyfile(BOT_DB, path)
+    return str(path)
+
+@pytest.fixture(scope="session")
+def db():
+    """
+    The session's migrated database, used through the models.
+    """
+    from helpers import db_manager
+    db_manager.init_db()
+    return db_manager
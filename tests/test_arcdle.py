@@ -0,0 +1,57 @@
+import datetime
+
+import pytest
+
+from helpers import arcdle
+
+SOLUTIONS = ["crane", "slate", "trace"]
+
+def test_guesses_must_be_listed():
+    index = arcdle.WordIndex(SOLUTIONS, ["zesty"])
+    assert index.is_allowed("crane")
+    assert index.is_allowed("zesty")
+    assert not index.is_allowed("zzzzz")
+    assert not index.is_allowed("cran")
+
+def test_any_word_without_guess_list():
+    index = arcdle.WordIndex(SOLUTIONS)
+    assert index.is_allowed("zzzzz")
+    assert not index.is_allowed("zzzz")
+
+def test_shipped_guess_list_is_loaded():
+    assert arcdle.words.strict
+    assert arcdle.words.is_allowed("crane")
+    assert not arcdle.words.is_allowed("zzzzz")
+
+def test_solution_cycles_through_every_word():
+    index = arcdle.WordIndex(SOLUTIONS)
+    days = [index.solution(arcdle.EPOCH + datetime.timedelta(days=n)) for n in range(6)]
+    assert days[:3] == SOLUTIONS
+    assert days[3:] == days[:3]
+
+def test_appending_words_keeps_earlier_days():
+    day = arcdle.EPOCH + datetime.timedelta(days=2)
+    before = arcdle.WordIndex(SOLUTIONS).solution(day)
+    assert arcdle.WordIndex(SOLUTIONS + ["zesty"]).solution(day) == before
+
+def test_score_counts_repeated_letters_once():
+    pattern = arcdle.score("eerie", "crane")
+    assert arcdle.digits(pattern) == [arcdle.GRAY, arcdle.GRAY, arcdle.YELLOW,
+        arcdle.GRAY, arcdle.GREEN]
+    assert arcdle.score("crane", "crane") == arcdle.SOLVED
+
+def test_solver_splits_known_patterns():
+    pytest.importorskip("numpy")
+    from helpers.arcdle_solver import Solver
+
+    # Each of these only tells the other three apart by its first letter,
+    # which "bfhmz" tests all at once
+    trap = ["bills", "fills", "hills", "mills"]
+    solver = Solver(arcdle.WordIndex(trap, ["bfhmz"]))
+    for solution in trap:
+        assert solver.pattern("bfhmz", solution) == arcdle.score("bfhmz", solution)
+        guess, bits, remaining = solver.hint([], solution)
+        assert (guess, bits, remaining) == ("bfhmz", 2.0, 4)
+        # Its feedback leaves only the solution, which is then guessed
+        assert solver.hint(["bfhmz"], solution) == (solution, 0.0, 1)
+        assert solver.difficulty(solution) == ("Easy", 2)
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+
+from helpers import calendar_util
+from helpers.benchmarks import StubCalendarService, stub_event
+from helpers.db_manager import CalendarEventModel
+
+HOUR = 3600
+
+@pytest.fixture
+def stub(db, monkeypatch):
+    """
+    A stand-in Calendar API the calendar helpers talk to instead of Google.
+    Its requests answer from memory, so they need no connection.
+    """
+    service = StubCalendarService(page_size=2)
+    monkeypatch.setattr(calendar_util, "_service", (service, lambda: None))
+    return service
+
+def events_between(calendar_ids, start, end):
+    return [x["summary"] for x in
+        CalendarEventModel.get_range(calendar_ids, start, end)]
+
+def sync(calendar_id):
+    tokens = CalendarEventModel.get_sync_tokens()
+    asyncio.run(calendar_util.sync_calendar(calendar_id, tokens.get(calendar_id)))
+
+def test_full_sync_pages_through_events(stub):
+    now = time.time()
+    stub.add_calendar("full", [
+        stub_event("full", 0, now - 3 * calendar_util.DAY),
+        *(stub_event("full", n, now + n * HOUR) for n in range(1, 6)),
+    ])
+
+    sync("full")
+    assert stub.requests == 3
+    assert events_between(["full"], now - 7 * calendar_util.DAY, now + calendar_util.DAY) \
+        == [f"Meeting {n}" for n in range(1, 6)]
+    assert CalendarEventModel.get_sync_tokens()["full"] == str(stub.version)
+
+def test_incremental_sync_applies_changes(stub):
+    now = time.time()
+    stub.add_calendar("incremental", [stub_event("incremental", n, now + n * HOUR)
+        for n in range(1, 4)])
+    sync("incremental")
+
+    stub.put_event("incremental", stub_event("incremental", 4, now + 4 * HOUR))
+    stub.cancel_event("incremental", "incremental-2")
+    moved = stub_event("incremental", 3, now + 10 * HOUR)
+    moved["summary"] = "Moved"
+    stub.put_event("incremental", moved)
+    requests = stub.requests
+
+    sync("incremental")
+    assert stub.requests == requests + 2
+    assert events_between(["incremental"], now, now + calendar_util.DAY) \
+        == ["Meeting 1", "Meeting 4", "Moved"]
+
+def test_expired_token_resyncs_everything(stub):
+    now = time.time()
+    stub.add_calendar("expired", [stub_event("expired", n, now + n * HOUR)
+        for n in range(1, 4)])
+    sync("expired")
+
+    # Dropped without a cancellation the client could see
+    del stub.events_by_calendar["expired"]["expired-1"]
+    stub.put_event("expired", stub_event("expired", 4, now + 4 * HOUR))
+    stub.expire_tokens()
+
+    sync("expired")
+    assert events_between(["expired"], now, now + calendar_util.DAY) \
+        == ["Meeting 2", "Meeting 3", "Meeting 4"]
+    assert CalendarEventModel.get_sync_tokens()["expired"] == str(stub.version)
+
+def test_get_range_filters_by_calendar_and_overlap(stub):
+    now = time.time()
+    stub.add_calendar("range_a", [
+        stub_event("range_a", 1, now - HOUR, length=2 * HOUR),
+        stub_event("range_a", 2, now + 5 * HOUR),
+        stub_event("range_a", 3, now + 2 * calendar_util.DAY),
+    ])
+    stub.add_calendar("range_b", [stub_event("range_b", 4, now + 2 * HOUR)])
+    stub.add_calendar("range_c", [stub_event("range_c", 5, now + 3 * HOUR)])
+    asyncio.run(calendar_util.sync_calendars(["range_a", "range_b", "range_c", "missing"]))
+
+    tokens = CalendarEventModel.get_sync_tokens()
+    assert "missing" not in tokens
+    assert events_between(["range_a", "range_b"], now, now + calendar_util.DAY) \
+        == ["Meeting 1", "Meeting 4", "Meeting 2"]
+    assert events_between(["range_c"], now + 4 * HOUR, now + calendar_util.DAY) == []
+    assert events_between([], now, now + calendar_util.DAY) == []
+
+def test_calendar_meta_of_unknown_calendar(stub):
+    stub.add_calendar("meta")
+    assert asyncio.run(calendar_util.get_calendar_meta("meta")) \
+        == ("Calendar meta", "America/Indiana/Indianapolis")
+    assert asyncio.run(calendar_util.get_calendar_meta("missing")) is None
@@ -0,0 +1,65 @@
+from helpers.codes import ATTEMPTS, CODE_TTL, REFILL_RATE, CodeStore
+
+START = 1_700_000_000.0
+MEMBER = 1
+GUILD = 10
+
+class FakeClock(object):
+    def __init__(self, now: float = START):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_code_expires():
+    clock = FakeClock()
+    codes = CodeStore(clock)
+    code = codes.issue(MEMBER, GUILD)
+    assert codes.has_code(MEMBER, GUILD)
+    assert not codes.has_code(MEMBER, GUILD + 1)
+
+    clock.now += CODE_TTL
+    assert not codes.has_code(MEMBER, GUILD)
+    assert not codes.check(MEMBER, GUILD, code)
+
+def test_code_is_used_up():
+    codes = CodeStore(FakeClock())
+    code = codes.issue(MEMBER, GUILD)
+    assert not codes.check(MEMBER, GUILD, code + 1)
+    assert codes.check(MEMBER, GUILD, code)
+    assert not codes.check(MEMBER, GUILD, code)
+
+def test_attempts_run_out_and_refill():
+    clock = FakeClock()
+    codes = CodeStore(clock)
+    for _ in range(ATTEMPTS):
+        assert codes.take_attempt(MEMBER) == 0
+    wait = codes.take_attempt(MEMBER)
+    assert wait == 1 / REFILL_RATE
+    # Issuing a new code doesn't reset the budget
+    codes.issue(MEMBER, GUILD)
+    assert codes.take_attempt(MEMBER) == wait
+
+    clock.now += wait
+    assert codes.take_attempt(MEMBER) == 0
+    assert codes.take_attempt(MEMBER) > 0
+
+def test_expired_entries_are_dropped_and_reloaded():
+    clock = FakeClock()
+    codes = CodeStore(clock)
+    codes.issue(MEMBER, GUILD)
+    codes.take_attempt(MEMBER)
+    codes.take_attempt(MEMBER + 1)
+
+    # A restart keeps each member's code and spent attempts
+    reloaded = CodeStore(clock)
+    # Rows end with the expiry time, which is only stored for cleanup
+    reloaded.load([codes.row(MEMBER)[:-1], codes.row(MEMBER + 1)[:-1]])
+    assert reloaded.has_code(MEMBER, GUILD)
+    assert reloaded.row(MEMBER) == codes.row(MEMBER)
+
+    # Once the code has expired and the budget refilled, nothing is kept
+    clock.now += max(CODE_TTL, 1 / REFILL_RATE)
+    assert reloaded.row(MEMBER) is None
+    reloaded.take_attempt(MEMBER + 2)
+    assert MEMBER not in reloaded.entries and MEMBER + 1 not in reloaded.entries
@@ -0,0 +1,55 @@
+import asyncio
+import random
+
+from helpers.leaderboard import leaderboard
+
+# Accounts used only by this test, so other tests' balances don't count
+MEMBERS = range(5000, 5020)
+START_BALANCE = 10.0
+TRANSFERS = 5000
+
+def test_concurrent_transfers_conserve_supply(db):
+    CurrencyModel = db.CurrencyModel
+    rand = random.Random(4)
+
+    async def run():
+        for member_id in MEMBERS:
+            await CurrencyModel.aio.credit(member_id, START_BALANCE, "test")
+        return await asyncio.gather(*(
+            CurrencyModel.aio.transfer(*rand.sample(MEMBERS, 2),
+                float(rand.randint(1, 8)), "test")
+            for _ in range(TRANSFERS)
+        ))
+
+    results = asyncio.run(run())
+    assert any(results) and not all(results)
+
+    balances = [CurrencyModel.get_balance_or_create(x) for x in MEMBERS]
+    assert sum(balances) == START_BALANCE * len(MEMBERS)
+    assert min(balances) >= 0
+    for member_id, balance in zip(MEMBERS, balances):
+        assert db.LedgerModel.get_balance(member_id) == balance
+        assert leaderboard.balances[member_id] == balance
+
+def test_bounties_are_per_guild(db):
+    BountyModel = db.BountyModel
+    CurrencyModel = db.CurrencyModel
+    owner, helper = 6000, 6001
+    CurrencyModel.credit(owner, 20.0, "test")
+    CurrencyModel.credit(helper, 5.0, "test")
+
+    first = BountyModel.create("Fix CI", owner, 50, 1, 5.0)
+    second = BountyModel.create("fix ci", owner, 51, 1, 5.0)
+    assert first.id != second.id
+    assert BountyModel.create("FIX CI", owner, 50, 1, 5.0) is BountyModel.TAKEN
+    assert BountyModel.get(51, "Fix CI").id == second.id
+    assert BountyModel.resolve(50, "fix").id == first.id
+    assert BountyModel.resolve(52, "fix") is None
+
+    assert first.contribute(helper, 4.0)
+    assert first.amt == 9.0
+    assert first.contribute(helper, 4.0) is False
+    first.pay_out(helper)
+    assert first.contribute(owner, 1.0) is None
+    assert CurrencyModel.get_balance_or_create(helper) == 10.0
+    assert CurrencyModel.get_balance_or_create(owner) == 10.0
@@ -0,0 +1,39 @@
+from helpers.leaderboard import LeaderboardIndex, leaderboard
+
+GUILD = 70
+
+def test_ties_rank_by_member_id():
+    index = LeaderboardIndex()
+    index.load([(3, GUILD, 5.0), (1, GUILD, 5.0), (2, GUILD, 9.0), (4, GUILD, None)])
+    assert index.top(GUILD) == [(2, 9.0), (1, 5.0), (3, 5.0)]
+    assert index.rank(GUILD, 3) == (3, 5.0, 3)
+    # Members without an account aren't ranked
+    assert index.rank(GUILD, 4) is None
+
+def test_updates_move_members_in_every_guild():
+    index = LeaderboardIndex()
+    index.load([(1, GUILD, 1.0), (1, GUILD + 1, 1.0), (2, GUILD, 2.0)])
+    index.update(1, 3.0)
+    assert index.top(GUILD) == [(1, 3.0), (2, 2.0)]
+    assert index.top(GUILD + 1) == [(1, 3.0)]
+
+    index.add_member(2, GUILD + 1)
+    index.update(2, 3.0)
+    assert index.rank(GUILD + 1, 2) == (2, 3.0, 2)
+    assert index.rank(GUILD + 2, 2) is None
+
+def test_rank_after_set(db):
+    MemberModel = db.MemberModel
+    CurrencyModel = db.CurrencyModel
+    members = range(7000, 7004)
+    for member_id in members:
+        MemberModel.get_or_create(member_id, GUILD)
+        CurrencyModel.update_balance(member_id, 10.0)
+    assert leaderboard.rank(GUILD, 7003) == (4, 10.0, 4)
+
+    # As `.set` does
+    CurrencyModel.update_balance(7003, 50.0)
+    CurrencyModel.update_balance(7000, 1.0)
+    assert leaderboard.top(GUILD, 2) == [(7003, 50.0), (7001, 10.0)]
+    assert leaderboard.rank(GUILD, 7003) == (1, 50.0, 4)
+    assert leaderboard.rank(GUILD, 7000) == (4, 1.0, 4)
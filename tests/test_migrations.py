@@ -0,0 +1,102 @@
+import re
+import sqlite3
+
+import pytest
+
+from helpers import migrations
+
+# Tables every model lookup has to reach through an index
+INDEXED_TABLES = ("member", "rolemenu", "calendar", "bounty", "arcdle")
+FULL_SCAN = re.compile(r"^SCAN ({})\b".format("|".join(INDEXED_TABLES)))
+
+def user_version(con: sqlite3.Connection):
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+def test_migrates_empty_db(tmp_path):
+    con = sqlite3.connect(tmp_path / "empty.db")
+    migrations.migrate(con)
+    assert user_version(con) == len(migrations.MIGRATIONS)
+
+def test_migrates_bot_db(bot_db_copy):
+    con = sqlite3.connect(bot_db_copy)
+    migrations.migrate(con)
+    assert user_version(con) == len(migrations.MIGRATIONS)
+    assert con.execute(
+        "SELECT COUNT(*) FROM (SELECT 1 FROM member GROUP BY member_id, guild_id " \
+        "HAVING COUNT(*) > 1)"
+    ).fetchone()[0] == 0
+
+@pytest.mark.parametrize("fresh", [True, False])
+def test_current_schema_runs_no_ddl(tmp_path, bot_db_copy, fresh):
+    con = sqlite3.connect(tmp_path / "empty.db" if fresh else bot_db_copy)
+    migrations.migrate(con)
+
+    statements = []
+    con.set_trace_callback(statements.append)
+    migrations.migrate(con)
+    assert statements == ["PRAGMA user_version"]
+
+def lookups(db):
+    """
+    Calls every model method that finds rows by key.
+    """
+    MemberModel = db.MemberModel
+    member = MemberModel.get_or_create(1, 10)
+    MemberModel.add_many([(1, 10), (2, 10)])
+    MemberModel.get_all(1)
+    MemberModel.get_pending(1)
+    member.update_verified(1)
+
+    db.CurrencyModel.credit(1, 50.0, "test")
+    db.CurrencyModel.debit(1, 5.0, "test")
+    db.CurrencyModel.transfer(1, 2, 5.0, "test")
+    db.CurrencyModel.get_balance_or_create(1)
+
+    game = db.ARCdleModel.create_game(1, 10, 20, 30)
+    db.ARCdleModel.get(game.rowid)
+    db.ARCdleModel.get_member_active_game(1)
+    db.ARCdleModel.get_member_recent_game(1)
+    db.ARCdleModel.get_active_sessions()
+    game.get_origin()
+    game.update("", "", 1, "")
+
+    db.RoleMenuModel.add_option(40, 10, 50, "Role", "👍", 20)
+    db.RoleMenuModel.set_channel(40, 20)
+    db.RoleMenuModel.delete_menu(40, 10)
+
+    db.CalendarModel.add(10, 20, "calendar")
+    db.CalendarModel.get_by_guild(10)
+    db.CalendarModel.get_by_channel(10, 20)
+    calendar = db.CalendarModel.get(10, 20, "calendar")
+    db.CalendarModel.get_meta("calendar")
+    calendar.remove()
+
+    bounty = db.BountyModel.create("Review PR", 1, 10, 20, 5.0)
+    bounty.set_message(60)
+    db.BountyModel.get(10, "review pr")
+    db.BountyModel.resolve(10, "Review")
+    bounty.contribute(2, 1.0)
+    db.BountyModel.get_by_guild(10)
+    bounty.add_claim(2, 70)
+    db.BountyModel.get_claim(70)
+    bounty.pay_out(2)
+    db.BountyModel.create("Other PR", 1, 10, 20, 5.0).cancel()
+
+def test_lookups_use_indexes(db):
+    con = db.open_db()
+    statements = []
+    con.set_trace_callback(statements.append)
+    try:
+        lookups(db)
+    finally:
+        con.set_trace_callback(None)
+
+    plans = sqlite3.connect(db.config["db"])
+    scans = []
+    for statement in statements:
+        if not re.match(r"\s*(SELECT|UPDATE|DELETE|INSERT|WITH)", statement, re.I):
+            continue
+        for row in plans.execute("EXPLAIN QUERY PLAN " + statement):
+            if FULL_SCAN.match(row[3]):
+                scans.append((row[3], " ".join(statement.split())))
+    assert scans == []
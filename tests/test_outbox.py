@@ -0,0 +1,148 @@
+import asyncio
+import base64
+import socketserver
+import threading
+import time
+from email.message import EmailMessage
+
+import pytest
+
+from helpers.outbox import BACKOFF, LEASE, Outbox, SMTPPool
+
+USER = "bot"
+PASSWORD = "hunter2"
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """
+    Speaks just enough SMTP for smtplib: EHLO, AUTH PLAIN, MAIL, RCPT, DATA,
+    RSET, NOOP and QUIT. Recipients in the server's `rejected` get a 550 and
+    those in `deferred` a 451.
+    """
+
+    def reply(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 stand-in ESMTP")
+        recipients = []
+        for raw in self.rfile:
+            line = raw.decode().rstrip("\r\n")
+            verb = line.split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                self.reply("250-stand-in")
+                self.reply("250 AUTH PLAIN")
+            elif verb == "AUTH":
+                _, user, password = base64.b64decode(line.split()[2]).split(b"\0")
+                if (user.decode(), password.decode()) == (USER, PASSWORD):
+                    self.reply("235 Authenticated")
+                else:
+                    self.reply("535 Bad credentials")
+            elif verb == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                address = line[line.index("<") + 1:line.index(">")]
+                if address in server.rejected:
+                    self.reply("550 No such user")
+                elif address in server.deferred:
+                    self.reply("451 Try again later")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                for data in self.rfile:
+                    if data == b".\r\n":
+                        break
+                server.delivered.extend(recipients)
+                self.reply("250 Queued")
+            elif verb in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPHandler)
+        self.connections = 0
+        self.delivered = []
+        self.rejected = set()
+        self.deferred = set()
+
+@pytest.fixture
+def smtp_server():
+    server = SMTPServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def make_pool(server, size: int = 1):
+    host, port = server.server_address
+    return SMTPPool(host, port, USER, PASSWORD, size=size, tls=False)
+
+def message(recipient: str):
+    message = EmailMessage()
+    message.set_content("Your code is 123456")
+    message["Subject"] = "Verification"
+    message["From"] = "bot@example.com"
+    message["To"] = recipient
+    return message
+
+def test_pool_reuses_sessions(smtp_server):
+    pool = make_pool(smtp_server)
+    try:
+        assert pool.send_all([message("a@example.com"), message("b@example.com")]) \
+            == [None, None]
+        assert pool.send_all([message("c@example.com")]) == [None]
+    finally:
+        pool.close()
+    assert smtp_server.connections == 1
+    assert smtp_server.delivered == ["a@example.com", "b@example.com", "c@example.com"]
+
+def test_outbox_reports_each_status(db, smtp_server):
+    smtp_server.rejected.add("gone@example.com")
+    smtp_server.deferred.add("busy@example.com")
+    now = [0.0]
+    statuses = []
+
+    async def on_status(model, status):
+        statuses.append((model.recipient, status))
+
+    async def deliver_due():
+        batch = await db.OutboxModel.aio.claim(now[0], LEASE, 30)
+        await outbox.deliver(batch)
+
+    async def run():
+        for recipient in ("ok@example.com", "gone@example.com", "busy@example.com"):
+            await outbox.send(recipient, "Verification", "Your code is 123456", 1)
+        now[0] = time.time()
+        await deliver_due()
+
+        smtp_server.deferred.clear()
+        now[0] += BACKOFF
+        await deliver_due()
+
+    outbox = Outbox(make_pool(smtp_server, size=2), "bot@example.com", on_status,
+        clock=lambda: now[0])
+    try:
+        asyncio.run(run())
+    finally:
+        outbox.close()
+
+    assert sorted(statuses[:3]) == [
+        ("busy@example.com", Outbox.RETRYING),
+        ("gone@example.com", Outbox.FAILED),
+        ("ok@example.com", Outbox.SENT),
+    ]
+    assert statuses[3:] == [("busy@example.com", Outbox.SENT)]
+    assert smtp_server.delivered == ["ok@example.com", "busy@example.com"]
+    assert db.OutboxModel.get_next_attempt() is None
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from helpers.scheduler import TimerHeap
+
+START = 1_700_000_000.0
+CHANNEL = 40
+
+class FakeClock(object):
+    def __init__(self, now: float = START):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class FakeChannel(object):
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content: str):
+        self.sent.append(content)
+
+class FakeBot(object):
+    def __init__(self, channel: FakeChannel):
+        self.channel = channel
+
+    def get_channel(self, id: int):
+        return self.channel
+
+@pytest.fixture
+def remind():
+    pytest.importorskip("disnake")
+    pytest.importorskip("dateparser")
+    from cogs.general import remind
+    return remind
+
+def test_interval_round_trip(remind):
+    for text, shown in (("1 week", "week"), ("2 weeks", "2 weeks"), ("36 hours", "36 hours"),
+        ("1.5 hours", "90 minutes"), ("1 day", "day")):
+        assert remind.format_interval(remind.parse_interval(text)) == shown
+
+def test_reminders_fire_repeat_and_cancel(db, remind):
+    ReminderModel = db.ReminderModel
+    clock = FakeClock()
+    channel = FakeChannel()
+    cog = remind.Remind(FakeBot(channel))
+    cog.timers = TimerHeap(cog.fire, clock)
+
+    async def run():
+        once = await ReminderModel.aio.create(CHANNEL, 1, [1], "once", START + 10)
+        weekly = await ReminderModel.aio.create(CHANNEL, 1, [1, 2], "weekly",
+            START + 20, 604800)
+        cancelled = await ReminderModel.aio.create(CHANNEL, 1, [1], "cancelled", START + 30)
+        for reminder in (once, weekly, cancelled):
+            cog.timers.push(reminder.due, reminder.id)
+        assert await ReminderModel.aio.delete(cancelled.id, 1)
+
+        clock.now += 60
+        await cog.timers.run_due()
+        assert channel.sent == ["<@1> once", "<@1>, <@2> weekly"]
+
+        # A week late, the weekly reminder fires once and moves to its next week
+        clock.now += 2 * 604800
+        await cog.timers.run_due()
+        assert channel.sent[2:] == ["<@1>, <@2> weekly"]
+        schedule = dict((id, due) for due, id in await ReminderModel.aio.get_schedule())
+        assert once.id not in schedule and cancelled.id not in schedule
+        assert schedule[weekly.id] == START + 20 + 3 * 604800
+
+        # Cancelled between occurrences, it doesn't fire again
+        assert await ReminderModel.aio.delete(weekly.id, 1)
+        clock.now += 604800
+        await cog.timers.run_due()
+        assert len(channel.sent) == 3
+
+    asyncio.run(run())
+
+def test_schedule_loads_into_heap(db):
+    ReminderModel = db.ReminderModel
+    clock = FakeClock(START + 10 * 86400)
+    due = []
+
+    async def on_due(id, fire_at):
+        due.append(id)
+
+    async def run():
+        ids = [(await ReminderModel.aio.create(CHANNEL, 2, [2], "", clock.now + n)).id
+            for n in range(1, 6)]
+        timers = TimerHeap(on_due, clock)
+        timers.load(await ReminderModel.aio.get_schedule())
+        clock.now += 3
+        await timers.run_due()
+        assert [x for x in due if x in ids] == ids[:3]
+
+    asyncio.run(run())
@@ -0,0 +1,126 @@
+import asyncio
+from datetime import datetime, timezone
+
+from helpers.scheduler import Cron, Interval, Scheduler
+
+# Monday 2024-01-01 00:00 UTC
+START = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+HOUR = 3600
+DAY = 86400
+
+class FakeClock(object):
+    def __init__(self, now: float = START):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_cron_next_after():
+    cron = Cron(minutes=[30], hours=[5])
+    assert cron.next_after(START) == START + 5 * HOUR + 1800
+    # A slot isn't after itself
+    assert cron.next_after(START + 5 * HOUR + 1800) == START + DAY + 5 * HOUR + 1800
+
+    weekly = Cron(hours=[9], weekdays=[0])
+    assert weekly.next_after(START + 10 * HOUR) == START + 7 * DAY + 9 * HOUR
+
+def test_interval_next_after():
+    assert Interval(60).next_after(START) == START + 60
+
+def counter():
+    calls = []
+    async def callback():
+        calls.append(None)
+    return calls, callback
+
+async def fire(scheduler: Scheduler):
+    handled = await scheduler.run_due()
+    # Callbacks run in their own tasks
+    await asyncio.sleep(0)
+    return handled
+
+def test_missed_slots_past_grace_are_skipped(db):
+    clock = FakeClock()
+    calls, callback = counter()
+
+    async def run():
+        scheduler = Scheduler(clock)
+        scheduler.add_cron("test_grace", Interval(60), callback, grace=10)
+        await scheduler.load()
+
+        clock.now += 100
+        await fire(scheduler)
+        assert calls == []
+
+        clock.now += 60
+        await fire(scheduler)
+        assert len(calls) == 1
+
+    asyncio.run(run())
+
+def test_restart_fires_each_slot_once(db):
+    clock = FakeClock()
+    calls, callback = counter()
+
+    async def run():
+        first = Scheduler(clock)
+        first.add_cron("test_restart", Interval(60), callback)
+        await first.load()
+        clock.now += 60
+        assert await fire(first) == 1
+        assert len(calls) == 1
+
+        # Restarted at the same moment, the claimed slot doesn't fire again
+        second = Scheduler(clock)
+        second.add_cron("test_restart", Interval(60), callback)
+        await second.load()
+        assert await fire(second) == 0
+        assert len(calls) == 1
+
+        # Down for several slots, it catches up once rather than per slot
+        clock.now += 300
+        third = Scheduler(clock)
+        third.add_cron("test_restart", Interval(60), callback)
+        await third.load()
+        await fire(third)
+        assert len(calls) == 2
+        assert third.jobs["test_restart"].fire_at == clock.now + 60
+
+    asyncio.run(run())
+
+def test_two_processes_share_a_slot(db):
+    clock = FakeClock()
+    calls, callback = counter()
+
+    async def run():
+        schedulers = [Scheduler(clock), Scheduler(clock)]
+        for scheduler in schedulers:
+            scheduler.add_cron("test_shared", Cron(minutes=[0]), callback)
+            await scheduler.load()
+        clock.now += HOUR
+        for scheduler in schedulers:
+            await fire(scheduler)
+        assert len(calls) == 1
+
+    asyncio.run(run())
+
+def test_one_shot_survives_restart(db):
+    clock = FakeClock()
+    payloads = []
+
+    async def handler(payload):
+        payloads.append(payload)
+
+    async def run():
+        first = Scheduler(clock)
+        await first.schedule_once("test_once", clock.now + 30, {"id": 1})
+
+        second = Scheduler(clock)
+        second.add_handler("test_once", handler)
+        await second.load()
+        clock.now += 30
+        await fire(second)
+        await fire(second)
+        assert payloads == [{"id": 1}]
+
+    asyncio.run(run())
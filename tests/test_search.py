@@ -0,0 +1,33 @@
+ITEMS = [
+    "Migrate calendar reminders to slash commands",
+    "Add a leaderboard for ARCdle streaks",
+    "Fix verification emails landing in spam",
+]
+
+def test_backlog_search(db):
+    BacklogModel = db.BacklogModel
+    for item in ITEMS:
+        BacklogModel.add(item)
+
+    def search(query):
+        return [x.item for x in BacklogModel.search(query)]
+
+    assert search("leaderboard") == [ITEMS[1]]
+    # Swapped letters only match through shared trigrams
+    assert search("verifcaition emails") == [ITEMS[2]]
+    assert search("sl") == [ITEMS[0]]
+    assert search("quantum") == []
+
+    assert BacklogModel.find_and_remove("spam") == ITEMS[2]
+    assert BacklogModel.find_and_remove("spma") is None
+    assert search("verification") == []
+
+def test_bounty_search_stays_in_guild(db):
+    db.CurrencyModel.credit(3, 20.0, "test")
+    db.BountyModel.create("Review search ranking", 3, 30, 1, 5.0)
+    db.BountyModel.create("Review search tests", 3, 31, 1, 5.0)
+
+    assert [x.title for x in db.BountyModel.search(30, "search")] \
+        == ["Review search ranking"]
+    assert [x.title for x in db.BountyModel.search(31, "serach tests")] \
+        == ["Review search tests"]